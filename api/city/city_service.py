@@ -1,16 +1,23 @@
 """
 City service that gives access to city information
 """
-import pandas as pd
 import os
 
+from api.city.city_table import CityTable
+
 
 class CityService:
 
-    def __init__(self):
-        """Constructor"""
-        self.data_path = 'data'
-        self.data_file = 'simplemaps-worldcities-basic.csv'
+    def __init__(self, data_path='data', data_file='simplemaps-worldcities-basic.csv'):
+        """
+        Constructor
+
+        :param data_path: str: folder where the city CSV is
+        :param data_file: str: file name of the city CSV
+        """
+        self.data_path = data_path
+        self.data_file = data_file
+        self._city_table = None
 
     def get_city_coordinates(self):
         """
@@ -18,8 +25,30 @@ class CityService:
         
         :return: DataFrame
         """
+        import pandas as pd
+
         city_list = pd.read_csv(os.path.join(self.data_path, self.data_file))
         city_list = city_list.sort_values('lat', ascending=True)
         city_list = city_list.sort_values('lng', ascending=True)
         city_list = city_list.rename(columns={'lat': 'lat', 'lng': 'lon'})
         return city_list
+
+    def get_city_table(self):
+        """
+        This retrieves the compact, memory-mapped table of major cities. It's loaded once per service.
+
+        :return: CityTable
+        """
+        if self._city_table is None:
+            self._city_table = CityTable.load(self.data_path, self.data_file)
+        return self._city_table
+
+    def get_city(self, city_name, order=CityTable.ORDER_POPULATION):
+        """
+        This finds the most populated city with the given name
+
+        :param city_name: str
+        :param order: str: which city is picked among those with the name, see `CityTable.find`
+        :return: City, or None if the city cannot be found
+        """
+        return self.get_city_table().find('city', city_name, order)
@@ -0,0 +1,233 @@
+"""
+A compact, array-backed representation of the world city table (`data/simplemaps-worldcities-basic.csv`).
+
+The CSV is compiled once, at build time, into three NumPy files:
+- `records.npy`: one fixed-size record per city; string columns hold indices into the string table
+- `strings.npy` + `string_offsets.npy`: the interned, byte-sorted UTF-8 strings used by all records
+- `population_order.npy`: record indices ordered from the most to the least populated city
+
+The files are loaded with `mmap_mode='r'`, so every worker process shares the same pages through the OS page cache
+and no CSV parsing happens at startup. When the compiled table is missing or older than the CSV, the table is
+compiled in memory instead.
+"""
+import collections
+import csv
+import os
+
+import numpy as np
+
+City = collections.namedtuple('City', ['Index', 'city', 'city_ascii', 'lat', 'lon', 'pop', 'country', 'iso2', 'iso3',
+                                       'province'])
+
+
+class CityTable:
+    """ String columns of the city table, stored as indices into the interned string table """
+    STRING_FIELDS = ('city', 'city_ascii', 'country', 'iso2', 'iso3', 'province')
+
+    RECORD_DTYPE = np.dtype([('lat', '<f8'), ('lon', '<f8'), ('pop', '<f8')] +
+                            [(field, '<i4') for field in STRING_FIELDS])
+
+    """ Folder (under the data path) where the compiled table is stored """
+    TABLE_FOLDER = 'city_table'
+
+    RECORDS_FILE = 'records.npy'
+    STRINGS_FILE = 'strings.npy'
+    STRING_OFFSETS_FILE = 'string_offsets.npy'
+    POPULATION_ORDER_FILE = 'population_order.npy'
+
+    def __init__(self, records, strings, string_offsets, population_order):
+        """
+        Constructor
+
+        :param records: numpy structured array of `RECORD_DTYPE`
+        :param strings: numpy uint8 array, the concatenated UTF-8 encoded strings, sorted by their bytes
+        :param string_offsets: numpy int64 array, where string `i` spans `strings[offsets[i]:offsets[i + 1]]`
+        :param population_order: numpy int32 array, record indices sorted by descending population
+        """
+        self.records = records
+        self.strings = strings
+        self.string_offsets = string_offsets
+        self.population_order = population_order
+        self._decoded = {}
+
+    @classmethod
+    def load(cls, data_path='data', data_file='simplemaps-worldcities-basic.csv'):
+        """
+        This loads the compiled city table (memory-mapped) if it is up to date, or compiles it from the CSV.
+
+        :param data_path: str, folder where the city CSV and the compiled table are located
+        :param data_file: str, file name of the city CSV
+        :return: CityTable
+        """
+        csv_path = os.path.join(data_path, data_file)
+        table_folder = os.path.join(data_path, cls.TABLE_FOLDER)
+        records_path = os.path.join(table_folder, cls.RECORDS_FILE)
+
+        if os.path.isfile(records_path) and \
+                (not os.path.isfile(csv_path) or os.path.getmtime(records_path) >= os.path.getmtime(csv_path)):
+            return cls(np.load(records_path, mmap_mode='r'),
+                       np.load(os.path.join(table_folder, cls.STRINGS_FILE), mmap_mode='r'),
+                       np.load(os.path.join(table_folder, cls.STRING_OFFSETS_FILE), mmap_mode='r'),
+                       np.load(os.path.join(table_folder, cls.POPULATION_ORDER_FILE), mmap_mode='r'))
+
+        return cls.from_csv(csv_path)
+
+    @classmethod
+    def from_csv(cls, csv_path):
+        """
+        This compiles the city CSV into an in-memory city table.
+
+        :param csv_path: str
+        :return: CityTable
+        """
+        with open(csv_path, newline='', encoding='utf-8') as csv_file:
+            rows = list(csv.DictReader(csv_file))
+
+        encoded_rows = [{field: row[field].encode('utf-8') for field in cls.STRING_FIELDS} for row in rows]
+        unique_strings = sorted({value for row in encoded_rows for value in row.values()})
+        string_ids = {value: index for index, value in enumerate(unique_strings)}
+
+        lengths = np.array([len(value) for value in unique_strings], dtype=np.int64)
+        string_offsets = np.zeros(len(unique_strings) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=string_offsets[1:])
+        strings = np.frombuffer(b''.join(unique_strings), dtype=np.uint8)
+
+        records = np.zeros(len(rows), dtype=cls.RECORD_DTYPE)
+        records['lat'] = [float(row['lat']) for row in rows]
+        records['lon'] = [float(row['lng']) for row in rows]
+        records['pop'] = [float(row['pop']) for row in rows]
+        for field in cls.STRING_FIELDS:
+            records[field] = [string_ids[row[field]] for row in encoded_rows]
+
+        population_order = np.argsort(-records['pop'], kind='mergesort').astype(np.int32)
+        return cls(records, strings, string_offsets, population_order)
+
+    def save(self, data_path='data'):
+        """
+        This writes the compiled table under `data_path`, so later loads can memory-map it.
+        Each file is written aside and then renamed, so readers never observe a partially written table.
+
+        :param data_path: str
+        :return: str, the folder where the table was written
+        """
+        table_folder = os.path.join(data_path, self.TABLE_FOLDER)
+        if not os.path.exists(table_folder):
+            os.makedirs(table_folder)
+
+        for file_name, array in [(self.STRINGS_FILE, self.strings),
+                                 (self.STRING_OFFSETS_FILE, self.string_offsets),
+                                 (self.POPULATION_ORDER_FILE, self.population_order),
+                                 (self.RECORDS_FILE, self.records)]:
+            full_path = os.path.join(table_folder, file_name)
+            temp_path = full_path + '.tmp'
+            with open(temp_path, 'wb') as table_file:
+                np.save(table_file, np.asarray(array))
+            os.replace(temp_path, full_path)
+
+        return table_folder
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        for index in range(len(self.records)):
+            yield self.get(index)
+
+    def get(self, index):
+        """
+        This returns the city stored at the given position (the row number in the original CSV).
+
+        :param index: int
+        :return: City
+        """
+        index = int(index)
+        record = self.records[index]
+        return City(index,
+                    self._get_string(record['city']),
+                    self._get_string(record['city_ascii']),
+                    float(record['lat']),
+                    float(record['lon']),
+                    float(record['pop']),
+                    self._get_string(record['country']),
+                    self._get_string(record['iso2']),
+                    self._get_string(record['iso3']),
+                    self._get_string(record['province']))
+
+    def by_population(self):
+        """
+        This iterates through the cities, from the most to the least populated
+
+        :return: Iterator[City]
+        """
+        for index in self.population_order:
+            yield self.get(index)
+
+    """ Orders of the cities found: by descending population, or from west to east """
+    ORDER_POPULATION = 'population'
+    ORDER_LONGITUDE = 'longitude'
+
+    def find(self, field, value, order=ORDER_POPULATION):
+        """
+        This returns the most populated (or westernmost) city whose `field` equals `value`, or None if there is no such
+        city.
+
+        :param field: str, one of `STRING_FIELDS`
+        :param value: str
+        :param order: str, `ORDER_POPULATION`, or `ORDER_LONGITUDE` for the westernmost city, as `/weather` picked it
+        :return: City
+        """
+        indices = self.find_indices(field, value, order)
+        if len(indices) == 0:
+            return None
+        return self.get(indices[0])
+
+    def find_indices(self, field, value, order=ORDER_POPULATION):
+        """
+        This returns the positions of all cities whose `field` equals `value`, by descending population, or by ascending
+        longitude.
+
+        :param field: str, one of `STRING_FIELDS`
+        :param value: str
+        :param order: str, `ORDER_POPULATION` or `ORDER_LONGITUDE`
+        :return: numpy array of int
+        """
+        string_id = self._find_string_id(value)
+        if string_id < 0:
+            return np.empty(0, dtype=np.int64)
+
+        indices = np.flatnonzero(self.records[field] == string_id)
+        if order == self.ORDER_LONGITUDE:
+            return indices[np.argsort(self.records['lon'][indices], kind='mergesort')]
+        if order != self.ORDER_POPULATION:
+            raise Exception('Unknown order: %s' % order)
+        return indices[np.argsort(-self.records['pop'][indices], kind='mergesort')]
+
+    def _get_string(self, string_id):
+        string_id = int(string_id)
+        value = self._decoded.get(string_id)
+        if value is None:
+            start, end = self.string_offsets[string_id], self.string_offsets[string_id + 1]
+            value = self.strings[start:end].tobytes().decode('utf-8')
+            self._decoded[string_id] = value
+        return value
+
+    def _find_string_id(self, value):
+        """ Binary search through the byte-sorted string table, -1 if the value is not interned """
+        if value is None:
+            return -1
+
+        encoded = value.encode('utf-8')
+        low, high = 0, len(self.string_offsets) - 1
+        while low < high:
+            middle = (low + high) // 2
+            start, end = self.string_offsets[middle], self.string_offsets[middle + 1]
+            if self.strings[start:end].tobytes() < encoded:
+                low = middle + 1
+            else:
+                high = middle
+
+        if low < len(self.string_offsets) - 1:
+            start, end = self.string_offsets[low], self.string_offsets[low + 1]
+            if self.strings[start:end].tobytes() == encoded:
+                return low
+        return -1
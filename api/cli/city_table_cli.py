@@ -0,0 +1,19 @@
+"""
+A simple CLI to compile the world city CSV into the memory-mapped city table, run at build time.
+"""
+import argparse
+import os
+
+from api.city.city_table import CityTable
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compile the world city CSV into an array-backed city table')
+    parser.add_argument('path', nargs='?', default='data',
+                        help='a string indicating the folder where the city CSV is, and the table shall be written. '
+                             'e.g., data/')
+    parser.add_argument('--file', default='simplemaps-worldcities-basic.csv', help='file name of the city CSV')
+
+    args = parser.parse_args()
+    city_table = CityTable.from_csv(os.path.join(args.path, args.file))
+    table_folder = city_table.save(args.path)
+    print('Compiled %d cities into %s' % (len(city_table), table_folder))
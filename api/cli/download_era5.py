@@ -3,30 +3,46 @@ This file downloads the 22 variables from ECMWF ERA5 reanalysis in `parameters`
 
 File `.cdsapirc` must be set up with a key and a URL: https://cds.climate.copernicus.eu/api/v2.
 The size of ERA5 dataset is huge, it's expected that it's downloaded to a cheap storage.
+
+Each downloaded file is checked (see `validation.py`): a partial or corrupt file is removed, so it's downloaded again on
+the next run. Failed downloads are reported at the end, and make the script exit with an error.
+
+Files already downloaded are looked up in the inventory (see `inventory.py`, at INVENTORY_PATH), built once for the
+folder of each year, rather than by listing the folder for every file.
 """
-import cdsapi
+import logging
 import os
+import sys
+
+import cdsapi
+import xarray
 
+from api.core.inventory import Inventory
 from api.core.weather_file import WeatherFile
+from api.core.logging_config import configure_logging
 from api.core.weather_parameter import WeatherParameter
+from api.ingest.validation import MonthValidator
+
+configure_logging()
+logger = logging.getLogger(__name__)
 
 c = cdsapi.Client()
-weather_file = WeatherFile('/s3bucket/')
-original_file_extension = weather_file.get_original_file_extension()
+weather_file = WeatherFile('/s3bucket/', inventory=Inventory(os.getenv('INVENTORY_PATH', '/tmp/era5-inventory.sqlite')))
+validator = MonthValidator()
+failures = []
 
 for y in [2016, 2015, 2014, 2013, 2012]:
 
     directory = weather_file.get_or_create_original_folder(str(y))
+    weather_file.build_inventory(directory)
 
     for m in range(1, 13):
         for parameter in WeatherParameter.get_all_parameters():
 
             filename = weather_file.get_original_file_name(year=y, month=m, parameter=parameter)
             try:
-                file_list = [file for file in os.listdir(directory) if file.endswith(original_file_extension)]
-
-                if filename not in file_list:
-                    print('year: %d month:%d' % (y, m))
+                if not weather_file.storage.exists(directory + filename):
+                    logger.info('year: %d month:%d', y, m)
 
                     c.retrieve(
                         'reanalysis-era5-single-levels',
@@ -62,5 +78,18 @@ for y in [2016, 2015, 2014, 2013, 2012]:
                         },
                         os.path.join(directory, filename)
                     )
-            except:
-                print('Error in getting %s' % filename)
+
+                    with xarray.open_dataset(os.path.join(directory, filename)) as data_set:
+                        report = validator.validate_parameter(y, m, parameter, data_set)
+                    if not report['valid']:
+                        os.remove(os.path.join(directory, filename))
+                    weather_file.storage.refresh(directory + filename)
+                    if not report['valid']:
+                        raise Exception('%s is invalid: %s' % (filename, '; '.join(report['errors'])))
+            except Exception:
+                logger.exception('Error in getting %s', filename)
+                failures.append(filename)
+
+if failures:
+    logger.error('%d files failed: %s', len(failures), ', '.join(failures))
+    sys.exit(1)
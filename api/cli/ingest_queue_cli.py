@@ -0,0 +1,73 @@
+"""
+A command prompt CLI for distributed ingest, through a work queue shared by the workers, e.g.:
+
+- `python -m api.cli.ingest_queue_cli enqueue /shared/ingest.sqlite 2017 1 12 --shards 16`
+- `python -m api.cli.ingest_queue_cli enqueue /shared/ingest.sqlite 2018 3 3 --append` as a new month is released
+- `python -m api.cli.ingest_queue_cli work /shared/ingest.sqlite /s3bucket/` on each machine, as many as needed
+- `python -m api.cli.ingest_queue_cli status /shared/ingest.sqlite`
+- `python -m api.cli.ingest_queue_cli retry /shared/ingest.sqlite` once the cause of failed tasks is fixed
+"""
+import argparse
+import json
+import logging
+
+from api.core.logging_config import configure_logging
+from api.ingest.ingest_worker import IngestWorker, enqueue_months
+from api.ingest.work_queue import WorkQueue
+
+logger = logging.getLogger(__name__)
+
+if __name__ == '__main__':
+    configure_logging()
+    parser = argparse.ArgumentParser(description='Distributed ingest through a shared work queue')
+    parser.add_argument('--lease', type=float, default=600, help='seconds a task is reserved for its worker')
+    parser.add_argument('--max-attempts', type=int, default=3, help='number of times a task is tried')
+    commands = parser.add_subparsers(dest='command')
+
+    enqueue_parser = commands.add_parser('enqueue', help='add the tasks of year-month combinations')
+    enqueue_parser.add_argument('queue', help='path to the SQLite file of the queue')
+    enqueue_parser.add_argument('year', type=int, help='an integer representing the year, e.g., 2017')
+    enqueue_parser.add_argument('min_month', type=int, help='the first month, e.g., 1 for january (inclusive)')
+    enqueue_parser.add_argument('max_month', type=int, help='the last month, e.g., 12 for december (inclusive)')
+    enqueue_parser.add_argument('--shards', type=int, default=16, help='number of tasks each month is split into')
+    enqueue_parser.add_argument('--append', action='store_true',
+                                help='append the months to the yearly series of each city, rather than monthly files')
+
+    work_parser = commands.add_parser('work', help='work on tasks until they are all done')
+    work_parser.add_argument('queue', help='path to the SQLite file of the queue')
+    work_parser.add_argument('path', help='a string indicating the system path leading to where the data is. '
+                                          'e.g., /s3bucket/')
+    work_parser.add_argument('--max-tasks', type=int, help='maximum number of tasks worked on')
+    work_parser.add_argument('--poll-interval', type=float, default=30,
+                             help='seconds between checks for tasks to take over from other workers')
+
+    status_parser = commands.add_parser('status', help='print the number of tasks in each state, and the failures')
+    status_parser.add_argument('queue', help='path to the SQLite file of the queue')
+    status_parser.add_argument('--manifest', action='store_true', help='print the manifest of the completed tasks')
+
+    retry_parser = commands.add_parser('retry', help='retry the failed tasks')
+    retry_parser.add_argument('queue', help='path to the SQLite file of the queue')
+
+    args = parser.parse_args()
+    if args.command is None:
+        parser.error('a command is required')
+    work_queue = WorkQueue(args.queue, lease_seconds=args.lease, max_attempts=args.max_attempts)
+
+    if args.command == 'enqueue':
+        added = enqueue_months(work_queue, args.year, range(args.min_month, args.max_month + 1), args.shards,
+                               append=args.append)
+        logger.info('Added %d tasks', added)
+    elif args.command == 'work':
+        from api.core.inventory import get_inventory
+        from api.ingest.preprocessor import Preprocessor
+
+        worker = IngestWorker(work_queue, Preprocessor(args.path, inventory=get_inventory()))
+        logger.info('Completed %d tasks', worker.run(max_tasks=args.max_tasks, poll_interval=args.poll_interval))
+    elif args.command == 'status':
+        print(json.dumps(work_queue.get_counts()))
+        for key, error in work_queue.get_failures():
+            print('%s failed: %s' % (key, error))
+        if args.manifest:
+            print(json.dumps(work_queue.get_manifest(), indent=2))
+    elif args.command == 'retry':
+        logger.info('Retrying %d tasks', work_queue.retry_failed())
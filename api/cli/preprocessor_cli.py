@@ -2,16 +2,15 @@
 A command prompt CLI to help ingest new data
 """
 import argparse
-import os
+import logging
 import sys
 
-import boto3
-import botocore
-from boto3.s3.transfer import TransferConfig
-
+from api.core.logging_config import configure_logging
+from api.core.storage import get_s3_client
 from api.core.weather_file import WeatherFile
 from api.core.weather_parameter import WeatherParameter
-from api.ingest.preprocessor import Preprocessor
+
+logger = logging.getLogger(__name__)
 
 
 def _copy_file_from_s3(s3_client, year, month):
@@ -24,12 +23,13 @@ def _copy_file_from_s3(s3_client, year, month):
 
         weather_file_key = weather_file.get_original_folder(year) + weather_file
         destination_file = destination_folder + weather_file_key
-        print('metadata_key: ' + weather_file_key)
-        print('metadata_key: ' + destination_file)
+        logger.debug('metadata_key: %s', weather_file_key)
+        logger.debug('destination: %s', destination_file)
         s3_client.download_file(bucket, weather_file_key, weather_file)
 
 
 if __name__ == '__main__':
+    configure_logging()
     parser = argparse.ArgumentParser(description='Pre-process files for year-month combination')
     parser.add_argument('year', type=int, help='an integer representing the year, e.g., 2017')
     parser.add_argument('min_month', type=int,
@@ -38,16 +38,15 @@ if __name__ == '__main__':
                         help='the month from which preprocessing finishes, e.g., 2 for februrary (inclusive)')
     parser.add_argument('path', help='a string indicating the system path leading to where the data is. '
                                      'e.g., /s3bucket/')
+    parser.add_argument('--append', action='store_true',
+                        help='append the months to the yearly series of each city, rather than monthly files')
 
     # Initialise S3
     bucket = 'ec2-us-east-1-oikolab'
-    TransferConfig(max_concurrency=5)
-    client = boto3.client('s3', aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-                          aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-                          config=botocore.client.Config(signature_version=botocore.UNSIGNED))
+    client = get_s3_client()
 
     for path in sys.path:
-        print('path: ' + path)
+        logger.debug('path: %s', path)
 
     # Argument extraction
     args = parser.parse_args()
@@ -59,8 +58,15 @@ if __name__ == '__main__':
     # Copy the files over first
     _copy_file_from_s3(client, 2016, 1)
 
+    # imported once the arguments are valid, so `--help` and usage errors answer at once
+    from api.core.inventory import get_inventory
+    from api.ingest.preprocessor import Preprocessor
+
     # # Go through the months as specified
-    preprocessor = Preprocessor(data_path)
-    for month in range(min_month, max_month + 1):
-        print('processing for %s/%s' % (year, month))
-        preprocessor.process(year=year, month=month)
+    preprocessor = Preprocessor(data_path, inventory=get_inventory())
+    if args.append:
+        preprocessor.append(year=year, months=range(min_month, max_month + 1))
+    else:
+        for month in range(min_month, max_month + 1):
+            logger.info('processing for %s/%s', year, month)
+            preprocessor.process(year=year, month=month)
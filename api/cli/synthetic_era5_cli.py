@@ -0,0 +1,36 @@
+"""
+A command prompt CLI to write synthetic ERA5 files, to run ingest and serving offline, e.g.:
+`python -m api.cli.synthetic_era5_cli /tmp/era5/ 2017 1 12 --cities 50`
+
+The cities covered are written to the same folder, as a city CSV: `CityService('/tmp/era5/')` reads them.
+"""
+import argparse
+import logging
+import time
+
+from api.core.logging_config import configure_logging
+from api.ingest.synthetic_era5 import SyntheticEra5
+
+logger = logging.getLogger(__name__)
+
+if __name__ == '__main__':
+    configure_logging()
+    parser = argparse.ArgumentParser(description='Write synthetic ERA5 files for year-month combination')
+    parser.add_argument('path', help='a string indicating where the files shall be written, e.g., /tmp/era5/')
+    parser.add_argument('year', type=int, help='an integer representing the year, e.g., 2017')
+    parser.add_argument('min_month', type=int, help='the first month to write, e.g., 1 for january (inclusive)')
+    parser.add_argument('max_month', type=int, help='the last month to write, e.g., 2 for february (inclusive)')
+    parser.add_argument('--resolution', type=float, default=0.25, help='grid spacing in degrees')
+    parser.add_argument('--days', type=int, default=2, help='number of days in each monthly file')
+    parser.add_argument('--cities', type=int, default=100, help='number of cities covered, most populated first')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random values')
+
+    args = parser.parse_args()
+    generator = SyntheticEra5(args.path, resolution=args.resolution, days=args.days, city_count=args.cities,
+                              seed=args.seed)
+    logger.info('Wrote %s', generator.write_cities(args.path))
+
+    for month in range(args.min_month, args.max_month + 1):
+        start = time.time()
+        paths = generator.write(args.year, month)
+        logger.info('Wrote %d files for %d-%02d in %.2fs', len(paths), args.year, month, time.time() - start)
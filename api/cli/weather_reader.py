@@ -4,8 +4,6 @@ A simple CLI to retrieves a weather data set
 
 import argparse
 
-from api.outgest.weather_service import WeatherService
-
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Read pre-processed weather files for a city-year-month combination')
     parser.add_argument('year', type=int, help='an integer representing the year, e.g., 2017')
@@ -21,6 +19,9 @@ if __name__ == '__main__':
     city = args.city
     data_path = args.path
 
+    # imported once the arguments are valid, so `--help` and usage errors answer at once
+    from api.outgest.weather_service import WeatherService
+
     weather_service = WeatherService(data_path)
     weather_ds = weather_service.get_weather_data_set(year, month, city)
     print(weather_ds)
@@ -0,0 +1,190 @@
+"""
+Parameters derived from the ERA5 parameters, e.g., relative humidity from the temperature and the dewpoint temperature.
+
+They are computed once, at ingest, into the processed files (see `Preprocessor`), so clients request them by name rather
+than deriving them from the hourly series they download. Computations are vectorized over the whole series of a city.
+
+ERA5 hourly accumulations (precipitation and radiation) are accumulated over the hour ending at the time step: their
+rates are the accumulation divided by an hour.
+"""
+import collections
+
+import numpy as np
+
+from api.core.weather_parameter import ParameterMetadata, WeatherParameter
+
+""" Seconds over which ERA5 hourly accumulations are accumulated """
+ACCUMULATION_SECONDS = 3600
+
+""" A derived parameter: its metadata, the parameters it's derived from, and how """
+Derivation = collections.namedtuple('Derivation', ['name', 'metadata', 'inputs', 'compute'])
+
+_DERIVATIONS = collections.OrderedDict()
+
+
+def _register(name, metadata, inputs):
+    """ Registers the decorated function, called with the data arrays of the inputs, in order """
+    def decorator(compute):
+        _DERIVATIONS[name] = Derivation(name, metadata, inputs, compute)
+        return compute
+    return decorator
+
+
+@_register('2m_relative_humidity', ParameterMetadata('rh2m', '%', 0.0, 100.0, 0.01),
+           ['2m_temperature', '2m_dewpoint_temperature'])
+def _relative_humidity(temperature, dewpoint_temperature):
+    """ Magnus formula over water (Alduchov and Eskridge, 1996), from temperatures in K """
+    temperature = temperature - 273.15
+    dewpoint_temperature = dewpoint_temperature - 273.15
+    ratio = np.exp(17.625 * dewpoint_temperature / (243.04 + dewpoint_temperature)
+                   - 17.625 * temperature / (243.04 + temperature))
+    return (100 * ratio).clip(0, 100)
+
+
+@_register('10m_wind_speed', ParameterMetadata('ws10', 'm s**-1', 0.0, 150.0, 0.01),
+           ['10m_u_component_of_wind', '10m_v_component_of_wind'])
+def _wind_speed(u, v):
+    return np.sqrt(u ** 2 + v ** 2)
+
+
+@_register('10m_wind_direction', ParameterMetadata('wd10', 'degrees', 0.0, 360.0, 0.01),
+           ['10m_u_component_of_wind', '10m_v_component_of_wind'])
+def _wind_direction(u, v):
+    """ Where the wind blows from, clockwise from the north, as reported by weather stations """
+    return np.degrees(np.arctan2(-u, -v)) % 360
+
+
+@_register('total_precipitation_rate', ParameterMetadata('tp_rate', 'mm h**-1', 0.0, 500.0, 0.01),
+           ['total_precipitation'])
+def _precipitation_rate(total_precipitation):
+    # m accumulated over an hour; interpolation can make tiny negative amounts
+    return (total_precipitation * 1000 * 3600 / ACCUMULATION_SECONDS).clip(min=0)
+
+
+@_register('surface_solar_radiation_downwards_flux', ParameterMetadata('ssrd_flux', 'W m**-2', 0.0, 2000.0, 0.1),
+           ['surface_solar_radiation_downwards'])
+def _solar_radiation_flux(radiation):
+    return (radiation / ACCUMULATION_SECONDS).clip(min=0)
+
+
+@_register('surface_thermal_radiation_downwards_flux', ParameterMetadata('strd_flux', 'W m**-2', 0.0, 1000.0, 0.1),
+           ['surface_thermal_radiation_downwards'])
+def _thermal_radiation_flux(radiation):
+    return (radiation / ACCUMULATION_SECONDS).clip(min=0)
+
+
+@_register('total_sky_direct_solar_radiation_at_surface_flux',
+           ParameterMetadata('fdir_flux', 'W m**-2', 0.0, 2000.0, 0.1), ['total_sky_direct_solar_radiation_at_surface'])
+def _direct_solar_radiation_flux(radiation):
+    return (radiation / ACCUMULATION_SECONDS).clip(min=0)
+
+
+class DerivedParameter:
+
+    @staticmethod
+    def get_all_parameters():
+        """
+        This returns a list of derived parameters, computed at ingest
+
+        :return: List[str]
+        """
+        return list(_DERIVATIONS)
+
+    @staticmethod
+    def get_short_name(parameter):
+        """
+        This returns the name of the variable holding a derived parameter, e.g., `ws10` for `10m_wind_speed`
+
+        :param parameter: str
+        :return: str
+        """
+        return DerivedParameter._get_derivation(parameter).metadata.short_name
+
+    @staticmethod
+    def get_metadata(parameter):
+        """
+        This returns the units, valid range and storage precision of a derived parameter
+
+        :param parameter: str
+        :return: ParameterMetadata
+        """
+        return DerivedParameter._get_derivation(parameter).metadata
+
+    @staticmethod
+    def get_variable_name(parameter):
+        """
+        This returns the name of the variable holding a parameter in processed files, derived or not
+
+        :param parameter: str: e.g., `2m_temperature` or `2m_relative_humidity`
+        :return: str
+        """
+        if parameter in _DERIVATIONS:
+            return _DERIVATIONS[parameter].metadata.short_name
+        return WeatherParameter.get_short_name(parameter)
+
+    @staticmethod
+    def get_inputs(parameter):
+        """
+        This returns the parameters a derived parameter is computed from
+
+        :param parameter: str
+        :return: List[str]
+        """
+        return list(DerivedParameter._get_derivation(parameter).inputs)
+
+    @staticmethod
+    def compute(parameter, inputs):
+        """
+        This computes a derived parameter
+
+        :param parameter: str
+        :param inputs: dict: values of the parameters it's derived from, by parameter, as numpy arrays or data arrays
+        :return: the values, of the type of the inputs
+        """
+        derivation = DerivedParameter._get_derivation(parameter)
+        return derivation.compute(*[inputs[name] for name in derivation.inputs])
+
+    @staticmethod
+    def add_to(data_set, parameters=None):
+        """
+        This computes derived parameters from the ERA5 variables of a data set, e.g., the series of a city
+
+        :param data_set: xarray.Dataset: with the ERA5 variables, e.g., `t2m`
+        :param parameters: List[str]: the derived parameters computed, defaults to all of them
+        :return: xarray.Dataset: the data set, with a variable for each derived parameter
+        """
+        if parameters is None:
+            parameters = DerivedParameter.get_all_parameters()
+
+        derived = {}
+        for parameter in parameters:
+            derivation = DerivedParameter._get_derivation(parameter)
+            variable = DerivedParameter.compute(parameter, {name: data_set[WeatherParameter.get_short_name(name)]
+                                                            for name in derivation.inputs})
+            variable.attrs = {'units': derivation.metadata.units, 'long_name': parameter.replace('_', ' '),
+                              'derived_from': ' '.join(derivation.inputs)}
+            derived[derivation.metadata.short_name] = variable
+        return data_set.assign(**derived)
+
+    @staticmethod
+    def select(data_set, parameters):
+        """
+        This keeps the variables of the given parameters, derived or not. Derived parameters missing from the data
+        set (e.g., files processed before they were added) are computed.
+
+        :param data_set: xarray.Dataset
+        :param parameters: List[str]
+        :return: xarray.Dataset
+        """
+        missing = [parameter for parameter in parameters if parameter in _DERIVATIONS
+                   and DerivedParameter.get_short_name(parameter) not in data_set.data_vars]
+        if missing:
+            data_set = DerivedParameter.add_to(data_set, missing)
+        return data_set[[DerivedParameter.get_variable_name(parameter) for parameter in parameters]]
+
+    @staticmethod
+    def _get_derivation(parameter):
+        try:
+            return _DERIVATIONS[parameter]
+        except KeyError:
+            raise Exception('Unknown derived parameter: %s' % parameter)
@@ -0,0 +1,24 @@
+"""
+Helpers to locate points on regular latitude/longitude grids
+"""
+import numpy as np
+
+
+def get_nearest_indices(coordinates, values):
+    """
+    Vectorized nearest-neighbour lookup on a monotonic (ascending or descending) coordinate
+
+    :param coordinates: numpy array
+    :param values: numpy array
+    :return: numpy array of int
+    """
+    descending = coordinates[0] > coordinates[-1]
+    ordered = coordinates[::-1] if descending else coordinates
+
+    right = np.clip(np.searchsorted(ordered, values), 1, len(ordered) - 1)
+    left = right - 1
+    indices = np.where(values - ordered[left] <= ordered[right] - values, left, right)
+
+    if descending:
+        indices = len(ordered) - 1 - indices
+    return indices
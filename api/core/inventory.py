@@ -0,0 +1,268 @@
+"""
+An inventory of the weather files, original and processed: the path, size, checksum and modification time of each
+object, kept in a SQLite file.
+
+On the s3fs mount (`/s3bucket/`) or S3, every existence check, folder creation and listing is a remote round trip, and
+ingest makes thousands of them. The inventory is built in one bulk listing, then answers them locally. Writers going
+through `IndexedStorage` record what they write, in a transaction, once the object is stored.
+
+Files written by other means (e.g., copied to the bucket by hand, or by machines with another inventory) are not seen
+until the inventory is built again, or refreshed for the path (`IndexedStorage.refresh`). Paths under a prefix that was
+never built are checked against the storage itself. Hence:
+- build only the folders that are looked up, e.g., the original folders of the years downloaded
+- the web app must not use an inventory: INVENTORY_PATH is only read by the download and ingest command lines
+
+Checksums are the MD5 of the content written through the inventory, or the S3 ETag; files found by listing a local
+folder have none, as it would mean reading all of them.
+"""
+import collections
+import contextlib
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from api.core.storage import Storage
+
+logger = logging.getLogger(__name__)
+
+""" An object of the inventory """
+InventoryEntry = collections.namedtuple('InventoryEntry', ['path', 'size', 'checksum', 'modified'])
+
+""" Sorts after any character of a path: `prefix <= path < prefix + _LAST` selects the paths under a prefix """
+_LAST = '\U0010ffff'
+
+
+class Inventory:
+
+    def __init__(self, store_path):
+        """
+        Constructor
+
+        :param store_path: str: path to the SQLite file, on a local disk (SQLite needs file locks)
+        """
+        self.store_path = store_path
+        self._local = threading.local()
+
+    def build(self, storage, prefix):
+        """
+        This replaces the objects under a prefix with a listing of the storage
+
+        :param storage: Storage: the storage listed, not an IndexedStorage
+        :param prefix: str: a folder, ending with `/`, or '' for the whole storage
+        :return: int: number of objects
+        """
+        start = time.time()
+        rows = [(path, size, checksum, modified) for path, size, modified, checksum in storage.walk(prefix)]
+        with self._transaction() as connection:
+            connection.execute('DELETE FROM objects WHERE path >= ? AND path < ?', (prefix, prefix + _LAST))
+            connection.executemany('INSERT OR REPLACE INTO objects (path, size, checksum, modified) '
+                                   'VALUES (?, ?, ?, ?)', rows)
+            connection.execute('INSERT OR REPLACE INTO builds (prefix, built) VALUES (?, ?)', (prefix, time.time()))
+        logger.info('Built the inventory of %s: %d objects in %.1fs', prefix or '/', len(rows), time.time() - start)
+        return len(rows)
+
+    def is_built(self, path):
+        """
+        :param path: str
+        :return: bool: whether the path is under a prefix the inventory was built for
+        """
+        row = self._get_connection().execute('SELECT 1 FROM builds WHERE substr(?, 1, length(prefix)) = prefix LIMIT 1',
+                                             (path,)).fetchone()
+        return row is not None
+
+    def record(self, path, size, checksum=None, modified=None):
+        """
+        This adds or updates an object
+
+        :param path: str
+        :param size: int: bytes
+        :param checksum: str: e.g., the MD5 of the content
+        :param modified: float: seconds since the epoch, defaults to now
+        :return: None
+        """
+        with self._transaction() as connection:
+            connection.execute('INSERT OR REPLACE INTO objects (path, size, checksum, modified) VALUES (?, ?, ?, ?)',
+                               (path, size, checksum, modified if modified is not None else time.time()))
+
+    def remove(self, path):
+        """
+        :param path: str
+        :return: None
+        """
+        with self._transaction() as connection:
+            connection.execute('DELETE FROM objects WHERE path = ?', (path,))
+
+    def get(self, path):
+        """
+        :param path: str
+        :return: InventoryEntry, or None if the object is not in the inventory
+        """
+        row = self._get_connection().execute('SELECT path, size, checksum, modified FROM objects WHERE path = ?',
+                                             (path,)).fetchone()
+        return InventoryEntry(*row) if row is not None else None
+
+    def exists(self, path):
+        """
+        :param path: str
+        :return: bool
+        """
+        return self.get(path) is not None
+
+    def is_folder(self, prefix):
+        """
+        :param prefix: str: ends with `/`
+        :return: bool: whether any object is under the prefix
+        """
+        row = self._get_connection().execute('SELECT 1 FROM objects WHERE path >= ? AND path < ? LIMIT 1',
+                                             (prefix, prefix + _LAST)).fetchone()
+        return row is not None
+
+    def list(self, prefix):
+        """
+        :param prefix: str: a folder, ending with `/`
+        :return: List[str]: names of the objects and folders directly under the folder
+        """
+        rows = self._get_connection().execute('SELECT path FROM objects WHERE path >= ? AND path < ? ORDER BY path',
+                                              (prefix, prefix + _LAST)).fetchall()
+        names = []
+        for path, in rows:
+            name = path[len(prefix):].split('/', 1)[0]
+            if not names or names[-1] != name:
+                names.append(name)
+        return names
+
+    def _transaction(self):
+        connection = self._get_connection()
+        connection.execute('BEGIN IMMEDIATE')
+        return connection
+
+    def _get_connection(self):
+        """ One connection per thread and process; connections must not be shared across a fork """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.store_path, timeout=30, isolation_level=None)
+            connection.execute('CREATE TABLE IF NOT EXISTS objects '
+                               '(path TEXT PRIMARY KEY, size INTEGER NOT NULL, checksum TEXT, modified REAL NOT NULL)')
+            connection.execute('CREATE TABLE IF NOT EXISTS builds (prefix TEXT PRIMARY KEY, built REAL NOT NULL)')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+
+class IndexedStorage(Storage):
+    """ A storage whose lookups are answered by an inventory, and whose writes are recorded into it """
+
+    def __init__(self, storage, inventory):
+        """
+        Constructor
+
+        :param storage: Storage: where objects are stored
+        :param inventory: Inventory
+        """
+        self.storage = storage
+        self.inventory = inventory
+        self._folders = set()
+        self._lock = threading.Lock()
+
+    def exists(self, path):
+        if self.inventory.is_built(path):
+            return self.inventory.exists(path)
+        return self.storage.exists(path)
+
+    def is_folder(self, path):
+        if self.inventory.is_built(path):
+            return self.inventory.is_folder(path)
+        return self.storage.is_folder(path)
+
+    def makedirs(self, path):
+        # folders are created once per process, rather than checked on every call
+        with self._lock:
+            if path in self._folders:
+                return
+        self.storage.makedirs(path)
+        with self._lock:
+            self._folders.add(path)
+
+    def list(self, prefix):
+        if self.inventory.is_built(prefix):
+            return self.inventory.list(prefix)
+        return self.storage.list(prefix)
+
+    def size(self, path):
+        if self.inventory.is_built(path):
+            entry = self.inventory.get(path)
+            if entry is None:
+                raise Exception(path + ' does not exist')
+            return entry.size
+        return self.storage.size(path)
+
+    def walk(self, prefix):
+        return self.storage.walk(prefix)
+
+    def read(self, path):
+        return self.storage.read(path)
+
+    def read_range(self, path, start, end):
+        return self.storage.read_range(path, start, end)
+
+    def read_ranges(self, path, ranges):
+        return self.storage.read_ranges(path, ranges)
+
+    def write(self, path, data):
+        self.storage.write(path, data)
+        self.inventory.record(path, len(data), hashlib.md5(data).hexdigest())
+
+    def upload(self, local_path, path):
+        self.storage.upload(local_path, path)
+        self.inventory.record(path, os.path.getsize(local_path), _get_file_checksum(local_path))
+
+    @contextlib.contextmanager
+    def open_local_path(self, path):
+        with self.storage.open_local_path(path) as local_path:
+            yield local_path
+            size = os.path.getsize(local_path)
+            checksum = _get_file_checksum(local_path)
+        self.inventory.record(path, size, checksum)
+
+    def get_local_path(self, path):
+        return self.storage.get_local_path(path)
+
+    def release_local_path(self, local_path):
+        self.storage.release_local_path(local_path)
+
+    def lock(self, path):
+        return self.storage.lock(path)
+
+    def refresh(self, path):
+        """
+        This updates the inventory with an object written by other means, e.g., downloaded in place
+
+        :param path: str
+        :return: bool: whether the object exists
+        """
+        if not self.storage.exists(path):
+            self.inventory.remove(path)
+            return False
+        self.inventory.record(path, self.storage.size(path))
+        return True
+
+
+def _get_file_checksum(local_path):
+    checksum = hashlib.md5()
+    with open(local_path, 'rb') as local_file:
+        for block in iter(lambda: local_file.read(1 << 20), b''):
+            checksum.update(block)
+    return checksum.hexdigest()
+
+
+def get_inventory():
+    """
+    This is for the command lines that download and ingest files, not for the web app
+
+    :return: Inventory: the inventory at INVENTORY_PATH, None if the environment variable is not set
+    """
+    store_path = os.getenv('INVENTORY_PATH')
+    return Inventory(store_path) if store_path else None
@@ -0,0 +1,159 @@
+"""
+Structured (JSON lines) logging, that stays off the request and ingest paths.
+
+Records are put on a bounded in-memory queue and written by a background thread; when the queue is full, records are
+dropped rather than blocking the caller. Levels are configured per module through environment variables:
+- LOG_LEVEL: default level, e.g., INFO
+- LOG_LEVELS: per logger levels, e.g., `intent=DEBUG,api.ingest=WARNING`
+- LOG_PAYLOAD_SAMPLE_RATE: fraction of request/response payloads logged by `log_payload`, e.g., 0.01
+- LOG_PAYLOAD_MAX_CHARS: payloads longer than this are truncated
+"""
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+
+""" Attributes every log record has, anything else was given through `extra` """
+_RECORD_ATTRIBUTES = set(logging.LogRecord('', logging.INFO, '', 0, '', (), None).__dict__.keys()) | {'message'}
+
+_queue_handler = None
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.utcfromtimestamp(record.created).isoformat() + 'Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'process': record.process,
+            'message': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """ Never blocks the caller: a record that does not fit in the queue is dropped """
+
+    def __init__(self, record_queue):
+        super().__init__(record_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped = self.dropped + 1
+
+    def prepare(self, record):
+        # Keep the exception out of the message, the formatter of the listener writes it in its own field
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        return record
+
+
+def configure_logging(default_level=None, levels=None, max_queue_size=10000, stream=None):
+    """
+    This installs the non-blocking JSON logging on the root logger. Calling it again has no effect.
+
+    :param default_level: str: defaults to the environment variable LOG_LEVEL, or INFO
+    :param levels: str: per logger levels, e.g., `intent=DEBUG,api.ingest=WARNING`, defaults to LOG_LEVELS
+    :param max_queue_size: int: maximum number of records waiting to be written
+    :param stream: where records are written, defaults to stderr
+    :return: None
+    """
+    global _queue_handler
+
+    if _queue_handler is not None:
+        return
+
+    root = logging.getLogger()
+    root.setLevel(default_level or os.getenv('LOG_LEVEL', 'INFO'))
+    for logger_name, level in _parse_levels(levels if levels is not None else os.getenv('LOG_LEVELS', '')):
+        logging.getLogger(logger_name).setLevel(level)
+
+    output_handler = logging.StreamHandler(stream if stream is not None else sys.stderr)
+    output_handler.setFormatter(JsonFormatter())
+
+    _queue_handler = _DroppingQueueHandler(queue.Queue(maxsize=max_queue_size))
+    root.addHandler(_queue_handler)
+    _start_listener([output_handler])
+    atexit.register(stop_logging)
+
+    # The writer thread does not survive a fork (e.g., gunicorn preloading the app): forked processes start their own
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=lambda: _restart_listener(max_queue_size))
+
+
+def _start_listener(output_handlers):
+    global _listener
+
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, *output_handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def _restart_listener(max_queue_size):
+    if _listener is None:
+        return
+    output_handlers = list(_listener.handlers)
+    _queue_handler.queue = queue.Queue(maxsize=max_queue_size)
+    _start_listener(output_handlers)
+
+
+def stop_logging():
+    """
+    This writes out the records still queued, it's called when the process exits
+
+    :return: None
+    """
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def log_payload(logger, message, payload, level=logging.DEBUG):
+    """
+    This logs a request or response payload; only a sample of them is logged, truncated to a maximum size.
+    Nothing is serialized when the payload is not logged.
+
+    :param logger: Logger
+    :param message: str
+    :param payload: a str or a JSON-serializable object
+    :param level: int
+    :return: None
+    """
+    if not logger.isEnabledFor(level):
+        return
+    if random.random() >= float(os.getenv('LOG_PAYLOAD_SAMPLE_RATE', '0.01')):
+        return
+
+    text = payload if isinstance(payload, str) else json.dumps(payload, default=str)
+    max_chars = int(os.getenv('LOG_PAYLOAD_MAX_CHARS', '2000'))
+    if len(text) > max_chars:
+        text = '%s...(%d chars)' % (text[:max_chars], len(text))
+    logger.log(level, message, extra={'payload': text})
+
+
+def _parse_levels(levels):
+    for item in levels.split(','):
+        if '=' in item:
+            logger_name, level = item.split('=', 1)
+            yield logger_name.strip(), level.strip().upper()
@@ -0,0 +1,81 @@
+"""
+Prometheus metrics of the weather API: latency of each intent and each processing stage, cache hits, errors and
+requests in flight.
+
+With several gunicorn workers, the environment variable `prometheus_multiproc_dir` must point to an empty folder
+before the processes start; every worker then writes its metrics there, and `/metrics` aggregates them.
+"""
+import os
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, \
+    generate_latest
+from prometheus_client import multiprocess
+
+""" Stages timed by `STAGE_LATENCY` """
+STAGE_CITY_LOOKUP = 'city_lookup'
+STAGE_STATION_LOOKUP = 'station_lookup'
+STAGE_DATASET_OPEN = 'dataset_open'
+STAGE_S3_FETCH = 's3_fetch'
+STAGE_RENDER = 'render'
+STAGE_SERIALIZE = 'serialize'
+
+REQUEST_LATENCY = Histogram('oikolab_request_latency_seconds', 'Time to answer a request, per endpoint',
+                            ['endpoint'])
+INTENT_LATENCY = Histogram('oikolab_intent_latency_seconds', 'Time to answer a DialogFlow intent, per intent',
+                           ['intent'])
+STAGE_LATENCY = Histogram('oikolab_stage_latency_seconds', 'Time spent in a processing stage, per stage',
+                          ['stage'])
+CACHE_REQUESTS = Counter('oikolab_cache_requests_total', 'Cache lookups, per cache and result (hit or miss)',
+                         ['cache', 'result'])
+REQUEST_ERRORS = Counter('oikolab_request_errors_total', 'Requests answered with an error, per endpoint and status',
+                         ['endpoint', 'status'])
+DEGRADED_ANSWERS = Counter('oikolab_degraded_answers_total', 'Intents answered with a fallback, per intent and reason',
+                           ['intent', 'reason'])
+IN_FLIGHT = Gauge('oikolab_requests_in_flight', 'Requests being answered, per endpoint', ['endpoint'],
+                  multiprocess_mode='livesum')
+
+
+def time_stage(stage):
+    """
+    This times a processing stage, e.g., `with time_stage(STAGE_RENDER):`
+
+    :param stage: str: one of the `STAGE_*` constants
+    :return: context manager, also usable as a decorator
+    """
+    return STAGE_LATENCY.labels(stage).time()
+
+
+def count_cache_lookup(cache, hit):
+    """
+    This counts a cache lookup, the hit ratio of a cache is `hit / (hit + miss)`
+
+    :param cache: str: name of the cache
+    :param hit: bool
+    :return: None
+    """
+    CACHE_REQUESTS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def generate_metrics():
+    """
+    This returns the metrics of all the processes, in the Prometheus text format
+
+    :return: a pair: the metrics (bytes), and their content type
+    """
+    if 'prometheus_multiproc_dir' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid):
+    """
+    This removes the live gauges of a process that exited, so they are no longer aggregated
+
+    :param pid: int
+    :return: None
+    """
+    if 'prometheus_multiproc_dir' in os.environ:
+        multiprocess.mark_process_dead(pid)
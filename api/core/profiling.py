@@ -0,0 +1,195 @@
+"""
+Opt-in profiling of Flask requests, to find out why a particular `/intent` or `/weather` call is slow.
+
+A profiled request runs under cProfile, and its profile is written to `PROFILE_DIR/<request id>.prof`: read it with
+`python -m pstats`, or a viewer such as snakeviz. The request id is taken from the `X-Request-Id` header, or generated,
+and returned in the `X-Request-Id` header of the response.
+
+Requests are profiled when:
+- a fraction of them is sampled, through the environment variable PROFILE_SAMPLE_RATE, e.g., 0.01 (0 by default)
+- they have the header `X-Profile: 1`, and the shared secret of the environment variable DEBUG_TOKEN in the header
+  `X-Debug-Token`; without DEBUG_TOKEN (the default), requests cannot ask to be profiled
+
+The view of the slowest requests (`/debug/slowest`) also needs the `X-Debug-Token` header, as it shows request paths
+and ids.
+
+When no request is profiled, the cost is a header lookup and a timer per request: the duration of every request is
+kept, for a rolling view of the slowest requests of the process (see `SlowestRequests`).
+
+cProfile only sees the thread serving the request, not work handed over to other threads (e.g., by `Deadline`).
+"""
+import cProfile
+import heapq
+import hmac
+import logging
+import os
+import random
+import re
+import threading
+import time
+import uuid
+
+from flask import g, request
+
+PROFILE_HEADER = 'X-Profile'
+DEBUG_TOKEN_HEADER = 'X-Debug-Token'
+REQUEST_ID_HEADER = 'X-Request-Id'
+
+logger = logging.getLogger(__name__)
+
+
+class SlowestRequests:
+
+    def __init__(self, size=20, window=3600):
+        """
+        Constructor
+
+        :param size: int: number of requests kept
+        :param window: float: seconds a request is kept for
+        """
+        self.size = size
+        self.window = window
+        self._heap = []
+        self._lock = threading.Lock()
+
+    def add(self, duration, request_id, method, path, profile_file=None):
+        """
+        :param duration: float: seconds
+        :param request_id: str
+        :param method: str: e.g., POST
+        :param path: str: e.g., /intent
+        :param profile_file: str: the profile of the request, if it was profiled
+        :return: None
+        """
+        entry = (duration, time.time(), request_id, method, path, profile_file)
+        with self._lock:
+            self._expire()
+            if len(self._heap) < self.size:
+                heapq.heappush(self._heap, entry)
+            elif duration > self._heap[0][0]:
+                heapq.heapreplace(self._heap, entry)
+
+    def get(self):
+        """
+        :return: List[dict]: the slowest requests of the window, the slowest first
+        """
+        with self._lock:
+            self._expire()
+            entries = sorted(self._heap, reverse=True)
+        return [{'duration_ms': round(duration * 1000, 3), 'time': finished, 'request_id': request_id,
+                 'method': method, 'path': path, 'profile_file': profile_file}
+                for duration, finished, request_id, method, path, profile_file in entries]
+
+    def _expire(self):
+        oldest = time.time() - self.window
+        if any(entry[1] < oldest for entry in self._heap):
+            self._heap = [entry for entry in self._heap if entry[1] >= oldest]
+            heapq.heapify(self._heap)
+
+
+class RequestProfiler:
+
+    def __init__(self, profile_dir=None, sample_rate=None, debug_token=None, max_files=None, slowest=None):
+        """
+        Constructor, arguments default to their environment variables
+
+        :param profile_dir: str: where profiles are written, PROFILE_DIR
+        :param sample_rate: float: fraction of the requests profiled, PROFILE_SAMPLE_RATE
+        :param debug_token: str: shared secret of the requests allowed to ask to be profiled, or to see the slowest
+                            requests, DEBUG_TOKEN; nobody is allowed if it's empty
+        :param max_files: int: maximum number of profiles kept, the oldest are removed first, PROFILE_MAX_FILES
+        :param slowest: SlowestRequests
+        """
+        self.profile_dir = profile_dir or os.getenv('PROFILE_DIR', '/tmp/oikolab-profiles')
+        self.sample_rate = sample_rate if sample_rate is not None else float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+        self.debug_token = debug_token if debug_token is not None else os.getenv('DEBUG_TOKEN', '')
+        self.max_files = max_files if max_files is not None else int(os.getenv('PROFILE_MAX_FILES', '200'))
+        self.slowest = slowest if slowest is not None else SlowestRequests(
+            size=int(os.getenv('SLOWEST_REQUEST_COUNT', '20')),
+            window=float(os.getenv('SLOWEST_REQUEST_WINDOW', '3600')))
+
+    def init_app(self, flask_app):
+        """
+        This times (and profiles, when asked to) every request of a Flask app
+
+        :param flask_app: Flask
+        :return: None
+        """
+        flask_app.before_request(self._start)
+        flask_app.after_request(self._stop)
+        flask_app.teardown_request(self._tear_down)
+
+    def is_authorized(self):
+        """
+        :return: bool: whether the current request has the debug token
+        """
+        if not self.debug_token:
+            return False
+        return hmac.compare_digest(request.headers.get(DEBUG_TOKEN_HEADER, '').encode('utf-8'),
+                                   self.debug_token.encode('utf-8'))
+
+    def _start(self):
+        g.profiling_start = time.perf_counter()
+        if self._is_profiled():
+            profile = cProfile.Profile()
+            g.profile = profile
+            profile.enable()
+
+    def _stop(self, response):
+        start = g.pop('profiling_start', None)
+        if start is None:
+            return response
+
+        profile = g.pop('profile', None)
+        if profile is not None:
+            profile.disable()
+        duration = time.perf_counter() - start
+
+        request_id = _get_request_id(request.headers.get(REQUEST_ID_HEADER))
+        profile_file = None
+        if profile is not None:
+            profile_file = self._write(profile, request_id)
+            response.headers[REQUEST_ID_HEADER] = request_id
+        self.slowest.add(duration, request_id, request.method, request.path, profile_file)
+        return response
+
+    def _tear_down(self, exception):
+        # a request that failed before `_stop` must not leave the profiler running on the thread
+        profile = g.pop('profile', None)
+        if profile is not None:
+            profile.disable()
+
+    def _is_profiled(self):
+        if request.headers.get(PROFILE_HEADER) == '1' and self.is_authorized():
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def _write(self, profile, request_id):
+        try:
+            if not os.path.exists(self.profile_dir):
+                os.makedirs(self.profile_dir, exist_ok=True)
+            profile_file = os.path.join(self.profile_dir, '%s.prof' % request_id)
+            profile.dump_stats(profile_file)
+            self._evict()
+            return profile_file
+        except OSError:
+            logger.exception('Failed to write the profile of request %s', request_id)
+            return None
+
+    def _evict(self):
+        """ Removes the oldest profiles, until the folder is within its bound """
+        entries = [(entry.stat().st_mtime, entry.path) for entry in os.scandir(self.profile_dir)
+                   if entry.is_file() and entry.name.endswith('.prof')]
+        entries.sort()
+        for _, path in entries[:max(0, len(entries) - self.max_files)]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def _get_request_id(header_value):
+    """ Request ids become file names: only ids made of letters, digits, `-` and `_` are kept """
+    if header_value and re.match(r'^[A-Za-z0-9_-]{1,64}$', header_value):
+        return header_value
+    return uuid.uuid4().hex
@@ -0,0 +1,463 @@
+"""
+Storage backends, where weather files are read from and written to:
+- LocalStorage: the local file system, including file systems mounted from S3 (e.g., s3fs under /s3bucket/)
+- S3Storage: an S3 bucket, through one boto3 client shared by the whole process
+- MemoryStorage: an in-memory stand-in, for tests and benchmarks; `memory://name/` prefixes with the same name share
+  one storage within a process
+
+All backends address objects by a path, e.g., `processed/2017/2017-01-usa_new_york.nc`.
+
+The S3 client is configured through environment variables:
+- AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY
+- S3_ENDPOINT_URL: to use an S3 compatible stand-in, e.g., MinIO or moto, instead of AWS
+- S3_UNSIGNED: `true` (default) to send anonymous requests
+- S3_MAX_POOL_CONNECTIONS: size of the connection pool shared by all threads
+"""
+import concurrent.futures
+import contextlib
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+
+""" Suffix of the lock files `LocalStorage.lock` creates next to objects; they are not objects themselves """
+LOCK_SUFFIX = '.lock'
+
+""" Suffix of the files `LocalStorage` writes aside, before renaming them to the object """
+TEMP_SUFFIX = '.tmp'
+
+
+class Storage:
+
+    def exists(self, path):
+        """
+        :param path: str
+        :return: bool: whether an object exists at the path
+        """
+        raise NotImplementedError()
+
+    def is_folder(self, path):
+        """
+        :param path: str: ends with `/`
+        :return: bool: whether any object is stored under the path
+        """
+        raise NotImplementedError()
+
+    def makedirs(self, path):
+        """
+        This creates a folder, if the backend has folders
+
+        :param path: str
+        :return: None
+        """
+        pass
+
+    def list(self, prefix):
+        """
+        :param prefix: str: a folder, ending with `/`
+        :return: List[str]: names of the objects directly under the folder
+        """
+        raise NotImplementedError()
+
+    def size(self, path):
+        """
+        :param path: str
+        :return: int: size of the object in bytes
+        """
+        raise NotImplementedError()
+
+    def walk(self, prefix):
+        """
+        This lists every object under a folder, and its sub-folders, at once
+
+        :param prefix: str: a folder, ending with `/`
+        :return: iterator of (path, size in bytes, modification time, checksum or None)
+        """
+        raise NotImplementedError()
+
+    def read(self, path):
+        """
+        :param path: str
+        :return: bytes
+        """
+        raise NotImplementedError()
+
+    def read_range(self, path, start, end):
+        """
+        :param path: str
+        :param start: int: first byte (inclusive)
+        :param end: int: last byte (exclusive)
+        :return: bytes
+        """
+        return self.read(path)[start:end]
+
+    def read_ranges(self, path, ranges):
+        """
+        :param path: str
+        :param ranges: List[(int, int)]: (start, end) pairs, as in `read_range`
+        :return: List[bytes]
+        """
+        return [self.read_range(path, start, end) for start, end in ranges]
+
+    def write(self, path, data):
+        """
+        :param path: str
+        :param data: bytes
+        :return: None
+        """
+        raise NotImplementedError()
+
+    def upload(self, local_path, path):
+        """
+        :param local_path: str: file on the local file system
+        :param path: str: where it shall be stored
+        :return: None
+        """
+        with open(local_path, 'rb') as local_file:
+            self.write(path, local_file.read())
+
+    @contextlib.contextmanager
+    def open_local_path(self, path):
+        """
+        This gives a local file to write an object to, e.g., by xarray; it's stored once the block exits without error:
+        `with storage.open_local_path(path) as local_path:`
+
+        :param path: str: where the object shall be stored
+        :return: context manager giving a str
+        """
+        local_path = _get_temporary_path(path)
+        try:
+            yield local_path
+            self.upload(local_path, path)
+        finally:
+            self.release_local_path(local_path)
+
+    def get_local_path(self, path):
+        """
+        This returns a local file with the content of the object, e.g., to be opened by xarray.
+        Backends that are not on the local file system download it to a temporary folder.
+
+        :param path: str
+        :return: str
+        """
+        local_path = _get_temporary_path(path)
+        with open(local_path, 'wb') as local_file:
+            local_file.write(self.read(path))
+        return local_path
+
+    def release_local_path(self, local_path):
+        """
+        This removes a file returned by `get_local_path`, once it's no longer used
+
+        :param local_path: str
+        :return: None
+        """
+        shutil.rmtree(os.path.dirname(local_path), ignore_errors=True)
+
+    @contextlib.contextmanager
+    def lock(self, path):
+        """
+        This holds an exclusive lock on an object, across processes, e.g., while it's read, modified and written back:
+        `with storage.lock(path):`. Backends without locks do not lock.
+
+        :param path: str
+        :return: context manager
+        """
+        yield
+
+
+class LocalStorage(Storage):
+
+    def exists(self, path):
+        return os.path.isfile(path)
+
+    def is_folder(self, path):
+        return os.path.isdir(path)
+
+    def makedirs(self, path):
+        if not os.path.exists(path):
+            os.makedirs(path, exist_ok=True)
+
+    def list(self, prefix):
+        if not os.path.isdir(prefix):
+            return []
+        return os.listdir(prefix)
+
+    def size(self, path):
+        return os.path.getsize(path)
+
+    def walk(self, prefix):
+        # checksums would mean reading every file: they are left out
+        for folder, _, names in os.walk(prefix):
+            for name in names:
+                if name.endswith(LOCK_SUFFIX) or name.endswith(TEMP_SUFFIX):
+                    continue
+                path = os.path.join(folder, name)
+                stat = os.stat(path)
+                yield path, stat.st_size, stat.st_mtime, None
+
+    def read(self, path):
+        with open(path, 'rb') as local_file:
+            return local_file.read()
+
+    def read_range(self, path, start, end):
+        with open(path, 'rb') as local_file:
+            local_file.seek(start)
+            return local_file.read(end - start)
+
+    def write(self, path, data):
+        with self.open_local_path(path) as temp_path:
+            with open(temp_path, 'wb') as local_file:
+                local_file.write(data)
+
+    def upload(self, local_path, path):
+        if os.path.abspath(local_path) != os.path.abspath(path):
+            self.makedirs(os.path.dirname(path) or '.')
+            shutil.copyfile(local_path, path)
+
+    @contextlib.contextmanager
+    def open_local_path(self, path):
+        # written aside, so a partially written file is never read; the name is unique to the call, as threads and
+        # processes may write the same object at once
+        # (mkstemp would create it readable by its owner only)
+        self.makedirs(os.path.dirname(path) or '.')
+        temp_path = '%s.%s%s' % (path, uuid.uuid4().hex, TEMP_SUFFIX)
+        try:
+            yield temp_path
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def get_local_path(self, path):
+        return path
+
+    def release_local_path(self, local_path):
+        pass
+
+    @contextlib.contextmanager
+    def lock(self, path):
+        # on a file next to the object
+        import fcntl
+
+        self.makedirs(os.path.dirname(path) or '.')
+        with open(path + LOCK_SUFFIX, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class MemoryStorage(Storage):
+
+    def __init__(self):
+        """Constructor"""
+        self.objects = {}
+        self._lock = threading.Lock()
+
+    def exists(self, path):
+        return path in self.objects
+
+    def is_folder(self, path):
+        return any(key.startswith(path) for key in list(self.objects))
+
+    def list(self, prefix):
+        names = set()
+        for key in list(self.objects):
+            if key.startswith(prefix) and '/' not in key[len(prefix):]:
+                names.add(key[len(prefix):])
+        return sorted(names)
+
+    def size(self, path):
+        return len(self._get(path))
+
+    def walk(self, prefix):
+        for path, data in list(self.objects.items()):
+            if path.startswith(prefix):
+                yield path, len(data), 0.0, hashlib.md5(data).hexdigest()
+
+    def read(self, path):
+        return self._get(path)
+
+    def write(self, path, data):
+        with self._lock:
+            self.objects[path] = bytes(data)
+
+    def _get(self, path):
+        try:
+            return self.objects[path]
+        except KeyError:
+            raise Exception(path + ' does not exist')
+
+
+class S3Storage(Storage):
+
+    def __init__(self, bucket, client=None):
+        """
+        Constructor
+
+        :param bucket: str
+        :param client: boto3 S3 client, defaults to the client shared by the process
+        """
+        self.bucket = bucket
+        self._client = client
+
+    @property
+    def client(self):
+        return self._client if self._client is not None else get_s3_client()
+
+    def exists(self, path):
+        import botocore.exceptions
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=path)
+            return True
+        except botocore.exceptions.ClientError as error:
+            if error.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def is_folder(self, path):
+        response = self.client.list_objects_v2(Bucket=self.bucket, Prefix=path, MaxKeys=1)
+        return response.get('KeyCount', 0) > 0
+
+    def list(self, prefix):
+        names = []
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix, Delimiter='/'):
+            for item in page.get('Contents', []):
+                names.append(item['Key'][len(prefix):])
+        return names
+
+    def size(self, path):
+        return self.client.head_object(Bucket=self.bucket, Key=path)['ContentLength']
+
+    def walk(self, prefix):
+        """ One listing request per 1000 objects; the ETag is the MD5 of objects uploaded in one part """
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for item in page.get('Contents', []):
+                yield item['Key'], item['Size'], item['LastModified'].timestamp(), item['ETag'].strip('"')
+
+    def read(self, path):
+        return self.client.get_object(Bucket=self.bucket, Key=path)['Body'].read()
+
+    def read_range(self, path, start, end):
+        response = self.client.get_object(Bucket=self.bucket, Key=path, Range='bytes=%d-%d' % (start, end - 1))
+        return response['Body'].read()
+
+    def read_ranges(self, path, ranges):
+        """ Ranges are fetched concurrently, over the pooled connections """
+        futures = [_get_executor().submit(self.read_range, path, start, end) for start, end in ranges]
+        return [future.result() for future in futures]
+
+    def write(self, path, data):
+        self.client.put_object(Bucket=self.bucket, Key=path, Body=data)
+
+    def upload(self, local_path, path):
+        self.client.upload_file(local_path, self.bucket, path, Config=_get_transfer_config())
+
+    def get_local_path(self, path):
+        local_path = _get_temporary_path(path)
+        self.client.download_file(self.bucket, path, local_path, Config=_get_transfer_config())
+        return local_path
+
+
+_s3_client = None
+_s3_client_pid = None
+_s3_client_lock = threading.Lock()
+_executor = None
+_memory_storages = {}
+_memory_storages_lock = threading.Lock()
+
+
+def get_s3_client():
+    """
+    This returns the boto3 S3 client shared by the process: its connections are pooled and reused across requests.
+    boto3 clients are thread-safe, but must not be shared across a fork, so a forked process creates its own.
+
+    :return: boto3 S3 client
+    """
+    global _s3_client, _s3_client_pid
+
+    if _s3_client is None or _s3_client_pid != os.getpid():
+        with _s3_client_lock:
+            if _s3_client is None or _s3_client_pid != os.getpid():
+                import boto3
+                import botocore
+                from botocore.config import Config
+
+                config_parameters = {'max_pool_connections': _get_max_pool_connections(),
+                                     'retries': {'max_attempts': 3}}
+                if os.getenv('S3_UNSIGNED', 'true').lower() == 'true':
+                    config_parameters['signature_version'] = botocore.UNSIGNED
+
+                _s3_client = boto3.client('s3', aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+                                          aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+                                          endpoint_url=os.getenv('S3_ENDPOINT_URL'),
+                                          config=Config(**config_parameters))
+                _s3_client_pid = os.getpid()
+    return _s3_client
+
+
+def _get_max_pool_connections():
+    return int(os.getenv('S3_MAX_POOL_CONNECTIONS', '32'))
+
+
+def _get_transfer_config():
+    from boto3.s3.transfer import TransferConfig
+
+    return TransferConfig(max_concurrency=min(10, _get_max_pool_connections()))
+
+
+def _get_executor():
+    global _executor
+
+    if _executor is None:
+        with _s3_client_lock:
+            if _executor is None:
+                _executor = concurrent.futures.ThreadPoolExecutor(max_workers=_get_max_pool_connections())
+    return _executor
+
+
+def _get_temporary_path(path):
+    folder = tempfile.mkdtemp(prefix='weather-')
+    return os.path.join(folder, os.path.basename(path.rstrip('/')) or 'object')
+
+
+def get_storage(prefix_path):
+    """
+    This returns the storage backend for a prefix path, and the path of the prefix within that backend
+
+    :param prefix_path: str: e.g., `/s3bucket/`, `s3://bucket/prefix/` or `memory://`
+    :return: a pair: Storage, and the path prefix (str) within the storage
+    """
+    if prefix_path.startswith('s3://'):
+        bucket, _, prefix = prefix_path[len('s3://'):].partition('/')
+        if not bucket:
+            raise Exception('data path is invalid')
+        return S3Storage(bucket), prefix
+
+    if prefix_path.startswith('memory://'):
+        prefix = prefix_path[len('memory://'):]
+        return get_memory_storage(prefix.partition('/')[0]), prefix
+
+    return LocalStorage(), prefix_path
+
+
+def get_memory_storage(name):
+    """
+    This returns the memory storage of a name, e.g., of `memory://name/`, shared by the process: a Preprocessor and a
+    WeatherService on the same prefix see each other's files
+
+    :param name: str
+    :return: MemoryStorage
+    """
+    with _memory_storages_lock:
+        storage = _memory_storages.get(name)
+        if storage is None:
+            storage = _memory_storages[name] = MemoryStorage()
+    return storage
@@ -1,15 +1,13 @@
 """
 This defines the file naming convention for naming and location of a weather file.
-WeatherFile operates in 2 modes: file, s3. If WeatherFile operates in S3, it assumes the environment includes ACCESS_KEY_ID,
-and SECRET_KEY information.
+WeatherFile locates files through a storage backend (see `storage.py`): the local file system (default), S3 when the
+prefix path starts with `s3://`, or memory when it starts with `memory://`. In S3, it assumes the environment includes
+ACCESS_KEY_ID, and SECRET_KEY information.
+With an inventory (see `inventory.py`), lookups of files are answered by the inventory rather than the storage. It's
+only used when given: the web app must not use one, as it would not see the files written by other machines.
 """
-import os
-from collections import deque
-
-import boto3
-import botocore
-from boto3.s3.transfer import TransferConfig
-from botocore.config import Config
+from api.core.inventory import IndexedStorage
+from api.core.storage import LocalStorage, S3Storage, MemoryStorage, get_storage
 
 
 class WeatherFile:
@@ -19,36 +17,56 @@ class WeatherFile:
     """in file mode, files are located through folder lookups """
     MODE_FILE = 'file'
 
-    def __init__(self, prefix_path: str):
+    """in memory mode, files are kept in memory, e.g., for tests and benchmarks """
+    MODE_MEMORY = 'memory'
+
+    def __init__(self, prefix_path: str, storage=None, inventory=None):
         """
         Constructor
 
         :param prefix_path: specifies the path where weather files are located, and shall be saved to
                             if the prefix path starts as `s3://`, then weather file will use the s3
-                            boto3 client to connect for locating files
+                            boto3 client to connect for locating files, e.g., `s3://bucket/prefix/`
+        :param storage: Storage: overrides the storage backend implied by the prefix path, in which case the
+                        prefix path is a path within the given storage
+        :param inventory: Inventory: answers lookups of files (see `inventory.py`), None to look them up in the storage
         """
         if not prefix_path.endswith('/'):
             prefix_path = prefix_path + '/'
 
-        self.mode = self.MODE_FILE
+        if storage is None:
+            storage, prefix_path = get_storage(prefix_path)
+
+        self.storage = IndexedStorage(storage, inventory) if inventory is not None else storage
+        self.inventory = inventory
         self.data_path = prefix_path
 
-        if prefix_path.startswith('s3://'):
+        if isinstance(storage, S3Storage):
             self.mode = WeatherFile.MODE_S3
-            data_paths = prefix_path.split('/')
-            if len(data_paths) < 2:
-                raise Exception('data path is invalid')
-            path_deque = deque(prefix_path)
-            self.bucket = path_deque.popleft()
-            self.data_path = '/'.join(path_deque)
-
-            TransferConfig(max_concurrency=5)
-            self.client = boto3.client('s3', aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-                                       aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-                                       config=Config(signature_version=botocore.UNSIGNED))
+            self.bucket = storage.bucket
+        elif isinstance(storage, MemoryStorage):
+            self.mode = WeatherFile.MODE_MEMORY
+        else:
+            self.mode = WeatherFile.MODE_FILE
+
+        # Object stores have no folders: paths are relative to the bucket root
+        if self.data_path == '/' and not isinstance(storage, LocalStorage):
+            self.data_path = ''
+
         """ File extension for reading original weather files """
         self.file_extension = 'grb'
 
+    def build_inventory(self, folder=None):
+        """
+        This lists every file under a folder at once, into the inventory: build only the folders looked up
+
+        :param folder: str: e.g., `get_original_folder(2017)`, defaults to the prefix path, i.e., every file
+        :return: int: number of files
+        """
+        if self.inventory is None:
+            raise Exception('There is no inventory')
+        return self.inventory.build(self.storage.storage, folder if folder is not None else self.data_path)
+
     def get_or_create_original_folder(self, year):
         """
         This retrieves the path to where original weather data shall be stored. It's per year.
@@ -57,8 +75,7 @@ class WeatherFile:
         :return: str
         """
         directory = "%s%s/" % (self.data_path, str(year))
-        if not os.path.exists(directory):
-            os.makedirs(directory)
+        self.storage.makedirs(directory)
 
         return directory
 
@@ -69,12 +86,10 @@ class WeatherFile:
         :param year: str
         :return: str
         """
-        if self.mode == WeatherFile.MODE_FILE:
-            directory = "%s%s/" % (self.data_path, str(year))
-            if not os.path.exists(directory):
-                raise Exception('Original file for %s cannot be found' % directory)
-            return directory
-
+        directory = "%s%s/" % (self.data_path, str(year))
+        if not self.storage.is_folder(directory):
+            raise Exception('Original file for %s cannot be found' % directory)
+        return directory
 
     def get_processed_file_name(self, year, month, iso3, city):
         """
@@ -120,7 +135,7 @@ class WeatherFile:
         """
         data_file = self.get_or_create_original_folder(year) + self.get_original_file_name(year, month, parameter_name)
 
-        if not os.path.isfile(data_file):
+        if not self.storage.exists(data_file):
             raise Exception(data_file + ' does not exist')
 
         return data_file
@@ -137,10 +152,43 @@ class WeatherFile:
         :return:
         """
         output_folder = '%s%s/%s/' % (self.data_path, 'processed', year)
-
-        if not os.path.exists(output_folder):
-            os.makedirs(output_folder)
+        self.storage.makedirs(output_folder)
 
         full_path = output_folder + self.get_processed_file_name(year, month, country_iso3,
                                                                  city_name.lower())
         return full_path
+
+    def get_series_file_name(self, year, iso3, city):
+        """
+        This returns the convention of a yearly series file, given a year, and country(iso3), and its city
+
+        :param year: int
+        :param iso3: str
+        :param city: str
+        :return: str
+        """
+        file_name = '%d-%s_%s.nc' % (year, iso3, city)
+        file_name = file_name.replace(' ', '_').lower()
+        return file_name
+
+    def get_series_data_set_path(self, year, country_iso3, city_name):
+        """
+        This returns the path of the yearly series of a city, appended to month by month (see `city_series.py`).
+        Folders are not created: the series may not exist yet.
+
+        :param year: int
+        :param country_iso3: str
+        :param city_name: str
+        :return: str
+        """
+        return '%sseries/%s/%s' % (self.data_path, year, self.get_series_file_name(year, country_iso3, city_name))
+
+    def get_validation_report_path(self, year, month):
+        """
+        This returns the path of the validation report of the original files of a month (see `validation.py`)
+
+        :param year: int
+        :param month: int
+        :return: str
+        """
+        return '%svalidation/%d/%d-%02d.json' % (self.data_path, year, year, month)
@@ -2,6 +2,38 @@
 A simple parameter class to guard all knowledge about the parameters processed by this weather API
 """
 
+import collections
+
+""" What's known about a parameter: the name of its variable in ERA5 files, its units, the range of its valid values,
+and the precision it's stored with """
+ParameterMetadata = collections.namedtuple('ParameterMetadata', ['short_name', 'units', 'minimum', 'maximum',
+                                                                 'precision'])
+
+_METADATA = {
+    '2m_dewpoint_temperature': ParameterMetadata('d2m', 'K', 180.0, 340.0, 0.01),
+    '2m_temperature': ParameterMetadata('t2m', 'K', 180.0, 340.0, 0.01),
+    '10m_v_component_of_wind': ParameterMetadata('v10', 'm s**-1', -100.0, 100.0, 0.01),
+    '10m_u_component_of_wind': ParameterMetadata('u10', 'm s**-1', -100.0, 100.0, 0.01),
+    'cloud_base_height': ParameterMetadata('cbh', 'm', 0.0, 30000.0, 1.0),
+    'snow_depth': ParameterMetadata('sd', 'm of water equivalent', 0.0, 15.0, 0.001),
+    'snowfall': ParameterMetadata('sf', 'm of water equivalent', 0.0, 0.05, 0.000001),
+    'snow_density': ParameterMetadata('rsn', 'kg m**-3', 0.0, 1000.0, 0.1),
+    'soil_temperature_level_1': ParameterMetadata('stl1', 'K', 180.0, 350.0, 0.01),
+    'soil_temperature_level_2': ParameterMetadata('stl2', 'K', 180.0, 350.0, 0.01),
+    'soil_temperature_level_3': ParameterMetadata('stl3', 'K', 180.0, 350.0, 0.01),
+    'soil_temperature_level_4': ParameterMetadata('stl4', 'K', 180.0, 350.0, 0.01),
+    'surface_pressure': ParameterMetadata('sp', 'Pa', 40000.0, 110000.0, 2.0),
+    'downward_uv_radiation_at_the_surface': ParameterMetadata('uvb', 'J m**-2', 0.0, 500000.0, 10.0),
+    'surface_solar_radiation_downwards': ParameterMetadata('ssrd', 'J m**-2', 0.0, 6000000.0, 100.0),
+    'surface_thermal_radiation_downwards': ParameterMetadata('strd', 'J m**-2', 0.0, 3000000.0, 50.0),
+    'total_cloud_cover': ParameterMetadata('tcc', '(0 - 1)', 0.0, 1.0, 0.0001),
+    'total_precipitation': ParameterMetadata('tp', 'm', 0.0, 0.5, 0.00001),
+    'total_column_rain_water': ParameterMetadata('tcrw', 'kg m**-2', 0.0, 50.0, 0.001),
+    'total_sky_direct_solar_radiation_at_surface': ParameterMetadata('fdir', 'J m**-2', 0.0, 6000000.0, 100.0),
+    'total_column_water_vapour': ParameterMetadata('tcwv', 'kg m**-2', 0.0, 150.0, 0.01),
+    'forecast_albedo': ParameterMetadata('fal', '(0 - 1)', 0.0, 1.0, 0.0001),
+}
+
 
 class WeatherParameter:
 
@@ -35,3 +67,26 @@ class WeatherParameter:
                 'total_column_water_vapour',
                 'forecast_albedo'
                 ]
+
+    @staticmethod
+    def get_short_name(parameter):
+        """
+        This returns the name of the variable holding a parameter in ERA5 files, e.g., `t2m` for `2m_temperature`
+
+        :param parameter: str
+        :return: str
+        """
+        return WeatherParameter.get_metadata(parameter).short_name
+
+    @staticmethod
+    def get_metadata(parameter):
+        """
+        This returns the units, valid range and storage precision of a parameter
+
+        :param parameter: str
+        :return: ParameterMetadata
+        """
+        try:
+            return _METADATA[parameter]
+        except KeyError:
+            raise Exception('Unknown parameter: %s' % parameter)
@@ -0,0 +1,103 @@
+"""
+Yearly time series of a city, grown by one month at a time as new ERA5 months are ingested, rather than re-assembled
+from the monthly files on every read.
+
+A series is a NetCDF file with an unlimited `time` dimension, stored as processed files are (see `encoding.py`): a month
+is appended as new chunks, without decoding or re-encoding the records already there. The append is made to a copy of
+the series, which then replaces it at once (an `os.replace`, or a single object upload), so a reader opening the series
+sees either the previous or the extended series, never a partially appended one.
+
+Appends to a series are serialized by a file lock on the local file system. Object stores have no locks: appends to the
+same series must not run concurrently there, nor out of order: the ingest queue runs the append tasks of a city shard
+one at a time, in the order they were enqueued (see `ingest_worker.py`).
+"""
+import logging
+import shutil
+
+import numpy as np
+
+from api.ingest.encoding import PROCESSED_FORMAT, encode, to_masked_array
+
+logger = logging.getLogger(__name__)
+
+
+def append_to_series(storage, path, data_set):
+    """
+    This appends a month of a city to its series, creating the series if it does not exist yet.
+    Appending a month already in the series does nothing, so a failed ingest can be run again.
+
+    :param storage: Storage
+    :param path: str: path of the series, e.g., from `WeatherFile.get_series_data_set_path`
+    :param data_set: xarray.Dataset: the month, with a decoded `time` dimension, as made by `Preprocessor`
+    :return: bool: whether the month was appended
+    """
+    data_set, encoding = encode(data_set, unlimited_time=True)
+    with storage.lock(path):
+        if not storage.exists(path):
+            with storage.open_local_path(path) as local_path:
+                data_set.to_netcdf(local_path, mode='w', format=PROCESSED_FORMAT, unlimited_dims=['time'],
+                                   encoding=encoding)
+            logger.debug('Created %s', path)
+            return True
+
+        # fetched once: checked, then copied aside to be appended to
+        series_path = storage.get_local_path(path)
+        try:
+            if _is_appended(series_path, path, data_set):
+                logger.debug('%s already holds the month', path)
+                return False
+
+            with storage.open_local_path(path) as local_path:
+                shutil.copyfile(series_path, local_path)
+                append_records(local_path, data_set)
+        finally:
+            storage.release_local_path(series_path)
+        logger.debug('Appended to %s', path)
+        return True
+
+
+def _is_appended(local_path, path, data_set):
+    """ Whether the months of the data set are in the series; months must be appended in order """
+    import netCDF4
+
+    with netCDF4.Dataset(local_path, 'r') as series:
+        times = series.variables['time']
+        new_times = _encode_times(data_set, times)
+        if len(times) == 0 or new_times[0] > times[-1]:
+            return False
+        if np.isin(new_times, times[:]).all():
+            return True
+        raise Exception('%s ends on %s: months must be appended in order'
+                        % (path, netCDF4.num2date(times[-1], times.units, getattr(times, 'calendar', 'standard'))))
+
+
+def append_records(local_path, data_set):
+    """
+    This appends the records of a data set to a NetCDF file with an unlimited `time` dimension, packed as the file is
+
+    :param local_path: str
+    :param data_set: xarray.Dataset: with a decoded `time` dimension, and variables of the file
+    :return: None
+    """
+    import netCDF4
+
+    with netCDF4.Dataset(local_path, 'a') as series:
+        time_variables = [name for name in data_set.data_vars if 'time' in data_set[name].dims]
+        missing = [name for name in time_variables if name not in series.variables]
+        if missing:
+            raise Exception('%s has no variables %s' % (local_path, ', '.join(missing)))
+
+        times = series.variables['time']
+        start = len(times)
+        end = start + data_set.sizes['time']
+        for name in time_variables:
+            # packed by netCDF4 with the scale factor and offset of the series
+            series.variables[name][start:end] = to_masked_array(data_set[name].values)
+        times[start:end] = _encode_times(data_set, times)
+
+
+def _encode_times(data_set, times):
+    import netCDF4
+
+    dates = data_set.indexes['time'].to_pydatetime()
+    return np.asarray(netCDF4.date2num(dates, times.units, getattr(times, 'calendar', 'standard')))
@@ -0,0 +1,116 @@
+"""
+How processed files are stored: each variable is packed into int16, with the precision and valid range of its parameter
+(see `ParameterMetadata`), and compressed.
+
+A packed value is `add_offset + scale_factor * stored`: the scale factor is the precision of the parameter, and the
+offset the middle of its valid range. They are the same for every file of a parameter, so files of different months or
+cities can be concatenated, and appended to, without repacking.
+
+Processed files are read a whole month or year at a time (e.g., by `/weather`): the time dimension is stored in chunks
+of a month of hours, each compressed on its own.
+"""
+import logging
+
+import numpy as np
+
+from api.core.derived_parameter import DerivedParameter
+from api.core.weather_parameter import WeatherParameter
+
+logger = logging.getLogger(__name__)
+
+""" Format of the processed files: the NetCDF4 (HDF5) format has compression and chunking """
+PROCESSED_FORMAT = 'NETCDF4'
+
+""" Number of hourly time steps in a chunk: a month of 31 days """
+CHUNK_HOURS = 744
+
+""" zlib compression level, from 1 (fastest) to 9 (smallest) """
+COMPRESSION_LEVEL = 4
+
+""" Stored value marking a missing value; the other int16 values hold the valid range """
+FILL_VALUE = -32767
+
+""" Time encoding of the processed files, as in the ERA5 files """
+TIME_UNITS = 'hours since 1900-01-01 00:00:00.0'
+TIME_CALENDAR = 'gregorian'
+
+_metadata_by_variable = None
+
+
+def get_metadata_by_variable():
+    """
+    :return: dict: the ParameterMetadata of each variable of processed files, derived or not, by variable name
+    """
+    global _metadata_by_variable
+
+    if _metadata_by_variable is None:
+        parameters = [WeatherParameter.get_metadata(parameter) for parameter in WeatherParameter.get_all_parameters()]
+        parameters += [DerivedParameter.get_metadata(parameter) for parameter in DerivedParameter.get_all_parameters()]
+        _metadata_by_variable = {metadata.short_name: metadata for metadata in parameters}
+    return _metadata_by_variable
+
+
+def get_packed_encoding(metadata):
+    """
+    :param metadata: ParameterMetadata
+    :return: dict: the encoding of a variable holding the parameter, as in `to_netcdf(encoding=...)`
+    """
+    steps = (metadata.maximum - metadata.minimum) / metadata.precision
+    if steps > 2 ** 16 - 4:
+        raise Exception('The range of %s does not fit int16 at a precision of %s' % (metadata.short_name,
+                                                                                   metadata.precision))
+    return {'dtype': 'int16', 'scale_factor': metadata.precision,
+            'add_offset': (metadata.maximum + metadata.minimum) / 2, '_FillValue': FILL_VALUE}
+
+
+def encode(data_set, unlimited_time=False):
+    """
+    This prepares a processed data set to be written: values are clipped to the valid range of their parameter, as
+    values out of it cannot be packed
+
+    :param data_set: xarray.Dataset: e.g., the month of a city
+    :param unlimited_time: bool: whether the time dimension is to be appended to, e.g., a series
+    :return: a pair: the clipped xarray.Dataset, and the encoding of its variables, to be written with
+             `to_netcdf(format=PROCESSED_FORMAT, encoding=...)`
+    """
+    metadata_by_variable = get_metadata_by_variable()
+    time_size = data_set.sizes.get('time', 0)
+    chunk_hours = CHUNK_HOURS if unlimited_time else max(1, min(CHUNK_HOURS, time_size))
+
+    clipped = {}
+    encoding = {}
+    for name in data_set.data_vars:
+        variable = data_set[name]
+        variable_encoding = {'zlib': True, 'complevel': COMPRESSION_LEVEL, 'shuffle': True}
+        if 'time' in variable.dims:
+            variable_encoding['chunksizes'] = tuple(chunk_hours if dim == 'time' else size
+                                                    for dim, size in zip(variable.dims, variable.shape))
+
+        metadata = metadata_by_variable.get(name)
+        if metadata is not None:
+            variable_encoding.update(get_packed_encoding(metadata))
+            out_of_range = int(((variable < metadata.minimum) | (variable > metadata.maximum)).sum())
+            if out_of_range:
+                logger.warning('Clipping %d values of %s out of [%s, %s]', out_of_range, name, metadata.minimum,
+                               metadata.maximum)
+                attrs = variable.attrs
+                variable = variable.clip(metadata.minimum, metadata.maximum)
+                variable.attrs = attrs
+                clipped[name] = variable
+        encoding[name] = variable_encoding
+
+    if 'time' in data_set.coords:
+        encoding['time'] = {'units': TIME_UNITS, 'calendar': TIME_CALENDAR, 'dtype': 'int32'}
+    if clipped:
+        data_set = data_set.assign(**clipped)
+    return data_set, encoding
+
+
+def to_masked_array(values):
+    """
+    :param values: numpy array, with NaN for missing values
+    :return: numpy masked array: for netCDF4 to store missing values as the fill value when it packs values
+    """
+    values = np.asarray(values)
+    missing = np.isnan(values)
+    return np.ma.array(np.where(missing, 0, values), mask=missing)
@@ -0,0 +1,136 @@
+"""
+Distributed ingest: the months to pre-process are split into tasks, one per (year, month, city shard), put on a shared
+`WorkQueue`. Workers, on any number of machines, claim tasks and run `Preprocessor.process` on their shard of cities.
+
+Each task reads every parameter of its month, as a processed file holds all the parameters of a city; a month is
+split by cities rather than by parameters. Backfills scale with the number of workers, up to the number of tasks.
+
+In append mode, tasks run `Preprocessor.append` instead, extending the yearly series of each city: as months of a series
+must be appended in order, one after the other, a task covers all the months of its shard of cities, and the tasks of a
+shard (e.g., enqueued as each month is released) are a group of the queue, run one at a time in the order they were
+added.
+"""
+import logging
+import threading
+import time
+import traceback
+
+from api.ingest.work_queue import get_worker_id
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_months(work_queue, year, months, shard_count, append=False):
+    """
+    This adds the tasks pre-processing the given months; tasks added before are not added again
+
+    :param work_queue: WorkQueue
+    :param year: int
+    :param months: List[int]
+    :param shard_count: int: number of tasks each month is split into
+    :param append: bool: whether the months are appended to the yearly series, one task per shard for all the months,
+                   after the tasks of the shard added before
+    :return: int: number of tasks added
+    """
+    months = sorted(months)
+    added = 0
+    if append:
+        for shard_index in range(shard_count):
+            key = '%d-%02d-%02d/%d-of-%d/append' % (year, months[0], months[-1], shard_index + 1, shard_count)
+            payload = {'year': year, 'months': months, 'shard_index': shard_index, 'shard_count': shard_count,
+                       'append': True}
+            group = '%d/%d-of-%d/append' % (year, shard_index + 1, shard_count)
+            if work_queue.add(key, payload, group=group):
+                added = added + 1
+        return added
+
+    for month in months:
+        for shard_index in range(shard_count):
+            key = '%d-%02d/%d-of-%d' % (year, month, shard_index + 1, shard_count)
+            payload = {'year': year, 'month': month, 'shard_index': shard_index, 'shard_count': shard_count}
+            if work_queue.add(key, payload):
+                added = added + 1
+    return added
+
+
+class IngestWorker:
+
+    def __init__(self, work_queue, preprocessor, worker_id=None):
+        """
+        Constructor
+
+        :param work_queue: WorkQueue
+        :param preprocessor: Preprocessor
+        :param worker_id: str, defaults to the host name and process id
+        """
+        self.work_queue = work_queue
+        self.preprocessor = preprocessor
+        self.worker_id = worker_id or get_worker_id()
+
+    def run(self, max_tasks=None, poll_interval=30):
+        """
+        This works on tasks until every task is done or failed. While the remaining tasks are leased by other workers,
+        it waits for them, in case one of them dies and its task has to be taken over.
+
+        :param max_tasks: int: maximum number of tasks worked on, None for no limit
+        :param poll_interval: float: seconds between checks for tasks to take over
+        :return: int: number of tasks completed
+        """
+        completed = 0
+        attempted = 0
+        while max_tasks is None or attempted < max_tasks:
+            task = self.work_queue.claim(self.worker_id)
+            if task is None:
+                if self.work_queue.is_finished():
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            attempted = attempted + 1
+            if self.run_task(task):
+                completed = completed + 1
+        return completed
+
+    def run_task(self, task):
+        """
+        This works on a task, renewing its lease until it's done
+
+        :param task: Task
+        :return: bool: whether the task was completed
+        """
+        logger.info('Worker %s starts %s (attempt %d)', self.worker_id, task.key, task.attempts)
+        stopped = threading.Event()
+        renewer = threading.Thread(target=self._renew_lease, args=(task, stopped), daemon=True)
+        renewer.start()
+
+        start = time.time()
+        error = None
+        try:
+            payload = dict(task.payload)
+            if payload.pop('append', False):
+                outputs = self.preprocessor.append(**payload)
+            else:
+                outputs = self.preprocessor.process(**payload)
+        except Exception:
+            logger.exception('Worker %s failed %s', self.worker_id, task.key)
+            error = traceback.format_exc(limit=5)
+        finally:
+            stopped.set()
+            renewer.join()
+
+        if error is not None:
+            self.work_queue.fail(task, error)
+            return False
+
+        if not self.work_queue.complete(task, outputs, time.time() - start):
+            logger.warning('Worker %s lost the lease of %s before completing it', self.worker_id, task.key)
+            return False
+        logger.info('Worker %s completed %s in %.1fs', self.worker_id, task.key, time.time() - start)
+        return True
+
+    def _renew_lease(self, task, stopped):
+        interval = self.work_queue.lease_seconds / 3.0
+        while not stopped.wait(interval):
+            if not self.work_queue.renew(task):
+                logger.warning('Worker %s no longer holds the lease of %s', self.worker_id, task.key)
+                return
@@ -5,65 +5,135 @@ for major cities and locations.
 This depends on `data/simplemaps-worldcities-basic.csv` to identify a set of major cities in the world.
 
 Generated files is structured as [year]/[month]/[year-month-variable]_era5.nc
+
+Processed files also hold the parameters derived from the ERA5 ones (see `derived_parameter.py`); their variables are
+packed and compressed (see `encoding.py`). The original files of a month are checked first (see `validation.py`).
+
+Months can also be appended to yearly series of each city, as they are released (see `city_series.py`).
 """
-import datetime
+import json
+import logging
 
 import xarray
 import numpy as np
 
 from api.city.city_service import CityService
+from api.core.derived_parameter import DerivedParameter
 from api.core.weather_file import WeatherFile
 from api.core.weather_parameter import WeatherParameter
+from api.ingest.city_series import append_to_series
+from api.ingest.encoding import PROCESSED_FORMAT, encode
+from api.ingest.validation import MonthValidator, check
+
+logger = logging.getLogger(__name__)
 
 
 class Preprocessor:
 
-    def __init__(self, data_path):
+    def __init__(self, data_path, city_service=None, validator=None, validate=True, inventory=None):
         """
 
         :param data_path: str specifies the root folder where weather file shall be located
+        :param city_service: CityService: the cities to process, defaults to the major cities in `data/`
+        :param validator: MonthValidator: checks of the original files, defaults to the checks of ERA5 files
+        :param validate: bool: whether original files are checked before cities are extracted from them
+        :param inventory: Inventory: where the files written are recorded (see `inventory.py`), if any
         """
         self.data_path = data_path
-        self.weather_file = WeatherFile(data_path)
-        self.city_service = CityService()
+        self.weather_file = WeatherFile(data_path, inventory=inventory)
+        self.city_service = city_service if city_service is not None else CityService()
+        self.validator = validator if validator is not None else MonthValidator()
+        self.validate = validate
 
-    def process(self, year, month):
+    def process(self, year, month, shard_index=0, shard_count=1):
         """
-        Pre-process the given year worth of weather data into a format that can be re-combined later
+        Pre-process the given year worth of weather data into a format that can be re-combined later.
+        Cities can be split into shards, processed independently, e.g., by different machines.
 
         :param year: int
         :param month: int
-        :return: None
+        :param shard_index: int: the shard processed, from 0 to shard_count - 1
+        :param shard_count: int: number of shards cities are split into, by their index in the city table
+        :return: List[str]: paths of the processed files
         """
-        city_list = self.city_service.get_city_coordinates()
+        return self._process_month(year, month, shard_index, shard_count, self._write_month)
+
+    def append(self, year, months, shard_index=0, shard_count=1):
+        """
+        Pre-process months into the yearly series of each city, extending them by one month at a time, rather than
+        into monthly files. Months are appended in order; months already in a series are skipped.
+
+        :param year: int
+        :param months: List[int]
+        :param shard_index: int: the shard processed, from 0 to shard_count - 1
+        :param shard_count: int: number of shards cities are split into, by their index in the city table
+        :return: List[str]: paths of the series
+        """
+        series_paths = set()
+        for month in sorted(months):
+            series_paths.update(self._process_month(year, month, shard_index, shard_count, self._append_month))
+        return sorted(series_paths)
+
+    def _process_month(self, year, month, shard_index, shard_count, save):
+        """
+        :param save: function(year, month, city, data_set) saving the data set of a city, and returning its path
+        :return: List[str]: paths of the saved files
+        """
+        city_table = self.city_service.get_city_table()
+        storage = self.weather_file.storage
+        local_paths = []
         data_sets = []
+        processed_paths = []
         try:
-            print('Processing files for %d-%2d in %s' % (year, month, self.data_path))
-            for parameter in WeatherParameter.get_all_parameters():
-                data_sets.append(self._get_netcdf_to_process(year, month, parameter))
+            logger.info('Processing files for %d-%02d (shard %d of %d) in %s', year, month, shard_index + 1,
+                        shard_count, self.data_path)
+            parameters = WeatherParameter.get_all_parameters()
+            for parameter in parameters:
+                data_file = self.weather_file.get_original_data_set_path(year, month, parameter)
+                local_paths.append(storage.get_local_path(data_file))
+                data_sets.append(xarray.open_dataset(local_paths[-1]))
+            if self.validate:
+                self._validate(year, month, dict(zip(parameters, data_sets)))
 
             count = 0
-            for city in city_list.itertuples():
+            for city in city_table:
+                if city.Index % shard_count != shard_index:
+                    continue
                 if count % 1000 == 0:
-                    print('Processed %s cities so far [%s]' % (count, datetime.datetime.now()))
-                city_by_month_ds = self._merge_by_city(city, data_sets)
-
-                full_path = self.weather_file.get_processed_data_set_path(year, month, city.iso3, city.city)
-                city_by_month_ds.to_netcdf(full_path, mode='w', compute=True)
+                    logger.info('Processed %s cities so far', count)
+                city_by_month_ds = DerivedParameter.add_to(self._merge_by_city(city, data_sets))
+                processed_paths.append(save(year, month, city, city_by_month_ds))
                 count = count + 1
         finally:
             for data_set in data_sets:
                 data_set.close()
-
-    def _get_netcdf_to_process(self, local_year, local_month, local_parameter):
-        data_file = self.weather_file.get_original_data_set_path(local_year, local_month, local_parameter)
-        ds = xarray.open_dataset(data_file)
-        return ds
+            for local_path in local_paths:
+                storage.release_local_path(local_path)
+        return processed_paths
+
+    def _validate(self, year, month, data_sets):
+        """ Writes the validation report of the month, and fails if any check failed """
+        report = self.validator.validate(year, month, data_sets)
+        report_path = self.weather_file.get_validation_report_path(year, month)
+        self.weather_file.storage.write(report_path, json.dumps(report, indent=2).encode('utf-8'))
+        check(report)
+
+    def _write_month(self, year, month, city, data_set):
+        full_path = self.weather_file.get_processed_data_set_path(year, month, city.iso3, city.city)
+        data_set, encoding = encode(data_set)
+        with self.weather_file.storage.open_local_path(full_path) as local_path:
+            data_set.to_netcdf(local_path, mode='w', format=PROCESSED_FORMAT, encoding=encoding, compute=True)
+        return full_path
+
+    def _append_month(self, year, month, city, data_set):
+        series_path = self.weather_file.get_series_data_set_path(year, city.iso3, city.city)
+        append_to_series(self.weather_file.storage, series_path, data_set)
+        return series_path
 
     def _merge_by_city(self, city, data_sets):
+        logger.debug('Merging %s', city.city)
         all_variables = []
         for data_set in data_sets:
-            print('merging %s' % city)
             lat = city.lat
             lon = city.lon
             if city.lon > 0:
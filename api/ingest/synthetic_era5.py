@@ -0,0 +1,215 @@
+"""
+This writes synthetic ECMWF ERA5 reanalysis files, shaped like the ones downloaded by `download_era5.py`, so ingest and
+serving can be exercised (and measured) without the real data sets or network access.
+
+Files follow the `WeatherFile` naming convention, and hold one variable named as in ERA5 (e.g., `t2m`), on a
+latitude (descending) / longitude (0 to 360, ascending) grid, with hourly time steps in hours since 1900-01-01, packed
+into int16 as in the files of the Copernicus Climate Data Store.
+
+To keep files small, the grid only holds the grid points around the selected cities: enough for `Preprocessor` to
+interpolate them. Values are deterministic for a given seed: a latitude gradient and a daily cycle, plus noise.
+"""
+import calendar
+import collections
+import csv
+import datetime
+import itertools
+import logging
+import os
+
+import numpy as np
+import xarray
+
+from api.city.city_service import CityService
+from api.core.weather_file import WeatherFile
+from api.core.weather_parameter import WeatherParameter
+
+logger = logging.getLogger(__name__)
+
+""" How values of a variable are made up: base + latitude_gradient * |latitude| + daily cycle + noise """
+SyntheticField = collections.namedtuple('SyntheticField', ['units', 'base', 'latitude_gradient', 'daily_amplitude',
+                                                           'noise', 'minimum', 'maximum'])
+
+SYNTHETIC_FIELDS = {
+    'd2m': SyntheticField('K', 288.0, -0.4, 3.0, 1.0, 190.0, 320.0),
+    't2m': SyntheticField('K', 300.0, -0.5, 5.0, 1.0, 190.0, 330.0),
+    'v10': SyntheticField('m s**-1', 0.0, 0.0, 1.0, 3.0, -40.0, 40.0),
+    'u10': SyntheticField('m s**-1', 0.0, 0.0, 1.0, 3.0, -40.0, 40.0),
+    'cbh': SyntheticField('m', 1500.0, 0.0, 300.0, 500.0, 0.0, 20000.0),
+    'sd': SyntheticField('m of water equivalent', 0.0, 0.001, 0.0, 0.01, 0.0, 10.0),
+    'sf': SyntheticField('m of water equivalent', 0.0, 0.0, 0.0, 0.0002, 0.0, 0.01),
+    'rsn': SyntheticField('kg m**-3', 200.0, 0.0, 0.0, 50.0, 100.0, 450.0),
+    'stl1': SyntheticField('K', 300.0, -0.4, 4.0, 0.5, 200.0, 340.0),
+    'stl2': SyntheticField('K', 300.0, -0.4, 2.0, 0.5, 200.0, 340.0),
+    'stl3': SyntheticField('K', 300.0, -0.4, 1.0, 0.5, 200.0, 340.0),
+    'stl4': SyntheticField('K', 300.0, -0.4, 0.5, 0.5, 200.0, 340.0),
+    'sp': SyntheticField('Pa', 98000.0, 0.0, 50.0, 1500.0, 50000.0, 110000.0),
+    'uvb': SyntheticField('J m**-2', 0.0, 0.0, 60000.0, 5000.0, 0.0, 200000.0),
+    'ssrd': SyntheticField('J m**-2', 0.0, 0.0, 2500000.0, 200000.0, 0.0, 5000000.0),
+    'strd': SyntheticField('J m**-2', 1300000.0, -5000.0, 100000.0, 50000.0, 0.0, 2500000.0),
+    'tcc': SyntheticField('(0 - 1)', 0.5, 0.0, 0.0, 0.3, 0.0, 1.0),
+    'tp': SyntheticField('m', 0.0, 0.0, 0.0, 0.0005, 0.0, 0.05),
+    'tcrw': SyntheticField('kg m**-2', 0.0, 0.0, 0.0, 0.1, 0.0, 10.0),
+    'fdir': SyntheticField('J m**-2', 0.0, 0.0, 2000000.0, 200000.0, 0.0, 4000000.0),
+    'tcwv': SyntheticField('kg m**-2', 40.0, -0.5, 0.0, 5.0, 0.0, 80.0),
+    'fal': SyntheticField('(0 - 1)', 0.1, 0.003, 0.0, 0.03, 0.0, 1.0),
+}
+
+""" Hour (local solar time) at which the daily cycle peaks """
+DAILY_PEAK_HOUR = 14
+
+_EPOCH = datetime.datetime(1900, 1, 1)
+
+
+class SyntheticEra5:
+
+    def __init__(self, data_path, resolution=0.25, days=2, city_count=100, margin=1, seed=0, city_service=None):
+        """
+        Constructor
+
+        :param data_path: str: where files are written, as a `WeatherFile` prefix path, e.g., `/tmp/era5/`
+        :param resolution: float: grid spacing in degrees, ERA5 is on a 0.25 degree grid
+        :param days: int: number of days in each monthly file, from the first of the month
+        :param city_count: int: number of cities covered by the grid, the most populated first
+        :param margin: int: number of grid points added around each city, in each direction
+        :param seed: int
+        :param city_service: CityService: where cities are taken from, defaults to the major cities in `data/`
+        """
+        self.weather_file = WeatherFile(data_path)
+        self.resolution = resolution
+        self.days = days
+        self.city_count = city_count
+        self.margin = margin
+        self.seed = seed
+        self.city_service = city_service if city_service is not None else CityService()
+        self._cities = None
+        self._coordinates = None
+
+    def get_cities(self):
+        """
+        :return: List[City]: the cities covered by the grid
+        """
+        if self._cities is None:
+            city_table = self.city_service.get_city_table()
+            self._cities = list(itertools.islice(city_table.by_population(), self.city_count))
+        return self._cities
+
+    def get_coordinates(self):
+        """
+        This returns the grid: the grid points around each city
+
+        :return: a pair: latitudes (descending) and longitudes (0 to 360, ascending), as float32 arrays
+        """
+        if self._coordinates is None:
+            cities = self.get_cities()
+            offsets = np.arange(-self.margin, self.margin + 2)
+            lats = np.array([city.lat for city in cities], dtype=np.float64)
+            lons = np.array([city.lon for city in cities], dtype=np.float64)
+
+            lat_points = (np.floor(lats / self.resolution)[:, None] + offsets) * self.resolution
+            lat_points = np.unique(np.clip(np.round(lat_points, 6), -90, 90))
+            lon_points = ((np.floor(lons / self.resolution)[:, None] + offsets) * self.resolution) % 360
+            lon_points = np.unique(np.round(lon_points, 6))
+
+            self._coordinates = lat_points[::-1].astype(np.float32), lon_points.astype(np.float32)
+        return self._coordinates
+
+    def get_hours(self, year, month):
+        """
+        :param year: int
+        :param month: int
+        :return: numpy array of int32: the time steps of a monthly file, in hours since 1900-01-01
+        """
+        days = min(self.days, calendar.monthrange(year, month)[1])
+        first_hour = int((datetime.datetime(year, month, 1) - _EPOCH).total_seconds() // 3600)
+        return np.arange(first_hour, first_hour + days * 24, dtype=np.int32)
+
+    def create_data_set(self, year, month, parameter):
+        """
+        This creates the synthetic data set of a parameter for a month
+
+        :param year: int
+        :param month: int
+        :param parameter: str: one of `WeatherParameter.get_all_parameters()`
+        :return: xarray.Dataset
+        """
+        short_name = WeatherParameter.get_short_name(parameter)
+        field = SYNTHETIC_FIELDS[short_name]
+        lats, lons = self.get_coordinates()
+        hours = self.get_hours(year, month)
+
+        # one random stream per file, so a file does not depend on which other files are written
+        parameter_index = WeatherParameter.get_all_parameters().index(parameter)
+        random_state = np.random.RandomState([self.seed, year, month, parameter_index])
+
+        local_hours = (hours % 24)[:, None, None] + lons[None, None, :] / 15.0
+        daily_cycle = np.cos(2 * np.pi * (local_hours - DAILY_PEAK_HOUR) / 24.0)
+        values = field.base + field.latitude_gradient * np.abs(lats)[None, :, None] \
+            + field.daily_amplitude * daily_cycle \
+            + field.noise * random_state.standard_normal((len(hours), len(lats), len(lons)))
+        values = np.clip(values, field.minimum, field.maximum).astype(np.float32)
+
+        data_set = xarray.Dataset(
+            {short_name: (('time', 'latitude', 'longitude'), values,
+                          {'units': field.units, 'long_name': parameter.replace('_', ' ')})},
+            coords={'longitude': ('longitude', lons, {'units': 'degrees_east', 'long_name': 'longitude'}),
+                    'latitude': ('latitude', lats, {'units': 'degrees_north', 'long_name': 'latitude'}),
+                    'time': ('time', hours, {'units': 'hours since 1900-01-01 00:00:00.0', 'long_name': 'time',
+                                             'calendar': 'gregorian'})},
+            attrs={'Conventions': 'CF-1.6', 'history': 'synthetic ERA5 data, seed %d' % self.seed})
+        return data_set
+
+    def write(self, year, month, parameters=None):
+        """
+        This writes the files of a month
+
+        :param year: int
+        :param month: int
+        :param parameters: List[str], defaults to all the parameters
+        :return: List[str]: paths of the files written
+        """
+        if parameters is None:
+            parameters = WeatherParameter.get_all_parameters()
+
+        storage = self.weather_file.storage
+        folder = self.weather_file.get_or_create_original_folder(year)
+        paths = []
+        for parameter in parameters:
+            data_set = self.create_data_set(year, month, parameter)
+            path = folder + self.weather_file.get_original_file_name(year, month, parameter)
+            with storage.open_local_path(path) as local_path:
+                data_set.to_netcdf(local_path, mode='w', format='NETCDF3_64BIT',
+                                   encoding={name: _get_packed_encoding(data_set[name].values)
+                                             for name in data_set.data_vars})
+            logger.debug('Wrote %s', path)
+            paths.append(path)
+        return paths
+
+    def write_cities(self, data_path, data_file='simplemaps-worldcities-basic.csv'):
+        """
+        This writes the cities covered by the grid as a city CSV, e.g., for `CityService(data_path)`
+
+        :param data_path: str: a local folder
+        :param data_file: str
+        :return: str: path of the CSV
+        """
+        if not os.path.exists(data_path):
+            os.makedirs(data_path, exist_ok=True)
+
+        csv_path = os.path.join(data_path, data_file)
+        with open(csv_path, 'w', newline='', encoding='utf-8') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(['city', 'city_ascii', 'lat', 'lng', 'pop', 'country', 'iso2', 'iso3', 'province'])
+            for city in self.get_cities():
+                writer.writerow([city.city, city.city_ascii, city.lat, city.lon, city.pop, city.country, city.iso2,
+                                 city.iso3, city.province])
+        return csv_path
+
+
+def _get_packed_encoding(values):
+    """ Packs values into int16, with a scale factor and an offset, as in the Climate Data Store files """
+    minimum = float(np.min(values))
+    maximum = float(np.max(values))
+    scale_factor = (maximum - minimum) / (2 ** 16 - 4) or 1.0
+    return {'dtype': 'int16', 'scale_factor': scale_factor, 'add_offset': (maximum + minimum) / 2,
+            '_FillValue': -32767}
@@ -0,0 +1,191 @@
+"""
+Data quality checks of the original ERA5 files of a month, run before cities are extracted from them, so a corrupt or
+partial download fails the ingest at once, rather than the `/weather` calls of users later on.
+
+For each parameter, it checks:
+- the grid: dimensions, shape, and that every parameter of the month is on the same grid
+- the time steps: hourly, and covering the whole month
+- the fraction of missing values
+- that values are within the valid range of the parameter (see `ParameterMetadata`)
+
+Checks are vectorized over blocks of time steps, so memory stays bounded while a month of the global grid is read.
+"""
+import calendar
+import logging
+import time
+
+import numpy as np
+
+from api.core.weather_parameter import WeatherParameter
+
+logger = logging.getLogger(__name__)
+
+""" Shape (latitude, longitude) of the ERA5 global grid, at 0.25 degree """
+ERA5_GRID_SHAPE = (721, 1440)
+
+""" Fraction of missing values allowed, unless a parameter has its own below """
+DEFAULT_MAX_NAN_FRACTION = 0.001
+
+""" Parameters with missing values by design, e.g., no cloud base height under a clear sky """
+MAX_NAN_FRACTIONS = {
+    'cloud_base_height': 1.0,
+}
+
+
+class ValidationError(Exception):
+
+    def __init__(self, message, report):
+        """
+        Constructor
+
+        :param message: str
+        :param report: dict: the validation report, as returned by `MonthValidator.validate`
+        """
+        super().__init__(message)
+        self.report = report
+
+
+class MonthValidator:
+
+    def __init__(self, grid_shape=ERA5_GRID_SHAPE, complete_month=True, block_hours=24):
+        """
+        Constructor
+
+        :param grid_shape: (int, int): expected number of latitudes and longitudes, None to accept any regular grid
+                           (e.g., synthetic files)
+        :param complete_month: bool: whether every hour of the month is expected, rather than the first hours only
+        :param block_hours: int: number of time steps checked at once, which bounds memory
+        """
+        self.grid_shape = grid_shape
+        self.complete_month = complete_month
+        self.block_hours = block_hours
+
+    def validate(self, year, month, data_sets):
+        """
+        This checks the files of a month
+
+        :param year: int
+        :param month: int
+        :param data_sets: dict: xarray.Dataset of each parameter, by parameter
+        :return: dict: the report, with the checks of each parameter, and whether all of them passed (`valid`)
+        """
+        start = time.time()
+        parameters = {}
+        grid = None
+        for parameter, data_set in data_sets.items():
+            parameter_report = self.validate_parameter(year, month, parameter, data_set)
+            if 'latitude' in data_set.coords and 'longitude' in data_set.coords:
+                if grid is None:
+                    grid = parameter, data_set['latitude'].values, data_set['longitude'].values
+                elif not (np.array_equal(grid[1], data_set['latitude'].values)
+                          and np.array_equal(grid[2], data_set['longitude'].values)):
+                    parameter_report['errors'].append('the grid differs from the grid of %s' % grid[0])
+                    parameter_report['valid'] = False
+            parameters[parameter] = parameter_report
+
+        report = {'year': year, 'month': month, 'valid': all(report['valid'] for report in parameters.values()),
+                  'duration': round(time.time() - start, 3), 'parameters': parameters}
+        logger.info('Validated %d-%02d in %.1fs: %s', year, month, report['duration'],
+                    'valid' if report['valid'] else 'invalid')
+        return report
+
+    def validate_parameter(self, year, month, parameter, data_set):
+        """
+        This checks the file of a parameter
+
+        :param year: int
+        :param month: int
+        :param parameter: str
+        :param data_set: xarray.Dataset: the original file
+        :return: dict: the checks of the parameter, and whether they passed (`valid`)
+        """
+        short_name = WeatherParameter.get_short_name(parameter)
+        if short_name not in data_set.data_vars:
+            return {'valid': False, 'errors': ['variable %s is missing' % short_name]}
+
+        variable = data_set[short_name]
+        errors = self._check_grid(variable) + self._check_time(year, month, variable)
+        report = {'shape': list(variable.shape), 'time_steps': variable.sizes.get('time', 0)}
+        if not errors:
+            report.update(self._check_values(parameter, variable))
+            errors = report.pop('errors')
+        report['errors'] = errors
+        report['valid'] = not errors
+        return report
+
+    def _check_grid(self, variable):
+        if variable.dims != ('time', 'latitude', 'longitude'):
+            return ['dimensions are %s, rather than (time, latitude, longitude)' % ', '.join(variable.dims)]
+
+        errors = []
+        if self.grid_shape is not None and variable.shape[1:] != tuple(self.grid_shape):
+            errors.append('the grid is %d x %d, rather than %d x %d' % (variable.shape[1:] + tuple(self.grid_shape)))
+        if variable.shape[1] > 1 and not np.all(np.diff(variable['latitude'].values) < 0):
+            errors.append('latitudes are not descending')
+        if variable.shape[2] > 1 and not np.all(np.diff(variable['longitude'].values) > 0):
+            errors.append('longitudes are not ascending')
+        return errors
+
+    def _check_time(self, year, month, variable):
+        times = variable['time'].values
+        if times.size == 0:
+            return ['there is no time step']
+        if not np.issubdtype(times.dtype, np.datetime64):
+            return ['time steps cannot be decoded']
+
+        first = np.datetime64('%d-%02d-01T00' % (year, month), 'h')
+        hours = calendar.monthrange(year, month)[1] * 24
+        steps = (times - first) // np.timedelta64(1, 'h')
+
+        errors = []
+        if not np.array_equal(steps, np.arange(len(steps))):
+            errors.append('time steps are not hourly from %s' % first)
+        if len(steps) > hours or (self.complete_month and len(steps) != hours):
+            errors.append('there are %d time steps, rather than %d' % (len(steps), hours))
+        return errors
+
+    def _check_values(self, parameter, variable):
+        """ Counts missing and out of range values, block by block """
+        metadata = WeatherParameter.get_metadata(parameter)
+        # packed values are rounded to the packing precision of the file
+        minimum = metadata.minimum - metadata.precision
+        maximum = metadata.maximum + metadata.precision
+
+        nan_count = 0
+        out_of_range = 0
+        lowest = np.inf
+        highest = -np.inf
+        for start in range(0, variable.shape[0], self.block_hours):
+            values = variable[start:start + self.block_hours].values
+            missing = np.isnan(values)
+            nan_count += int(np.count_nonzero(missing))
+            out_of_range += int(np.count_nonzero((values < minimum) | (values > maximum)))
+            if not missing.all():
+                lowest = min(lowest, float(np.nanmin(values)))
+                highest = max(highest, float(np.nanmax(values)))
+
+        nan_fraction = nan_count / float(variable.size)
+        errors = []
+        max_nan_fraction = MAX_NAN_FRACTIONS.get(parameter, DEFAULT_MAX_NAN_FRACTION)
+        if nan_fraction > max_nan_fraction:
+            errors.append('%.2f%% of the values are missing, more than %.2f%%' % (nan_fraction * 100,
+                                                                                  max_nan_fraction * 100))
+        if out_of_range:
+            errors.append('%d values are out of [%s, %s]' % (out_of_range, metadata.minimum, metadata.maximum))
+        return {'nan_fraction': round(nan_fraction, 6), 'out_of_range': out_of_range,
+                'minimum': lowest if np.isfinite(lowest) else None,
+                'maximum': highest if np.isfinite(highest) else None, 'errors': errors}
+
+
+def check(report):
+    """
+    :param report: dict: as returned by `MonthValidator.validate`
+    :return: None
+    :raise ValidationError: if any check failed
+    """
+    if report['valid']:
+        return
+
+    failures = ['%s: %s' % (parameter, '; '.join(parameter_report['errors']))
+                for parameter, parameter_report in report['parameters'].items() if not parameter_report['valid']]
+    raise ValidationError('%d-%02d is invalid: %s' % (report['year'], report['month'], ' | '.join(failures)), report)
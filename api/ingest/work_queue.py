@@ -0,0 +1,213 @@
+"""
+A durable work queue, for ingest tasks shared by workers on any number of machines.
+
+Workers claim tasks with a lease: a task whose worker stops renewing its lease (e.g., the machine died) is claimed
+again by another worker once the lease expires. Failed tasks are retried, up to a maximum number of attempts.
+Completed tasks are reported into a manifest, recording which worker produced which files.
+
+Tasks of a group (e.g., the appends to the same series) run one at a time, in the order they were added: a task is not
+claimed while an earlier task of its group is pending or leased.
+
+The queue is a SQLite file: on a local disk for tests and single machine runs, or on a file system shared by the
+workers (SQLite relies on the file locks of the file system, which must support them).
+"""
+import collections
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+""" Task states """
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+Task = collections.namedtuple('Task', ['id', 'key', 'payload', 'attempts', 'worker_id'])
+
+
+class WorkQueue:
+
+    def __init__(self, store_path, lease_seconds=600, max_attempts=3):
+        """
+        Constructor
+
+        :param store_path: str: path to the SQLite file shared by the workers
+        :param lease_seconds: float: how long a claimed task is reserved for its worker, unless the lease is renewed
+        :param max_attempts: int: number of times a task is tried before it's marked as failed
+        """
+        self.store_path = store_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+
+    def add(self, key, payload, group=None):
+        """
+        This adds a task, unless a task with the same key was added before
+
+        :param key: str: identifies the task, e.g., `2017-01/3-of-16`
+        :param payload: dict: JSON-serializable description of the work
+        :param group: str: tasks of the same group run one at a time, in the order they were added; None for no order
+        :return: bool: whether the task was added
+        """
+        with self._transaction() as connection:
+            cursor = connection.execute('INSERT OR IGNORE INTO tasks (key, payload, status, attempts, updated, '
+                                        'task_group) VALUES (?, ?, ?, 0, ?, ?)',
+                                        (key, json.dumps(payload), PENDING, time.time(), group))
+            return cursor.rowcount > 0
+
+    def claim(self, worker_id):
+        """
+        This claims the oldest task that's pending, or whose lease expired, and that no earlier task of its group is
+        waiting for
+
+        :param worker_id: str
+        :return: Task, or None if no task can be claimed
+        """
+        now = time.time()
+        with self._transaction() as connection:
+            while True:
+                row = connection.execute('SELECT id, key, payload, attempts FROM tasks AS task '
+                                         'WHERE (status = ? OR (status = ? AND lease_expires < ?)) '
+                                         'AND NOT EXISTS (SELECT 1 FROM tasks AS earlier '
+                                         'WHERE earlier.task_group = task.task_group AND earlier.id < task.id '
+                                         'AND earlier.status IN (?, ?)) ORDER BY id LIMIT 1',
+                                         (PENDING, LEASED, now, PENDING, LEASED)).fetchone()
+                if row is None:
+                    return None
+
+                task_id, key, payload, attempts = row
+                if attempts < self.max_attempts:
+                    break
+                # its last worker died holding the lease
+                connection.execute('UPDATE tasks SET status = ?, error = ?, updated = ? WHERE id = ?',
+                                   (FAILED, 'lease expired on the last attempt', now, task_id))
+
+            connection.execute('UPDATE tasks SET status = ?, worker_id = ?, lease_expires = ?, attempts = ?, '
+                               'updated = ? WHERE id = ?',
+                               (LEASED, worker_id, now + self.lease_seconds, attempts + 1, now, task_id))
+        return Task(task_id, key, json.loads(payload), attempts + 1, worker_id)
+
+    def renew(self, task):
+        """
+        This extends the lease of a task still being worked on
+
+        :param task: Task
+        :return: bool: False if the task is no longer leased to its worker, which should stop working on it
+        """
+        with self._transaction() as connection:
+            cursor = connection.execute('UPDATE tasks SET lease_expires = ?, updated = ? '
+                                        'WHERE id = ? AND status = ? AND worker_id = ?',
+                                        (time.time() + self.lease_seconds, time.time(), task.id, LEASED,
+                                         task.worker_id))
+            return cursor.rowcount > 0
+
+    def complete(self, task, outputs, duration):
+        """
+        This marks a task as done, and reports its outputs into the manifest
+
+        :param task: Task
+        :param outputs: List[str]: paths of the files produced
+        :param duration: float: seconds the task took
+        :return: bool: False if the task was no longer leased to its worker (e.g., another worker completed it)
+        """
+        now = time.time()
+        with self._transaction() as connection:
+            cursor = connection.execute('UPDATE tasks SET status = ?, lease_expires = NULL, error = NULL, updated = ? '
+                                        'WHERE id = ? AND status = ? AND worker_id = ?',
+                                        (DONE, now, task.id, LEASED, task.worker_id))
+            if cursor.rowcount == 0:
+                return False
+            connection.execute('INSERT OR REPLACE INTO manifest (key, worker_id, finished, duration, outputs) '
+                               'VALUES (?, ?, ?, ?, ?)', (task.key, task.worker_id, now, duration, json.dumps(outputs)))
+        return True
+
+    def fail(self, task, error):
+        """
+        This releases a task that failed: it's retried, unless it ran out of attempts
+
+        :param task: Task
+        :param error: str
+        :return: None
+        """
+        status = FAILED if task.attempts >= self.max_attempts else PENDING
+        with self._transaction() as connection:
+            connection.execute('UPDATE tasks SET status = ?, lease_expires = NULL, error = ?, updated = ? '
+                               'WHERE id = ? AND status = ? AND worker_id = ?',
+                               (status, error, time.time(), task.id, LEASED, task.worker_id))
+
+    def retry_failed(self):
+        """
+        This gives failed tasks another round of attempts, e.g., once the cause of their failure is fixed
+
+        :return: int: number of tasks retried
+        """
+        with self._transaction() as connection:
+            cursor = connection.execute('UPDATE tasks SET status = ?, attempts = 0, updated = ? WHERE status = ?',
+                                        (PENDING, time.time(), FAILED))
+            return cursor.rowcount
+
+    def get_counts(self):
+        """
+        :return: dict: number of tasks in each state
+        """
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        rows = self._get_connection().execute('SELECT status, COUNT(*) FROM tasks GROUP BY status').fetchall()
+        counts.update(dict(rows))
+        return counts
+
+    def get_failures(self):
+        """
+        :return: List[(str, str)]: key and error of the failed tasks
+        """
+        return self._get_connection().execute('SELECT key, error FROM tasks WHERE status = ? ORDER BY id',
+                                              (FAILED,)).fetchall()
+
+    def get_manifest(self):
+        """
+        :return: List[dict]: the completed tasks, their worker, duration and outputs
+        """
+        rows = self._get_connection().execute('SELECT key, worker_id, finished, duration, outputs FROM manifest '
+                                              'ORDER BY finished').fetchall()
+        return [{'key': key, 'worker_id': worker_id, 'finished': finished, 'duration': duration,
+                 'outputs': json.loads(outputs)} for key, worker_id, finished, duration, outputs in rows]
+
+    def is_finished(self):
+        """
+        :return: bool: whether every task is either done or failed
+        """
+        counts = self.get_counts()
+        return counts[PENDING] == 0 and counts[LEASED] == 0
+
+    def _transaction(self):
+        connection = self._get_connection()
+        # takes the write lock at once, so two workers never claim the same task
+        connection.execute('BEGIN IMMEDIATE')
+        return connection
+
+    def _get_connection(self):
+        """ One connection per thread and process; connections must not be shared across a fork """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.store_path, timeout=30, isolation_level=None)
+            connection.execute('CREATE TABLE IF NOT EXISTS tasks '
+                               '(id INTEGER PRIMARY KEY, key TEXT UNIQUE NOT NULL, payload TEXT NOT NULL, '
+                               'status TEXT NOT NULL, attempts INTEGER NOT NULL, worker_id TEXT, '
+                               'lease_expires REAL, error TEXT, updated REAL NOT NULL, task_group TEXT)')
+            connection.execute('CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, id)')
+            connection.execute('CREATE INDEX IF NOT EXISTS tasks_group ON tasks (task_group, id)')
+            connection.execute('CREATE TABLE IF NOT EXISTS manifest '
+                               '(key TEXT PRIMARY KEY, worker_id TEXT NOT NULL, finished REAL NOT NULL, '
+                               'duration REAL NOT NULL, outputs TEXT NOT NULL)')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+
+def get_worker_id():
+    """
+    :return: str: identifies a worker process across machines, e.g., `ip-10-0-0-12:4242`
+    """
+    return '%s:%d' % (socket.gethostname(), os.getpid())
@@ -0,0 +1,45 @@
+"""
+Assembly of the processed files of a city (monthly files, or yearly series) into one file along time, e.g., a decade of
+a city for `/weather`.
+
+Files are written one after the other into a file with an unlimited `time` dimension: only one file is held in memory
+at a time, however long the time range.
+"""
+import logging
+
+from api.core.derived_parameter import DerivedParameter
+from api.ingest.city_series import append_records
+from api.ingest.encoding import PROCESSED_FORMAT, encode
+
+logger = logging.getLogger(__name__)
+
+
+def assemble(local_paths, output_path, parameters=None):
+    """
+    This concatenates processed files along time
+
+    :param local_paths: List[str]: local files, in time order
+    :param output_path: str: where the assembled file is written
+    :param parameters: List[str]: the parameters kept, derived (see `DerivedParameter`) or not, all of them if empty
+    :return: str: the output path, None if there is no file
+    """
+    import xarray
+
+    names = None
+    for local_path in local_paths:
+        with xarray.open_dataset(local_path) as data_set:
+            if parameters:
+                data_set = DerivedParameter.select(data_set, parameters)
+
+            if names is None:
+                data_set, encoding = encode(data_set, unlimited_time=True)
+                data_set.to_netcdf(output_path, mode='w', format=PROCESSED_FORMAT, unlimited_dims=['time'],
+                                   encoding=encoding)
+                names = list(data_set.data_vars)
+            else:
+                # files processed before a parameter was added lack its variable: its values are missing
+                data_set, _ = encode(data_set[[name for name in names if name in data_set.data_vars]])
+                append_records(output_path, data_set)
+        logger.debug('Assembled %s', local_path)
+
+    return output_path if names is not None else None
@@ -0,0 +1,250 @@
+"""
+Extraction of a region (a latitude/longitude bounding box) from the original ERA5 files, e.g., the service territory of
+a utility, rather than one city at a time.
+
+The region is read block by block: a block is a few time steps of a few latitude rows of the box, read from the original
+files without reading the rest of the grid, and written to the output file at once. Memory is bounded by the size of a
+block, whatever the size of the box or the length of the time range.
+
+Output files are NetCDF4, with the variables of the requested parameters (derived ones included, see
+`DerivedParameter`), packed as processed files are (see `encoding.py`). Longitudes are in degrees east from the west of
+the box, e.g., -10 to 10, or 170 to 190 for a box across the antimeridian.
+"""
+import collections
+import logging
+import os
+
+import numpy as np
+
+from api.core.derived_parameter import DerivedParameter
+from api.core.weather_parameter import WeatherParameter
+from api.ingest.encoding import COMPRESSION_LEVEL, FILL_VALUE, TIME_CALENDAR, TIME_UNITS, get_packed_encoding, \
+    to_masked_array
+
+logger = logging.getLogger(__name__)
+
+""" A region: latitudes from south to north, longitudes (-180 to 180) from west to east, in degrees, inclusive """
+BoundingBox = collections.namedtuple('BoundingBox', ['south', 'north', 'west', 'east'])
+
+
+class RegionError(Exception):
+    """ An invalid region request, e.g., a box without grid point, an unknown parameter or too many values """
+
+
+class RegionExtractor:
+
+    def __init__(self, weather_file, block_values=None, max_values=None):
+        """
+        Constructor, arguments default to their environment variables
+
+        :param weather_file: WeatherFile: where the original files are
+        :param block_values: int: number of grid values read at once, for each parameter, REGION_BLOCK_VALUES
+        :param max_values: int: largest region, in number of values, REGION_MAX_VALUES
+        """
+        self.weather_file = weather_file
+        self.block_values = block_values or int(os.getenv('REGION_BLOCK_VALUES', str(2 ** 22)))
+        self.max_values = max_values or int(os.getenv('REGION_MAX_VALUES', str(10 ** 9)))
+
+    def write(self, path, box, parameters, start, end):
+        """
+        This writes the values of the given parameters within a box, over a time range
+
+        :param path: str: a local file
+        :param box: BoundingBox
+        :param parameters: List[str]: derived (see `DerivedParameter`) or not
+        :param start: str: the first day, e.g., `2017-01-01`
+        :param end: str: the last day (inclusive), e.g., `2017-01-31`
+        :return: None
+        """
+        import netCDF4
+
+        start, end = check_request(box, parameters, start, end)
+        metadata = [_get_metadata(parameter) for parameter in parameters]
+        inputs = []
+        for parameter in parameters:
+            for name in (DerivedParameter.get_inputs(parameter) if _is_derived(parameter) else [parameter]):
+                if name not in inputs:
+                    inputs.append(name)
+
+        with netCDF4.Dataset(path, 'w', format='NETCDF4') as output:
+            grid = None
+            for year, month in _get_months(start, end):
+                data_sets, local_paths = self._open(year, month, inputs)
+                try:
+                    if grid is None:
+                        grid = _Grid(data_sets[inputs[0]], box)
+                        self._check_size(grid, parameters, start, end)
+                        _create_variables(output, grid, parameters, metadata)
+                    self._write_month(output, grid, data_sets, parameters, metadata, start, end)
+                finally:
+                    self._close(data_sets, local_paths)
+        logger.info('Wrote %s: %s over %s to %s', path, ', '.join(parameters), start, end)
+
+    def _open(self, year, month, parameters):
+        """ Opens the original files lazily: values are read when indexed """
+        import xarray
+
+        storage = self.weather_file.storage
+        data_sets = {}
+        local_paths = []
+        try:
+            for parameter in parameters:
+                data_file = self.weather_file.get_original_data_set_path(year, month, parameter)
+                local_paths.append(storage.get_local_path(data_file))
+                data_sets[parameter] = xarray.open_dataset(local_paths[-1])
+        except Exception:
+            self._close(data_sets, local_paths)
+            raise
+        return data_sets, local_paths
+
+    def _close(self, data_sets, local_paths):
+        for data_set in data_sets.values():
+            data_set.close()
+        for local_path in local_paths:
+            self.weather_file.storage.release_local_path(local_path)
+
+    def _check_size(self, grid, parameters, start, end):
+        hours = int((end - start) / np.timedelta64(1, 'h'))
+        values = hours * len(grid.latitudes) * len(grid.longitudes) * len(parameters)
+        if values > self.max_values:
+            raise RegionError('The region holds %d values, more than %d: please ask for a smaller box, fewer '
+                              'parameters or a shorter time range' % (values, self.max_values))
+
+    def _write_month(self, output, grid, data_sets, parameters, metadata, start, end):
+        times = next(iter(data_sets.values()))['time'].values
+        selected = np.nonzero((times >= start) & (times < end))[0]
+        if selected.size == 0:
+            return
+
+        row_count = len(grid.latitudes)
+        column_count = len(grid.longitudes)
+        rows_per_block = max(1, min(row_count, self.block_values // column_count))
+        hours_per_block = max(1, self.block_values // (rows_per_block * column_count))
+
+        output_times = output.variables['time']
+        offset = len(output_times)
+        for first_hour in range(selected[0], selected[-1] + 1, hours_per_block):
+            last_hour = min(first_hour + hours_per_block, selected[-1] + 1)
+            hours = slice(first_hour, last_hour)
+            output_hours = slice(offset + first_hour - selected[0], offset + last_hour - selected[0])
+            for first_row in range(0, row_count, rows_per_block):
+                rows = slice(first_row, min(first_row + rows_per_block, row_count))
+                values = {name: grid.read(data_set, WeatherParameter.get_short_name(name), hours, rows)
+                          for name, data_set in data_sets.items()}
+                for parameter, parameter_metadata in zip(parameters, metadata):
+                    block = DerivedParameter.compute(parameter, values) if _is_derived(parameter) \
+                        else values[parameter]
+                    block = np.clip(block, parameter_metadata.minimum, parameter_metadata.maximum)
+                    output.variables[parameter_metadata.short_name][output_hours, rows, :] = to_masked_array(block)
+            output_times[output_hours] = _encode_times(times[hours], output_times)
+
+
+class _Grid:
+    """ The grid points of the original files within a box """
+
+    def __init__(self, data_set, box):
+        latitudes = data_set['latitude'].values
+        rows = np.nonzero((latitudes >= box.south) & (latitudes <= box.north))[0]
+
+        longitudes = (data_set['longitude'].values + 180) % 360 - 180
+        width = box.east - box.west if box.east >= box.west else box.east - box.west + 360
+        distances = (longitudes - box.west) % 360
+        columns = np.nonzero(distances <= width)[0]
+        if rows.size == 0 or columns.size == 0:
+            raise RegionError('The box holds no grid point')
+
+        # from west to east, which may wrap around the edge of the grid
+        columns = columns[np.argsort(distances[columns], kind='mergesort')]
+        self.rows = slice(rows[0], rows[-1] + 1)
+        self.latitudes = latitudes[self.rows]
+        self.longitudes = box.west + distances[columns]
+        breaks = np.nonzero(np.diff(columns) != 1)[0] + 1
+        self.column_runs = [slice(run[0], run[-1] + 1) for run in np.split(columns, breaks)]
+
+    def read(self, data_set, name, hours, rows):
+        """
+        :return: numpy array: the values of a variable, for the given time steps and rows of the box
+        """
+        rows = slice(self.rows.start + rows.start, self.rows.start + rows.stop)
+        blocks = [data_set[name][hours, rows, columns].values for columns in self.column_runs]
+        return blocks[0] if len(blocks) == 1 else np.concatenate(blocks, axis=2)
+
+
+def _create_variables(output, grid, parameters, metadata):
+    output.createDimension('time', None)
+    output.createDimension('latitude', len(grid.latitudes))
+    output.createDimension('longitude', len(grid.longitudes))
+
+    time = output.createVariable('time', 'i4', ('time',))
+    time.setncatts({'units': TIME_UNITS, 'calendar': TIME_CALENDAR, 'long_name': 'time'})
+    latitude = output.createVariable('latitude', 'f4', ('latitude',))
+    latitude.setncatts({'units': 'degrees_north', 'long_name': 'latitude'})
+    latitude[:] = grid.latitudes
+    longitude = output.createVariable('longitude', 'f4', ('longitude',))
+    longitude.setncatts({'units': 'degrees_east', 'long_name': 'longitude'})
+    longitude[:] = grid.longitudes
+
+    for parameter, parameter_metadata in zip(parameters, metadata):
+        encoding = get_packed_encoding(parameter_metadata)
+        variable = output.createVariable(parameter_metadata.short_name, encoding['dtype'],
+                                         ('time', 'latitude', 'longitude'), zlib=True, complevel=COMPRESSION_LEVEL,
+                                         shuffle=True, fill_value=FILL_VALUE)
+        variable.setncatts({'scale_factor': encoding['scale_factor'], 'add_offset': encoding['add_offset'],
+                            'units': parameter_metadata.units, 'long_name': parameter.replace('_', ' ')})
+
+
+def _encode_times(times, time_variable):
+    import netCDF4
+
+    dates = times.astype('datetime64[s]').astype(object)
+    return netCDF4.date2num(dates, time_variable.units, time_variable.calendar)
+
+
+def check_request(box, parameters, start, end):
+    """
+    This checks a region request before any file is read
+
+    :param box: BoundingBox
+    :param parameters: List[str]
+    :param start: str: the first day, e.g., `2017-01-01`
+    :param end: str: the last day (inclusive), e.g., `2017-01-31`
+    :return: a pair of numpy.datetime64: the first hour of the time range, and the hour after its last one
+    :raise RegionError: if the request is invalid
+    """
+    if not (-90 <= box.south <= box.north <= 90):
+        raise RegionError('Latitudes must be from south to north, within -90 and 90')
+    if not (-180 <= box.west <= 180 and -180 <= box.east <= 180):
+        raise RegionError('Longitudes must be within -180 and 180')
+
+    if not parameters:
+        raise RegionError('Please specify at least one parameter')
+    for parameter in parameters:
+        if parameter not in WeatherParameter.get_all_parameters() and not _is_derived(parameter):
+            raise RegionError('Unknown parameter: %s' % parameter)
+
+    try:
+        start = np.datetime64(start, 'h')
+        end = np.datetime64(end, 'D') + np.timedelta64(1, 'D')
+    except ValueError:
+        raise RegionError('Dates must be formatted as 2017-01-31')
+    if end <= start:
+        raise RegionError('The time range ends before it starts')
+    return start, end
+
+
+def _get_months(start, end):
+    """ The (year, month) pairs of a time range """
+    first = start.astype('datetime64[M]')
+    last = (end - np.timedelta64(1, 'h')).astype('datetime64[M]')
+    months = np.arange(first, last + 1)
+    return [(int(str(month)[:4]), int(str(month)[5:7])) for month in months]
+
+
+def _is_derived(parameter):
+    return parameter in DerivedParameter.get_all_parameters()
+
+
+def _get_metadata(parameter):
+    if _is_derived(parameter):
+        return DerivedParameter.get_metadata(parameter)
+    return WeatherParameter.get_metadata(parameter)
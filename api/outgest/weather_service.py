@@ -1,46 +1,197 @@
 """
 This reads NetCDF ECMWF ERA5 datasets (processed by `preprocessor.py`) from a pre-configured S3 bucket.
 """
-
-import xarray
+import concurrent.futures
 
 from api.city.city_service import CityService
+from api.city.city_table import CityTable
+from api.core.derived_parameter import DerivedParameter
+from api.core.metrics import STAGE_DATASET_OPEN, STAGE_S3_FETCH, STAGE_SERIALIZE, time_stage
 from api.core.weather_file import WeatherFile
+from api.outgest.assembly import assemble
+from api.outgest.region import RegionExtractor
 
 
 class WeatherService:
-    def __init__(self, data_path):
+    def __init__(self, data_path, city_service=None):
         """
         Constructor
 
         :param data_path: str, root path to the processed weather data
+        :param city_service: CityService, defaults to the major cities in `data/`
         """
-        self.city_service: CityService = CityService()
+        self.city_service: CityService = city_service if city_service is not None else CityService()
         self.weather_file: WeatherFile = WeatherFile(data_path)
 
     def _get_city(self, city_name):
-        city_list = self.city_service.get_city_coordinates()
-        cities = city_list.loc[city_list["city"] == city_name]
-        if cities.empty:
+        # the westernmost city among those with the name, as the data sets were always looked up
+        city = self.city_service.get_city(city_name, CityTable.ORDER_LONGITUDE)
+        if city is None:
             raise Exception('Cannot find your city')
 
-        for city in cities.itertuples():
-            return city
+        return city
 
     def _get_data_set(self, local_year, local_month, city_name):
         local_city = self._get_city(city_name)
-        full_path = self.weather_file.get_processed_data_set_path(local_year, local_month, local_city.iso3, local_city.city)
+        full_path = self.weather_file.get_processed_data_set_path(local_year, local_month, local_city.iso3,
+                                                                  local_city.city)
+
+        import xarray
 
-        ds = xarray.open_dataset(full_path)
-        return ds
+        storage = self.weather_file.storage
+        local_path = storage.get_local_path(full_path)
+        try:
+            with time_stage(STAGE_DATASET_OPEN):
+                with xarray.open_dataset(local_path) as ds:
+                    return ds.load()
+        finally:
+            storage.release_local_path(local_path)
 
-    def get_weather_data_set(self, year, month, city):
+    def get_weather_data_set(self, year, month, city, parameters=None):
         """
         This retrieves processed weather data and returns the xarray data set.
 
         :param year: int
         :param month: int
         :param city: str
+        :param parameters: List[str]: the parameters kept, derived (see `DerivedParameter`) or not, defaults to all
         :return: xarray.Dataset
         """
-        return self._get_data_set(year, month, city)
+        data_set = self._get_data_set(year, month, city)
+        if parameters:
+            data_set = DerivedParameter.select(data_set, parameters)
+        return data_set
+
+    def write_region(self, path, box, parameters, start, end):
+        """
+        This writes the weather data of a region, read from the original files with bounded memory (see `region.py`)
+
+        :param path: str: a local file, written as NetCDF
+        :param box: BoundingBox
+        :param parameters: List[str]: derived (see `DerivedParameter`) or not
+        :param start: str: the first day, e.g., `2017-01-01`
+        :param end: str: the last day (inclusive), e.g., `2017-01-31`
+        :return: None
+        """
+        RegionExtractor(self.weather_file).write(path, box, parameters, start, end)
+
+    def get_year_paths(self, year, iso3, city_name):
+        """
+        This returns the processed files of a city for a year: its yearly series when months were appended to it
+        (see `city_series.py`), its monthly files otherwise, some of which may not exist
+
+        :param year: int
+        :param iso3: str
+        :param city_name: str
+        :return: List[str]
+        """
+        series_path = self.weather_file.get_series_data_set_path(year, iso3, city_name)
+        if self.weather_file.storage.exists(series_path):
+            return [series_path]
+        return [self.weather_file.get_processed_data_set_path(year, month, iso3, city_name) for month in range(1, 13)]
+
+    def get_weather_paths(self, iso3, city_name, start_year, end_year, executor=None):
+        """
+        This returns the processed files of a city over a range of years, in time order (see `get_year_paths`)
+
+        :param iso3: str
+        :param city_name: str
+        :param start_year: int
+        :param end_year: int: inclusive
+        :param executor: Executor: where the years are looked up concurrently, one after the other if None
+        :return: List[str]
+        """
+        years = range(start_year, end_year + 1)
+        map_function = executor.map if executor is not None else map
+        year_paths = map_function(lambda year: self.get_year_paths(year, iso3, city_name), years)
+        return [path for paths in year_paths for path in paths]
+
+    def fetch(self, path, optional=False):
+        """
+        :param path: str
+        :param optional: bool: whether a missing file is skipped, e.g., a month not ingested yet
+        :return: str: local file, to be released with `storage.release_local_path`, None if an optional file is missing
+        """
+        storage = self.weather_file.storage
+        with time_stage(STAGE_S3_FETCH):
+            if optional and not storage.exists(path):
+                return None
+            return storage.get_local_path(path)
+
+    def fetch_all(self, paths, executor=None):
+        """
+        This fetches files, skipping the missing ones; if any fails, those fetched are released
+
+        :param paths: List[str]
+        :param executor: Executor: where the files are fetched concurrently, one after the other if None
+        :return: List[str]: local files, in the order of the paths
+        """
+        if executor is None:
+            local_paths = []
+            try:
+                for path in paths:
+                    local_path = self.fetch(path, optional=True)
+                    if local_path is not None:
+                        local_paths.append(local_path)
+            except Exception:
+                self.release_all(local_paths)
+                raise
+            return local_paths
+
+        futures = [executor.submit(self.fetch, path, True) for path in paths]
+        concurrent.futures.wait(futures)
+        local_paths = [future.result() for future in futures
+                       if future.exception() is None and future.result() is not None]
+        errors = [future.exception() for future in futures if future.exception() is not None]
+        if errors:
+            self.release_all(local_paths)
+            raise errors[0]
+        return local_paths
+
+    def release_all(self, local_paths):
+        """
+        :param local_paths: List[str]: as returned by `fetch_all`
+        :return: None
+        """
+        for local_path in local_paths:
+            self.weather_file.storage.release_local_path(local_path)
+
+    def assemble_weather(self, path, paths, parameters=None, io_executor=None, cpu_executor=None):
+        """
+        This fetches processed files, then assembles them one after the other into one file (see `assembly.py`)
+
+        :param path: str: a local file
+        :param paths: List[str]: processed files, in time order, as returned by `get_weather_paths`; the missing
+                      ones are skipped
+        :param parameters: List[str]: the parameters kept, derived (see `DerivedParameter`) or not, defaults to all
+        :param io_executor: Executor: where files are fetched concurrently, one after the other if None
+        :param cpu_executor: Executor: where files are assembled, e.g., a bounded pool, this thread if None
+        :return: str: the path, None if none of the files exists
+        """
+        local_paths = self.fetch_all(paths, io_executor)
+        try:
+            with time_stage(STAGE_SERIALIZE):
+                if cpu_executor is not None:
+                    return cpu_executor.submit(assemble, local_paths, path, parameters).result()
+                return assemble(local_paths, path, parameters)
+        finally:
+            self.release_all(local_paths)
+
+    def write_weather(self, path, city, start_year, end_year, parameters=None, io_executor=None, cpu_executor=None):
+        """
+        This writes the weather data of a city over a range of years, as one NetCDF file
+
+        :param path: str: a local file
+        :param city: str
+        :param start_year: int
+        :param end_year: int: inclusive
+        :param parameters: List[str]: the parameters kept, derived (see `DerivedParameter`) or not, defaults to all
+        :param io_executor: Executor: as in `assemble_weather`
+        :param cpu_executor: Executor: as in `assemble_weather`
+        :return: str: the path, None if there is no data for the city over the range
+        """
+        if end_year < start_year:
+            raise Exception('The range of years ends before it starts')
+        local_city = self._get_city(city)
+        paths = self.get_weather_paths(local_city.iso3, local_city.city, start_year, end_year, io_executor)
+        return self.assemble_weather(path, paths, parameters, io_executor, cpu_executor)
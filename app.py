@@ -1,31 +1,61 @@
 # Import required libraries
+import json
+import logging
 import os
-# Web-related
-import traceback
+import tempfile
 
-import boto3
-import botocore
 import dash
 import dash_core_components as dcc
 import dash_html_components as html
-import numpy as np
-# Numerical stuff
-import pandas as pd
-import xarray
-import xarray as xr
 from dash.dependencies import Input, Output
-from flask import request, json, send_file
+from flask import request, send_file, Response
 
 # OikoLab internal import
-from intent import handle_intent_request
+import async_io
+from api.city.city_service import CityService
+from api.city.city_table import CityTable
+from api.core.derived_parameter import DerivedParameter
+from api.core.logging_config import configure_logging, log_payload
+from api.core.metrics import IN_FLIGHT, REQUEST_ERRORS, REQUEST_LATENCY, STAGE_CITY_LOOKUP, generate_metrics, \
+    time_stage
+from api.core.profiling import RequestProfiler
+from api.outgest.region import BoundingBox, RegionError, check_request
+from api.outgest.weather_service import WeatherService
+from deadline import Deadline
+from figure_cache import FigureCache
+from graph import calculate_electricity_for_locations, create_electricity_figure
+from intent import DEGRADED_HEADER, get_degraded_reason, handle_intent_request, handle_intent_failure, \
+    intent_deadline
+from warmup import is_ready
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
+city_service = CityService()
+figure_cache = FigureCache(store_path=os.getenv('FIGURE_CACHE_PATH', '/tmp/oikolab-figure-cache.sqlite'))
+weather_data_path = os.getenv('WEATHER_DATA_PATH', 's3://ec2-us-east-1-oikolab/')
+weather_service = WeatherService(weather_data_path, city_service=city_service)
+weather_file = weather_service.weather_file
+
+""" Whether `/weather` fetches its monthly files concurrently, on the pools of `async_io.py`, or one after the other """
+async_io_enabled = os.getenv('ASYNC_IO', 'true').lower() == 'true'
+
+""" Largest range of years `/weather` answers at once """
+weather_max_years = int(os.getenv('WEATHER_MAX_YEARS', '80'))
+
+""" Metrics of each endpoint, bound to their label once: decorators cannot call a method of a call result before 3.9 """
+intent_latency = REQUEST_LATENCY.labels('intent')
+intent_in_flight = IN_FLIGHT.labels('intent')
+weather_latency = REQUEST_LATENCY.labels('weather')
+weather_in_flight = IN_FLIGHT.labels('weather')
+region_latency = REQUEST_LATENCY.labels('region')
+region_in_flight = IN_FLIGHT.labels('region')
 
 
 def _get_city_options():
-    city_list = pd.read_csv(os.path.join('data', 'simplemaps-worldcities-basic.csv'))
-    city_list = city_list.sort_values('pop', ascending=False)
-    city_list['loc'] = city_list['city'] + ', ' + city_list['country']
-    city_list = city_list.rename(columns={'lat': 'Lat', 'lng': 'Lon'})
-    city_options = [{'label': city, 'value': index} for city, index in zip(city_list['loc'], city_list.index)]
+    city_table = city_service.get_city_table()
+    city_options = [{'label': '%s, %s' % (city.city, city.country), 'value': city.Index}
+                    for city in city_table.by_population()]
     return city_options
 
 
@@ -88,61 +118,24 @@ def construct_app():
 app = construct_app()
 server = app.server
 
-
-def get_subset(lat, lon):
-    """
-    Function to get monthly average temperature with global coverage (0.25 x 0.25)
-    Source: ECMWF ERA5 dataset
-    Input: get_subset(year,lat,lon)
-
-    :param lat:
-    :param lon:
-    :return:
-    """
-
-    # Get daily average temperature
-    T2 = xr.open_dataset('data/T2_monthly_mean_2017.nc')
-    average_temp = T2.sel(lat=lat, lon=lon % 360, method='nearest')
-    average_temp = average_temp.assign_coords(
-        time=(pd.to_datetime(np.array(average_temp.time).astype(int).astype(str))))
-
-    return None, None, average_temp.var167
-
-
-def calculate_electricity(average_temp, electricity_bill_min, electricity_bill_max):
-    """
-    Given the daily average temperature data, minimum and maximum an user pay for her power bill, we can work out
-    the baseline, and also the amount she is paying for cooling
-
-    :param average_temp:
-    :param electricity_bill_min:
-    :param electricity_bill_max:
-    :return: a pair of array: base line electricity that user pays, and electricity user pays for cooling.
-        They are grouped at the monthly level
-    """
-    average_temp = average_temp - 273.15
-    cooling_degree_day = average_temp.where(average_temp > 18, 18) - 18
-    monthly_cdd = cooling_degree_day
-
-    elec_base = electricity_bill_min * np.ones(12)
-    elec_HVAC = np.array(monthly_cdd * (electricity_bill_max - electricity_bill_min) / max(monthly_cdd))
-
-    return elec_base, elec_HVAC
+request_profiler = RequestProfiler()
+request_profiler.init_app(app.server)
 
 
 @app.callback(Output(component_id='elec_usage', component_property='figure'),
               [Input(component_id='latlon_dropdown', component_property='value')])
 def update_elec(location):
-    city_list = _get_city_options()
-    if location:
-        lat = city_list.loc[location]['Lat']
-        lon = city_list.loc[location]['Lon']
-    else:
-        lat = 42.36
-        lon = -71.06
-    if location:
-        lat = city_list.loc[location]['Lat']
-        lon = city_list.loc[location]['Lon']
+    elec_min = 100
+    elec_max = 150
+    key = FigureCache.get_key(location, elec_min, elec_max)
+    return figure_cache.get_or_create(key, lambda: _create_elec_figure(location, elec_min, elec_max))
+
+
+def _create_elec_figure(location, elec_min, elec_max):
+    if location is not None and location != '':
+        city = city_service.get_city_table().get(location)
+        lat = city.lat
+        lon = city.lon
         color_capacity = 0.7
         color_border_capacity = 1.0
     else:
@@ -151,46 +144,37 @@ def update_elec(location):
         color_capacity = 0.05
         color_border_capacity = 0.05
 
-    winterT, summerT, aveT = get_subset(lat, lon)
+    elec_base, elec_hvac = calculate_electricity_for_locations([lat], [lon], elec_min, elec_max)
+
+    return create_electricity_figure(elec_base[0], elec_hvac[0], elec_max,
+                                     color_capacity=color_capacity, color_border_capacity=color_border_capacity)
 
-    elec_min = 100
-    elec_max = 150
-    elec_base, elec_HVAC = calculate_electricity(aveT, elec_min, elec_max)
-
-    return {
-        'data': [{'x': ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'],
-                  'y': elec_base,
-                  'type': 'bar',
-                  'name': 'baseline',
-                  'marker': dict(
-                      color='rgba(204, 204, 204, %s)' % color_capacity,
-                      line=dict(
-                          color='rgba(204, 204, 204, %s)' % color_border_capacity,
-                          width=1
-                      ))},
-                 {'x': ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'],
-                  'y': elec_HVAC,
-                  'type': 'bar',
-                  'name': '$ on cooling',
-                  'marker': dict(
-                      color='rgba(255, 94, 91, %s)' % color_capacity,
-                      line=dict(
-                          color='rgba(255, 94, 91, %s)' % color_border_capacity,
-                          width=1,
-                      )
-                  )
-                  }
-                 ],
-        'layout': {
-            'height': 300,
-            'barmode': 'stack',
-            'legend': {'orientation': 'v', 'xanchor': 'right', 'yanchor': 'top'},
-            'margin': dict(l=30, r=30, t=30, b=30, pad=5),
-            'yaxis': {'range': [0, elec_max + 20],
-                      'tickprefix': '$', 'automargin': True
-                      },
-        }
-    }
+
+def warm_figure_cache(city_count=100, elec_min=100, elec_max=150):
+    """
+    This pre-computes the dashboard figures of the most populated cities, in one vectorized call.
+
+    :param city_count: int: number of cities, by descending population
+    :param elec_min: the minimum bill
+    :param elec_max: the maximum bill
+    :return: int: number of figures computed
+    """
+    cities = []
+    for city in city_service.get_city_table().by_population():
+        if len(cities) >= city_count:
+            break
+        if not figure_cache.contains(FigureCache.get_key(city.Index, elec_min, elec_max)):
+            cities.append(city)
+
+    if not cities:
+        return 0
+
+    elec_base, elec_hvac = calculate_electricity_for_locations([city.lat for city in cities],
+                                                               [city.lon for city in cities], elec_min, elec_max)
+    for index, city in enumerate(cities):
+        figure_cache.put(FigureCache.get_key(city.Index, elec_min, elec_max),
+                         create_electricity_figure(elec_base[index], elec_hvac[index], elec_max))
+    return len(cities)
 
 
 """
@@ -208,64 +192,182 @@ def show_chart(location):
         return {'visibility': 'visible', 'height': '376px', 'overflow': 'auto'}
 
 
+@app.server.route('/ready', methods=['GET'])
+def ready():
+    """
+    Readiness probe: it only succeeds once the reference data has been loaded and the caches warmed up
+
+    :return: string
+    """
+    if not is_ready():
+        return 'warming up', 503
+    return 'ready'
+
+
+@app.server.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    :return: Prometheus metrics of all the workers
+    """
+    content, content_type = generate_metrics()
+    return Response(content, mimetype=content_type)
+
+
+@app.server.route('/debug/slowest', methods=['GET'])
+def slowest_requests():
+    """
+    :return: string: the slowest recent requests of this worker, with their profile file when they were profiled; only
+             for requests with the debug token (see `profiling.py`)
+    """
+    if not request_profiler.is_authorized():
+        return 'Not found', 404
+    return Response(json.dumps(request_profiler.slowest.get()), mimetype='application/json')
+
+
 @app.server.route('/intent', methods=['POST'])
+@intent_latency.time()
+@intent_in_flight.track_inprogress()
 def intent():
     """
-    :return: string: response with Dialogflow response structure
+    :return: string: response with Dialogflow response structure, with the `X-Answer-Degraded` header when it fell back
+             to a degraded answer
     """
-    print("Request: %s" % json.dumps(request.json))
-    response = ''
+    deadline = Deadline(intent_deadline)
+    log_payload(logger, 'Intent request', request.json)
     try:
-        response = handle_intent_request(request=request)
-        print("Response: %s" % response)
+        response = handle_intent_request(request=request, deadline=deadline)
+        log_payload(logger, 'Intent response', response)
     except Exception:
-        app.server.logger.error("An exception occurred")
-        traceback.print_exc()
+        logger.exception('Failed to handle the intent request')
+        response = handle_intent_failure(request)
 
+    degraded_reason = get_degraded_reason()
+    if degraded_reason is not None:
+        return response, 200, {DEGRADED_HEADER: degraded_reason}
     return response
 
 
 @app.server.route('/weather', methods=['GET'])
+@weather_latency.time()
+@weather_in_flight.track_inprogress()
 def read_weather():
     """
+    This returns the weather data of a city for a year, e.g., `?y=2017&city=new york`, or a range of years, e.g.,
+    `?start_year=2012&end_year=2017&city=new york`, as NetCDF
 
-    :return:
+    :return: the NetCDF file, or a message if the request is invalid
     """
-    year = request.args.get('y')
+    start_year = request.args.get('start_year', request.args.get('y'))
+    end_year = request.args.get('end_year', start_year)
     city_name = request.args.get('city')
 
-    if year is None or city_name is None:
-        return 'Please specify the year and the city: e.g., "?y=2017&city=new york"'
+    if start_year is None or city_name is None:
+        return 'Please specify the year and the city: e.g., "?y=2017&city=new york", ' \
+               'or "?start_year=2012&end_year=2017&city=new york"'
 
-    if str(year) != '2017':
-        return 'Only 2017 is supported for now'
+    try:
+        start_year = int(start_year)
+        end_year = int(end_year)
+    except ValueError:
+        return 'The years must be numbers: e.g., "?y=2017&city=new york"'
+    if end_year < start_year:
+        return 'The range of years ends before it starts'
+    if end_year - start_year + 1 > weather_max_years:
+        return 'At most %d years can be asked for at once' % weather_max_years
+
+    # e.g., `&parameters=2m_temperature,2m_relative_humidity`, derived parameters included
+    parameters = [parameter for parameter in request.args.get('parameters', '').split(',') if parameter]
+    try:
+        for parameter in parameters:
+            DerivedParameter.get_variable_name(parameter)
+    except Exception as error:
+        return str(error)
 
     # check city
-    checked_city = _get_city(city_name)
+    with time_stage(STAGE_CITY_LOOKUP):
+        checked_city = _get_city(city_name)
     if checked_city is None:
         return 'Cannot determine your city'
 
-    bucket = 'ec2-us-east-1-oikolab'
-    client = boto3.client('s3', aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-                          aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-                          config=botocore.client.Config(signature_version=botocore.UNSIGNED))
+    download_file_name = _get_download_file_name(start_year, checked_city.iso3, checked_city.city, end_year)
+    if async_io_enabled:
+        io_executor, cpu_executor = async_io.get_io_executor(), async_io.get_cpu_executor()
+    else:
+        io_executor, cpu_executor = None, None
+    paths = weather_service.get_weather_paths(checked_city.iso3, checked_city.city, start_year, end_year,
+                                              io_executor)
+
+    # a yearly series is served as it is when the months were appended to it (see `city_series.py`), and all the
+    # parameters are asked for
+    if len(paths) == 1 and not parameters:
+        local_path = weather_service.fetch(paths[0])
+        response = send_file(local_path, as_attachment=True, attachment_filename=download_file_name)
+        response.call_on_close(lambda: weather_file.storage.release_local_path(local_path))
+        return response
+
+    file_descriptor, full_path = tempfile.mkstemp(prefix='weather-', suffix='.nc')
+    os.close(file_descriptor)
+    try:
+        assembled = weather_service.assemble_weather(full_path, paths, parameters, io_executor, cpu_executor)
+    except Exception:
+        os.remove(full_path)
+        raise
+    if assembled is None:
+        os.remove(full_path)
+        return 'No weather data for %s from %d to %d' % (checked_city.city, start_year, end_year)
+
+    response = send_file(full_path, as_attachment=True, attachment_filename=download_file_name)
+    response.call_on_close(lambda: os.remove(full_path))
+    return response
+
+
+@app.server.route('/region', methods=['GET'])
+@region_latency.time()
+@region_in_flight.track_inprogress()
+def read_region():
+    """
+    This returns the weather data of a bounding box, as NetCDF, e.g.,
+    `?south=40&north=45&west=-80&east=-70&parameters=2m_temperature,10m_wind_speed&start=2017-01-01&end=2017-01-31`
+
+    :return: the NetCDF file, or a message with status 400 if the request is invalid
+    """
+    names = ['south', 'north', 'west', 'east', 'parameters', 'start', 'end']
+    if any(request.args.get(name) is None for name in names):
+        return _region_error('Please specify %s: e.g., "?south=40&north=45&west=-80&east=-70'
+                             '&parameters=2m_temperature&start=2017-01-01&end=2017-01-31"' % ', '.join(names))
+
+    try:
+        box = BoundingBox(*[float(request.args[name]) for name in ['south', 'north', 'west', 'east']])
+    except ValueError:
+        return _region_error('The bounding box must be made of numbers, in degrees')
+    parameters = [parameter for parameter in request.args['parameters'].split(',') if parameter]
+    try:
+        check_request(box, parameters, request.args['start'], request.args['end'])
+    except RegionError as error:
+        return _region_error(str(error))
+
+    file_descriptor, full_path = tempfile.mkstemp(prefix='region-', suffix='.nc')
+    os.close(file_descriptor)
+    try:
+        weather_service.write_region(full_path, box, parameters, request.args['start'], request.args['end'])
+    except RegionError as error:
+        # e.g., a box between grid points, or too large
+        os.remove(full_path)
+        return _region_error(str(error))
+    except Exception:
+        os.remove(full_path)
+        logger.exception('Failed to extract the region')
+        REQUEST_ERRORS.labels('region', '500').inc()
+        return 'The region could not be extracted', 500
 
-    prefix = 'processed/%s/' % year
+    response = send_file(full_path, as_attachment=True, attachment_filename='region.nc')
+    response.call_on_close(lambda: os.remove(full_path))
+    return response
 
-    data_sets = []
-    for month in range(1, 13):
-        metadata_file = _get_file_name(2017, month, checked_city.iso3, checked_city.city)
-        metadata_key = prefix + metadata_file
-        print('metadata_key: ' + metadata_key)
-        client.download_file(bucket, metadata_key, metadata_file)
-        data_sets.append(xarray.open_dataset(metadata_file, decode_times=False))
 
-    final_ds = xarray.concat(data_sets, dim='time')
-    full_path = '/tmp/weather_temp_storage.nc'
-    final_ds.to_netcdf(full_path, mode='w', compute=True)
-    print(final_ds)
-    return send_file(full_path, as_attachment=True,
-                     attachment_filename=_get_download_file_name(2017, checked_city.iso3, checked_city.city))
+def _region_error(message):
+    REQUEST_ERRORS.labels('region', '400').inc()
+    return message, 400
 
 
 def get_file(filename):  # pragma: no cover
@@ -283,24 +385,16 @@ def get_file(filename):  # pragma: no cover
 
 def _get_city(city_name):
     """
+    Among the cities (or provinces) with the name, the westernmost one is picked, as it always was for `/weather`
 
-    :return:
+    :return: City, or None
     """
-    city_list = pd.read_csv(os.path.join('data', 'simplemaps-worldcities-basic.csv'))
-    city_list = city_list.sort_values('lat', ascending=True)
-    city_list = city_list.sort_values('lng', ascending=True)
-    city_list = city_list.rename(columns={'lat': 'lat', 'lng': 'lon'})
-    cities = city_list.loc[city_list["city"] == city_name.title()]
-    if not cities.empty:
-        for city in cities.itertuples():
-            return city
+    city_table = city_service.get_city_table()
+    city = city_table.find('city', city_name.title(), CityTable.ORDER_LONGITUDE)
+    if city is not None:
+        return city
 
-    provinces = city_list.loc[city_list["province"] == city_name]
-    if not provinces.empty:
-        for province in provinces.itertuples():
-            return province
-
-    return None
+    return city_table.find('province', city_name, CityTable.ORDER_LONGITUDE)
 
 
 def _get_data_set(local_year, local_month, city_name, local_data_path):
@@ -312,6 +406,8 @@ def _get_data_set(local_year, local_month, city_name, local_data_path):
     :param local_data_path:
     :return:
     """
+    import xarray
+
     local_city = _get_city(city_name)
     file_name = _get_file_name(local_year, local_month, local_city.iso3, local_city.city)
     full_path = '%sprocessed/%s/%s' % (local_data_path, local_year, file_name)
@@ -333,8 +429,10 @@ def _get_file_name(local_year, local_month, iso3, city):
     return file_name
 
 
-def _get_download_file_name(local_year, iso3, city):
-    file_name = '%d-%s_%s.nc' % (local_year, iso3, city)
+def _get_download_file_name(local_year, iso3, city, end_year=None):
+    if end_year is not None and end_year != local_year:
+        local_year = '%d-%d' % (local_year, end_year)
+    file_name = '%s-%s_%s.nc' % (local_year, iso3, city)
     file_name = file_name.replace(' ', '_').lower()
     return file_name
 
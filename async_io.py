@@ -0,0 +1,51 @@
+"""
+Thread pools for the blocking steps of the request handlers. Their latency is mostly spent waiting on S3, the geocoder
+and data set reads, so a request's independent I/O steps are submitted together, rather than run one after the other.
+
+Handlers stay synchronous Flask views, served by gunicorn's threaded workers, and wait on the futures of the pools:
+- ASYNC_IO_THREADS: size of the pool for blocking I/O, e.g., S3 downloads and geocoding (64 by default)
+- ASYNC_CPU_THREADS: size of the pool for CPU heavy work, e.g., xarray (the number of CPUs by default); it's bounded
+  so concurrent requests queue for the CPUs rather than slowing each other down
+"""
+import concurrent.futures
+import os
+import threading
+
+_lock = threading.Lock()
+_pid = None
+_io_executor = None
+_cpu_executor = None
+
+
+def get_io_executor():
+    """
+    :return: ThreadPoolExecutor: the pool for blocking I/O, shared by the process
+    """
+    _start()
+    return _io_executor
+
+
+def get_cpu_executor():
+    """
+    :return: ThreadPoolExecutor: the pool for CPU heavy work, shared by the process
+    """
+    _start()
+    return _cpu_executor
+
+
+def _start():
+    """ Starts the pools; threads do not survive a fork, so a forked process starts its own """
+    global _pid, _io_executor, _cpu_executor
+
+    if _pid == os.getpid():
+        return
+
+    with _lock:
+        if _pid == os.getpid():
+            return
+
+        _io_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=int(os.getenv('ASYNC_IO_THREADS', '64')), thread_name_prefix='io')
+        _cpu_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=int(os.getenv('ASYNC_CPU_THREADS', str(os.cpu_count() or 1))), thread_name_prefix='cpu')
+        _pid = os.getpid()
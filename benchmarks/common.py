@@ -0,0 +1,89 @@
+"""
+Measurements shared by the benchmark suites, and the JSON format results are stored in:
+
+    {"metadata": {...},
+     "results": {"<benchmark>": {"<metric>": {"value": 1.2, "unit": "ms", "higher_is_better": false}}}}
+"""
+import platform
+import resource
+import sys
+import time
+
+import numpy as np
+
+
+class Results:
+
+    def __init__(self):
+        """Constructor"""
+        self.results = {}
+
+    def record(self, benchmark, metric, value, unit, higher_is_better=False):
+        """
+        :param benchmark: str: e.g., `weather_service.get_weather_data_set`
+        :param metric: str: e.g., `p99`
+        :param value: float
+        :param unit: str: e.g., `ms`
+        :param higher_is_better: bool: e.g., True for a throughput
+        :return: None
+        """
+        self.results.setdefault(benchmark, {})[metric] = {'value': float(value), 'unit': unit,
+                                                          'higher_is_better': higher_is_better}
+
+    def record_latencies(self, benchmark, latencies):
+        """
+        This records the cold (first) call, and the percentiles of the warm (later) calls
+
+        :param benchmark: str
+        :param latencies: List[float]: in seconds, in the order of the calls
+        :return: None
+        """
+        self.record(benchmark, 'cold', latencies[0] * 1000, 'ms')
+        if len(latencies) < 2:
+            return
+
+        warm = np.array(latencies[1:]) * 1000
+        self.record(benchmark, 'p50', np.percentile(warm, 50), 'ms')
+        self.record(benchmark, 'p99', np.percentile(warm, 99), 'ms')
+        self.record(benchmark, 'mean', np.mean(warm), 'ms')
+
+    def update(self, results):
+        """
+        :param results: dict: results in the JSON format, e.g., of another process
+        :return: None
+        """
+        for benchmark, metrics in results.items():
+            self.results.setdefault(benchmark, {}).update(metrics)
+
+
+def time_calls(function, repeat):
+    """
+    This calls a function repeatedly, and returns how long each call took
+
+    :param function: function()
+    :param repeat: int
+    :return: List[float]: in seconds
+    """
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def get_peak_rss():
+    """
+    :return: float: peak resident memory of this process, in MB
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on MacOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def get_metadata():
+    """
+    :return: dict: where and when the benchmarks ran
+    """
+    return {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+            'platform': platform.platform(), 'processor': platform.processor()}
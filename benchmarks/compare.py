@@ -0,0 +1,65 @@
+"""
+This compares benchmark results against a baseline run, e.g.:
+`python -m benchmarks.compare benchmarks/results/baseline.json benchmarks/results/latest.json --threshold 0.2`
+
+It exits with status 1 if any metric regressed by more than the threshold.
+"""
+import argparse
+import collections
+import json
+import sys
+
+Comparison = collections.namedtuple('Comparison', ['benchmark', 'metric', 'unit', 'baseline', 'current', 'change',
+                                                   'regressed'])
+
+
+def compare(baseline, current, threshold=0.2):
+    """
+    :param baseline: dict: results of the baseline run, in the JSON format of `common.Results`
+    :param current: dict: results of the current run
+    :param threshold: float: relative change (e.g., 0.2 for 20%) a metric must worsen by to be a regression
+    :return: List[Comparison]: the metrics found in both runs
+    """
+    comparisons = []
+    for benchmark, metrics in sorted(current.items()):
+        for metric, measurement in sorted(metrics.items()):
+            baseline_measurement = baseline.get(benchmark, {}).get(metric)
+            if baseline_measurement is None or baseline_measurement['value'] == 0:
+                continue
+
+            change = (measurement['value'] - baseline_measurement['value']) / baseline_measurement['value']
+            worsened = -change if measurement['higher_is_better'] else change
+            comparisons.append(Comparison(benchmark, metric, measurement['unit'], baseline_measurement['value'],
+                                          measurement['value'], change, worsened > threshold))
+    return comparisons
+
+
+def format_report(comparisons):
+    """
+    :param comparisons: List[Comparison]
+    :return: str: one line per metric
+    """
+    lines = ['%-55s %-15s %12s %12s %8s' % ('benchmark', 'metric', 'baseline', 'current', 'change')]
+    for comparison in comparisons:
+        lines.append('%-55s %-15s %12.3f %12.3f %+7.1f%%%s' % (
+            comparison.benchmark, '%s (%s)' % (comparison.metric, comparison.unit), comparison.baseline,
+            comparison.current, comparison.change * 100, '  REGRESSION' if comparison.regressed else ''))
+    return '\n'.join(lines)
+
+
+def load_results(file_path):
+    with open(file_path) as result_file:
+        return json.load(result_file)['results']
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare benchmark results against a baseline run')
+    parser.add_argument('baseline', help='results of the baseline run, e.g., benchmarks/results/baseline.json')
+    parser.add_argument('current', help='results of the run to compare')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative change a metric must worsen by to be a regression, e.g., 0.2 for 20%%')
+
+    args = parser.parse_args()
+    comparisons = compare(load_results(args.baseline), load_results(args.current), args.threshold)
+    print(format_report(comparisons))
+    sys.exit(1 if any(comparison.regressed for comparison in comparisons) else 0)
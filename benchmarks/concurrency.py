@@ -0,0 +1,118 @@
+"""
+Benchmark of `/weather` under concurrent requests when S3 is slow, served by gunicorn over HTTP, as in production:
+- sync: the sync workers the app was served with before, fetching the files of a request one after the other
+- gthread: threaded workers (see `gunicorn.conf.py`), still fetching the files one after the other (`ASYNC_IO=false`)
+- gthread_async: threaded workers, fetching the files of a request concurrently (see `async_io.py`)
+
+Each mode runs one worker process, so results compare what a worker serves. Requests are sent by CONCURRENCY clients.
+"""
+import concurrent.futures
+import multiprocessing
+import os
+import socket
+import time
+
+import numpy as np
+
+from benchmarks import fixture
+from benchmarks.fakes import SlowStorage
+
+""" Seconds each S3 download takes """
+S3_LATENCY = 0.05
+
+""" Number of requests sent at the same time, and of threads of a threaded worker """
+CONCURRENCY = 16
+
+""" Serving modes: gunicorn worker class, and whether the files of a request are fetched concurrently """
+MODES = [('sync', 'sync', False), ('gthread', 'gthread', False), ('gthread_async', 'gthread', True)]
+
+
+def run(results, options):
+    data_path = os.path.join(options.work_folder, 'concurrency') + '/'
+    city_service = fixture.create_processed_files(data_path, year=2017, city_count=1, days=options.days)
+    city_name = city_service.get_city_table().get(0).city
+
+    for mode, worker_class, async_io_enabled in MODES:
+        port = _get_free_port()
+        server = multiprocessing.Process(target=_serve, args=(data_path, port, worker_class, async_io_enabled))
+        server.start()
+        try:
+            url = 'http://127.0.0.1:%d/weather' % port
+            _wait_until_serving(url, city_name, server)
+            latencies, duration = _send_concurrently(url, city_name, options.repeat, CONCURRENCY)
+        finally:
+            server.terminate()
+            server.join()
+
+        benchmark = '/weather %s, %d concurrent requests' % (mode, CONCURRENCY)
+        results.record(benchmark, 'throughput', len(latencies) / duration, 'requests/s', higher_is_better=True)
+        results.record(benchmark, 'p50', np.percentile(latencies, 50) * 1000, 'ms')
+        results.record(benchmark, 'p99', np.percentile(latencies, 99) * 1000, 'ms')
+
+
+def _serve(data_path, port, worker_class, async_io_enabled):
+    """ Runs gunicorn with one worker, in a process of its own, with a slow S3 """
+    from gunicorn.app.base import BaseApplication
+
+    class _Application(BaseApplication):
+
+        def load_config(self):
+            self.cfg.set('bind', '127.0.0.1:%d' % port)
+            self.cfg.set('worker_class', worker_class)
+            self.cfg.set('workers', 1)
+            self.cfg.set('threads', CONCURRENCY)
+            self.cfg.set('preload_app', True)
+            self.cfg.set('loglevel', 'warning')
+
+        def load(self):
+            os.environ['WEATHER_DATA_PATH'] = data_path
+            import app
+
+            app.async_io_enabled = async_io_enabled
+            app.weather_file.storage = SlowStorage(app.weather_file.storage, S3_LATENCY)
+            return app.server
+
+    _Application().run()
+
+
+def _get_free_port():
+    with socket.socket() as free_socket:
+        free_socket.bind(('127.0.0.1', 0))
+        return free_socket.getsockname()[1]
+
+
+def _wait_until_serving(url, city_name, server, timeout=120):
+    """ Waits for the first answer, which also warms the worker up """
+    import requests
+
+    expires_at = time.monotonic() + timeout
+    while True:
+        try:
+            _get_weather(requests, url, city_name)
+            return
+        except requests.ConnectionError:
+            if not server.is_alive() or time.monotonic() > expires_at:
+                raise Exception('gunicorn did not start serving %s' % url)
+            time.sleep(0.2)
+
+
+def _get_weather(session, url, city_name):
+    start = time.perf_counter()
+    response = session.get(url, params={'y': 2017, 'city': city_name}, timeout=120)
+    if response.status_code != 200 or response.headers.get('Content-Type', '').startswith('text/html'):
+        raise Exception('/weather failed: %s' % response.text[:200])
+    return time.perf_counter() - start
+
+
+def _send_concurrently(url, city_name, request_count, concurrency):
+    import requests
+
+    def get_weather(_):
+        with requests.Session() as session:
+            return _get_weather(session, url, city_name)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        start = time.perf_counter()
+        latencies = list(executor.map(get_weather, range(request_count)))
+        duration = time.perf_counter() - start
+    return latencies, duration
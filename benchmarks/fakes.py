@@ -0,0 +1,88 @@
+"""
+Local fakes of the external dependencies of the webhook, so load tests are repeatable and need no network access.
+"""
+import struct
+import time
+import zlib
+
+from api.core.storage import Storage
+
+
+def _create_png():
+    """ The smallest PNG image: one white pixel """
+
+    def chunk(chunk_type, data):
+        return struct.pack('>I', len(data)) + chunk_type + data + \
+            struct.pack('>I', zlib.crc32(chunk_type + data) & 0xffffffff)
+
+    header = struct.pack('>IIBBBBB', 1, 1, 8, 0, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(b'\x00\xff')) + \
+        chunk(b'IEND', b'')
+
+
+_PNG = _create_png()
+
+
+class FakeGeocoder:
+
+    def __init__(self, latency=0.0):
+        """
+        Constructor
+
+        :param latency: float: seconds each lookup takes
+        """
+        self.latency = latency
+
+    def __call__(self, city_name):
+        """
+        :param city_name: str
+        :return: a triple: latitude, longitude and the name of the city, always the same for a city
+        """
+        if self.latency:
+            time.sleep(self.latency)
+        digest = zlib.crc32(city_name.lower().encode('utf-8'))
+        lat = (digest % 12000) / 100.0 - 60
+        lon = (digest // 12000 % 36000) / 100.0 - 180
+        return lat, lon, city_name
+
+
+class FakeRenderer:
+
+    def __init__(self, latency=0.0):
+        """
+        Constructor
+
+        :param latency: float: seconds each image takes to render
+        """
+        self.latency = latency
+
+    def __call__(self, figure_dict, file_path):
+        if self.latency:
+            time.sleep(self.latency)
+        with open(file_path, 'wb') as image_file:
+            image_file.write(_PNG)
+
+
+class SlowStorage:
+    """ Wraps a storage, adding a delay to every download, e.g., the round trip time to S3; as from S3, each download
+    is a file of its own """
+
+    def __init__(self, storage, latency=0.05):
+        """
+        Constructor
+
+        :param storage: Storage
+        :param latency: float: seconds each download takes, on top of the wrapped storage's
+        """
+        self.storage = storage
+        self.latency = latency
+
+    def get_local_path(self, path):
+        time.sleep(self.latency)
+        return Storage.get_local_path(self, path)
+
+    def release_local_path(self, local_path):
+        Storage.release_local_path(self, local_path)
+
+    def __getattr__(self, name):
+        return getattr(self.storage, name)
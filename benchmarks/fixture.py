@@ -0,0 +1,49 @@
+"""
+Weather data for the benchmarks: synthetic ERA5 files (see `api/ingest/synthetic_era5.py`), and their processed
+files, written to a local folder so no benchmark needs network access.
+"""
+from api.city.city_service import CityService
+from api.ingest.preprocessor import Preprocessor
+from api.ingest.synthetic_era5 import SyntheticEra5
+from api.ingest.validation import MonthValidator
+
+
+def create_original_files(data_path, year=2017, months=(1,), city_count=20, days=1):
+    """
+    :param data_path: str: a local folder
+    :param year: int
+    :param months: List[int]
+    :param city_count: int
+    :param days: int
+    :return: CityService: the cities covered by the files
+    """
+    generator = SyntheticEra5(data_path, days=days, city_count=city_count)
+    generator.write_cities(data_path)
+    for month in months:
+        generator.write(year, month)
+    return CityService(data_path)
+
+
+def create_validator():
+    """
+    :return: MonthValidator: for synthetic files, which cover the first days of a month, around their cities only
+    """
+    return MonthValidator(grid_shape=None, complete_month=False)
+
+
+def create_processed_files(data_path, year=2017, months=range(1, 13), city_count=3, days=1):
+    """
+    This writes the processed files of a few cities, as `/weather` and `WeatherService` read them
+
+    :param data_path: str: a local folder
+    :param year: int
+    :param months: List[int]
+    :param city_count: int
+    :param days: int
+    :return: CityService: the cities processed
+    """
+    city_service = create_original_files(data_path, year, months, city_count, days)
+    preprocessor = Preprocessor(data_path, city_service=city_service, validator=create_validator())
+    for month in months:
+        preprocessor.process(year, month)
+    return city_service
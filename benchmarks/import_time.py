@@ -0,0 +1,69 @@
+"""
+This measures how long modules take to import, with `python -X importtime`, in a new interpreter each time, e.g.:
+`python -m benchmarks.import_time app intent api.cli.weather_reader --top 15`
+
+It prints the total time of each module, and the imports that took longest; startup time drives how fast workers
+spawn, autoscaling reacts and CLIs answer.
+"""
+import argparse
+import collections
+import subprocess
+import sys
+
+""" Modules measured by the `import_time` suite of `benchmarks.run` """
+MODULES = ['app', 'intent', 'climate_data', 'api.cli.weather_reader', 'api.cli.preprocessor_cli']
+
+ImportTime = collections.namedtuple('ImportTime', ['module', 'self_us', 'cumulative_us', 'depth'])
+
+
+def measure_import(module):
+    """
+    :param module: str: e.g., `app`
+    :return: List[ImportTime]: every module imported, in the order they finished importing
+    """
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import %s' % module],
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if process.returncode != 0:
+        raise Exception('Cannot import %s: %s' % (module, process.stderr.strip().splitlines()[-1:]))
+
+    import_times = []
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        import_times.append(ImportTime(name.strip(), int(self_us), int(cumulative_us),
+                                       (len(name) - len(name.lstrip())) // 2))
+    return import_times
+
+
+def run(results, options):
+    for module in MODULES:
+        # a module that no longer imports fails the suite, rather than dropping out of the comparison
+        import_times = measure_import(module)
+        results.record('import %s' % module, 'duration', import_times[-1].cumulative_us / 1000, 'ms')
+
+
+def format_import_times(module, import_times, top=10):
+    total = import_times[-1].cumulative_us
+    lines = ['import %s: %.1f ms' % (module, total / 1000)]
+
+    # the modules imported by the measured module are listed right before it, the interpreter's own ones before them
+    start = len(import_times) - 1
+    while start > 0 and import_times[start - 1].depth > 0:
+        start = start - 1
+    slowest = sorted((import_time for import_time in import_times[start:-1] if import_time.depth == 1),
+                     key=lambda import_time: import_time.cumulative_us, reverse=True)
+    for import_time in slowest[:top]:
+        lines.append('  %-50s %8.1f ms %5.1f%%' % (import_time.module, import_time.cumulative_us / 1000,
+                                                   100.0 * import_time.cumulative_us / total))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure the import time of modules')
+    parser.add_argument('modules', nargs='*', default=MODULES, help='modules to import, e.g., app')
+    parser.add_argument('--top', type=int, default=10, help='number of the slowest imports listed per module')
+
+    args = parser.parse_args()
+    for module_name in args.modules:
+        print(format_import_times(module_name, measure_import(module_name), args.top))
@@ -0,0 +1,41 @@
+"""
+Benchmark of `Preprocessor.process`, on a month of synthetic ERA5 files, and of the validation of the files alone.
+"""
+import os
+import time
+
+from benchmarks import fixture
+from benchmarks.common import get_peak_rss
+
+
+def run(results, options):
+    from api.ingest.preprocessor import Preprocessor
+
+    data_path = os.path.join(options.work_folder, 'ingest')
+    city_service = fixture.create_original_files(data_path, year=2017, months=[1], city_count=options.cities,
+                                                 days=options.days)
+    preprocessor = Preprocessor(data_path, city_service=city_service, validator=fixture.create_validator())
+
+    start = time.perf_counter()
+    preprocessor.process(2017, 1)
+    duration = time.perf_counter() - start
+
+    city_count = len(city_service.get_city_table())
+    results.record('preprocessor.process', 'duration', duration, 's')
+    results.record('preprocessor.process', 'cities_per_sec', city_count / duration, 'cities/s', higher_is_better=True)
+    results.record('preprocessor.process', 'peak_rss', get_peak_rss(), 'MB')
+
+    import xarray
+    from api.core.weather_parameter import WeatherParameter
+
+    data_sets = {}
+    try:
+        for parameter in WeatherParameter.get_all_parameters():
+            path = preprocessor.weather_file.get_original_data_set_path(2017, 1, parameter)
+            data_sets[parameter] = xarray.open_dataset(path)
+        start = time.perf_counter()
+        preprocessor.validator.validate(2017, 1, data_sets)
+        results.record('validation.validate', 'duration', time.perf_counter() - start, 's')
+    finally:
+        for data_set in data_sets.values():
+            data_set.close()
@@ -0,0 +1,22 @@
+"""
+Benchmarks of the `/intent` webhook, for each intent.
+"""
+from benchmarks.common import time_calls
+from benchmarks.payloads import INTENTS, create_payload
+
+
+def run(results, options):
+    import app
+
+    client = app.app.server.test_client()
+    city_name = next(app.city_service.get_city_table().by_population()).city
+
+    for intent in INTENTS:
+        payload = create_payload(intent, city=city_name)
+
+        def post_intent():
+            response = client.post('/intent', json=payload)
+            if response.status_code != 200:
+                raise Exception('/intent failed for %s: %s' % (intent, response.get_data(as_text=True)[:200]))
+
+        results.record_latencies('/intent %s' % intent, time_calls(post_intent, options.repeat))
@@ -0,0 +1,243 @@
+"""
+This replays DialogFlow webhook requests against `/intent` at a target rate, and reports the throughput, the latency
+percentiles, the error rate and the degraded rate, overall and per intent, e.g.:
+`python -m benchmarks.load_replay --rate 20 --duration 30 --output benchmarks/results/load.json`
+
+Requests are either recorded (`--payloads`, one JSON request per line) or synthesized for the four intents, a fraction
+of them for cities missing from the city table, which are geocoded.
+By default, the app runs in this process with a fake geocoder and renderer (see `fakes.py`), so runs are repeatable;
+`--url` targets a running server instead, e.g., `--url http://localhost:8000`.
+
+Requests are sent on schedule whether or not earlier ones have been answered: latencies are measured from when a
+request was due, so time spent queuing behind slow requests is counted.
+
+`/intent` answers with status 200 even when it falls back to a degraded answer (e.g., without the chart, past the
+deadline): such answers have the `X-Answer-Degraded` header, and are counted apart from errors.
+"""
+import argparse
+import collections
+import concurrent.futures
+import itertools
+import json
+import sys
+import threading
+import time
+
+import numpy as np
+
+from benchmarks.common import Results, time_calls
+from benchmarks.fakes import FakeGeocoder, FakeRenderer
+from benchmarks.payloads import INTENTS, create_payload
+
+Outcome = collections.namedtuple('Outcome', ['intent', 'latency', 'service_time', 'ok', 'degraded'])
+
+""" Response header of degraded answers, see `intent.py` """
+DEGRADED_HEADER = 'X-Answer-Degraded'
+
+
+def create_payloads(count, city_names, bill_range=(80, 200), seed=0, unknown_city_fraction=0.1):
+    """
+    This synthesizes requests, spread evenly over the intents, for the given cities
+
+    :param count: int
+    :param city_names: List[str]
+    :param bill_range: (int, int): range of the bills in the requests
+    :param seed: int
+    :param unknown_city_fraction: float: fraction of the requests for cities missing from the city table, which go
+                                  through the geocoder
+    :return: List[dict]
+    """
+    random_state = np.random.RandomState(seed)
+    payloads = []
+    for intent in itertools.islice(itertools.cycle(INTENTS), count):
+        bill_low = int(random_state.randint(bill_range[0], bill_range[1]))
+        bill_high = int(random_state.randint(bill_low, bill_range[1] + 1))
+        if random_state.rand() < unknown_city_fraction:
+            city_name = 'Unknown City %d' % random_state.randint(1000)
+        else:
+            city_name = city_names[random_state.randint(len(city_names))]
+        payloads.append(create_payload(intent, city=city_name,
+                                       bill_low=bill_low, bill_high=bill_high,
+                                       source='slack' if random_state.rand() < 0.5 else 'facebook'))
+    return payloads
+
+
+def load_payloads(file_path):
+    """
+    :param file_path: str: recorded requests, one JSON request per line
+    :return: List[dict]
+    """
+    with open(file_path) as payload_file:
+        return [json.loads(line) for line in payload_file if line.strip()]
+
+
+def create_local_sender(geocoder_latency=0.0, render_latency=0.0):
+    """
+    This loads the app in this process, with local fakes of the geocoder and the renderer
+
+    :param geocoder_latency: float: seconds each geocoding takes
+    :param render_latency: float: seconds each chart takes to render
+    :return: function(payload) returning the HTTP status code, and the reason the answer was degraded, or None
+    """
+    import app
+    import climate_data
+    import intent
+
+    climate_data.set_geocoder(FakeGeocoder(geocoder_latency))
+    intent.chart_renderer.render_function = FakeRenderer(render_latency)
+
+    local = threading.local()
+
+    def send(payload):
+        if not hasattr(local, 'client'):
+            local.client = app.app.server.test_client()
+        response = local.client.post('/intent', json=payload)
+        return response.status_code, response.headers.get(DEGRADED_HEADER)
+
+    return send
+
+
+def create_http_sender(url, timeout=10.0):
+    """
+    :param url: str: root URL of a running server, e.g., `http://localhost:8000`
+    :param timeout: float: seconds
+    :return: function(payload) returning the HTTP status code, and the reason the answer was degraded, or None
+    """
+    import requests
+
+    local = threading.local()
+
+    def send(payload):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        response = local.session.post(url.rstrip('/') + '/intent', json=payload, timeout=timeout)
+        return response.status_code, response.headers.get(DEGRADED_HEADER)
+
+    return send
+
+
+def replay(send, payloads, rate, duration, concurrency=32):
+    """
+    This sends requests at a constant rate, cycling through the payloads
+
+    :param send: function(payload) returning the HTTP status code, and the reason the answer was degraded
+    :param payloads: List[dict]
+    :param rate: float: requests per second
+    :param duration: float: seconds
+    :param concurrency: int: maximum number of requests in flight
+    :return: a pair: List[Outcome], and the number of seconds the replay took
+    """
+    request_count = max(1, int(rate * duration))
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency)
+    futures = []
+    start = time.perf_counter()
+    try:
+        for index, payload in enumerate(itertools.islice(itertools.cycle(payloads), request_count)):
+            due = start + index / rate
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(executor.submit(_send, send, payload, due))
+        outcomes = [future.result() for future in futures]
+    finally:
+        executor.shutdown(wait=True)
+    return outcomes, time.perf_counter() - start
+
+
+def _send(send, payload, due):
+    intent = payload.get('queryResult', {}).get('intent', {}).get('displayName', 'unknown')
+    sent = time.perf_counter()
+    try:
+        status, degraded_reason = send(payload)
+        ok = status == 200
+    except Exception:
+        ok = False
+        degraded_reason = None
+    answered = time.perf_counter()
+    return Outcome(intent, answered - due, answered - sent, ok, ok and degraded_reason is not None)
+
+
+def summarize(outcomes, elapsed):
+    """
+    :param outcomes: List[Outcome]
+    :param elapsed: float: seconds the replay took
+    :return: Results: overall (`load_replay`), and per intent (`load_replay <intent>`)
+    """
+    results = Results()
+    groups = [('load_replay', outcomes)]
+    for intent in sorted(set(outcome.intent for outcome in outcomes)):
+        groups.append(('load_replay %s' % intent, [outcome for outcome in outcomes if outcome.intent == intent]))
+
+    for benchmark, group in groups:
+        latencies = np.array([outcome.latency for outcome in group]) * 1000
+        service_times = np.array([outcome.service_time for outcome in group]) * 1000
+        errors = sum(1 for outcome in group if not outcome.ok)
+        degraded = sum(1 for outcome in group if outcome.degraded)
+        results.record(benchmark, 'requests', len(group), 'requests')
+        results.record(benchmark, 'throughput', (len(group) - errors) / elapsed, 'requests/s', higher_is_better=True)
+        results.record(benchmark, 'error_rate', errors / len(group), 'ratio')
+        results.record(benchmark, 'degraded_rate', degraded / len(group), 'ratio')
+        for percentile in (50, 90, 99):
+            results.record(benchmark, 'p%d' % percentile, np.percentile(latencies, percentile), 'ms')
+        results.record(benchmark, 'max', np.max(latencies), 'ms')
+        results.record(benchmark, 'service_p50', np.percentile(service_times, 50), 'ms')
+    return results
+
+
+def format_summary(results):
+    lines = ['%-50s %9s %12s %8s %9s %9s %9s %9s %9s' % ('benchmark', 'requests', 'throughput', 'errors', 'degraded',
+                                                          'p50 (ms)', 'p90 (ms)', 'p99 (ms)', 'max (ms)')]
+    for benchmark, metrics in sorted(results.results.items()):
+        values = {metric: measurement['value'] for metric, measurement in metrics.items()}
+        lines.append('%-50s %9d %10.1f/s %7.1f%% %8.1f%% %9.1f %9.1f %9.1f %9.1f' % (
+            benchmark, values['requests'], values['throughput'], values['error_rate'] * 100,
+            values['degraded_rate'] * 100, values['p50'], values['p90'], values['p99'], values['max']))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay DialogFlow webhook requests against /intent')
+    parser.add_argument('--rate', type=float, default=10, help='requests per second')
+    parser.add_argument('--duration', type=float, default=30, help='seconds')
+    parser.add_argument('--concurrency', type=int, default=32, help='maximum number of requests in flight')
+    parser.add_argument('--payloads', help='recorded requests, one JSON request per line; synthesized if not given')
+    parser.add_argument('--cities', type=int, default=50, help='number of cities in the synthesized requests')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthesized requests')
+    parser.add_argument('--unknown-cities', type=float, default=0.1,
+                        help='fraction of the synthesized requests for cities missing from the city table')
+    parser.add_argument('--url', help='root URL of a running server; the app runs in this process if not given')
+    parser.add_argument('--geocoder-latency', type=float, default=0.0, help='seconds each fake geocoding takes')
+    parser.add_argument('--render-latency', type=float, default=0.0, help='seconds each fake chart render takes')
+    parser.add_argument('--warm-up', type=int, default=20, help='number of requests sent before measuring')
+    parser.add_argument('--output', help='where results are written as JSON, e.g., for `benchmarks.compare`')
+
+    args = parser.parse_args()
+
+    if args.url:
+        sender = create_http_sender(args.url)
+    else:
+        sender = create_local_sender(args.geocoder_latency, args.render_latency)
+
+    if args.payloads:
+        requests_to_replay = load_payloads(args.payloads)
+    else:
+        from api.city.city_service import CityService
+
+        city_table = CityService().get_city_table()
+        names = [city.city for city in itertools.islice(city_table.by_population(), args.cities)]
+        requests_to_replay = create_payloads(max(len(INTENTS), int(args.rate * args.duration)), names, seed=args.seed,
+                                             unknown_city_fraction=args.unknown_cities)
+
+    warm_up_payloads = itertools.cycle(requests_to_replay)
+    time_calls(lambda: sender(next(warm_up_payloads)), args.warm_up)
+
+    replay_outcomes, replay_time = replay(sender, requests_to_replay, args.rate, args.duration, args.concurrency)
+    replay_results = summarize(replay_outcomes, replay_time)
+    print(format_summary(replay_results))
+
+    if args.output:
+        from benchmarks.run import write_results
+
+        write_results(args.output, replay_results)
+    overall = replay_results.results['load_replay']
+    sys.exit(1 if overall['error_rate']['value'] > 0 else 0)
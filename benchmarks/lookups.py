@@ -0,0 +1,28 @@
+"""
+Micro-benchmarks of the city and station lookups, on the reference data in `data/`.
+"""
+import itertools
+
+from benchmarks.common import time_calls
+
+
+def run(results, options):
+    from api.city.city_service import CityService
+    import climate_data
+
+    city_service = CityService()
+    results.record_latencies('city_table.load', time_calls(city_service.get_city_table, 1))
+    city_table = city_service.get_city_table()
+
+    cities = list(itertools.islice(city_table.by_population(), options.cities))
+    names = itertools.cycle([city.city for city in cities])
+    coordinates = itertools.cycle([(city.lat, city.lon) for city in cities])
+
+    results.record_latencies('city_table.find',
+                             time_calls(lambda: city_table.find('city', next(names)), options.repeat))
+    results.record_latencies('climate_data.fetch_city_by_name',
+                             time_calls(lambda: climate_data.fetch_city_by_name(next(names)), options.repeat))
+    results.record_latencies('climate_data.find_nearest_station',
+                             time_calls(lambda: climate_data.find_nearest_station(*next(coordinates)), options.repeat))
+    results.record_latencies('climate_data.get_climate',
+                             time_calls(lambda: climate_data.get_climate(next(names)), options.repeat))
@@ -0,0 +1,52 @@
+"""
+DialogFlow webhook requests (the JSON posted to `/intent`), for each intent handled by `intent.handle_intent_request`.
+"""
+
+""" Intents answered by `handle_intent_request` """
+ADDRESS_INTENT = 'Bill inquiry - address'
+BILL_INTENT = 'Bill inquiry - address - bill'
+BILL_MORE_INTENT = 'Bill inquiry - address - bill - more'
+PRODUCT_INTENT = 'Product inquiry'
+
+INTENTS = [ADDRESS_INTENT, BILL_INTENT, BILL_MORE_INTENT, PRODUCT_INTENT]
+
+_SESSION = 'projects/oikolab/agent/sessions/benchmark'
+
+
+def create_payload(intent, city='Boston', bill_low=100, bill_high=150, source='slack'):
+    """
+    :param intent: str: one of `INTENTS`
+    :param city: str
+    :param bill_low: float
+    :param bill_high: float
+    :param source: str: `slack` or `facebook`
+    :return: dict
+    """
+    query_result = {
+        'queryText': city,
+        'intent': {'displayName': intent},
+        'parameters': {},
+        'fulfillmentText': '',
+        'fulfillmentMessages': [],
+    }
+
+    if intent == ADDRESS_INTENT:
+        query_result['parameters'] = {'geo-city': city}
+    elif intent == BILL_INTENT:
+        query_result['outputContexts'] = [_create_context({'geo-city': city, 'bill-low': [bill_low],
+                                                           'bill-high': [bill_high]})]
+    elif intent == BILL_MORE_INTENT:
+        query_result['outputContexts'] = [_create_context({'geo-city': city,
+                                                           'bill-low': {'amount': bill_low, 'currency': 'USD'},
+                                                           'bill-high': {'amount': bill_high, 'currency': 'USD'}})]
+
+    return {
+        'responseId': 'benchmark',
+        'session': _SESSION,
+        'queryResult': query_result,
+        'originalDetectIntentRequest': {'source': source, 'payload': {}},
+    }
+
+
+def _create_context(parameters):
+    return {'name': '%s/contexts/generic' % _SESSION, 'lifespanCount': 5, 'parameters': parameters}
@@ -0,0 +1,119 @@
+"""
+This runs the benchmark suites, and stores their results as JSON, e.g.:
+`python -m benchmarks.run --output benchmarks/results/latest.json --baseline benchmarks/results/baseline.json`
+
+Suites:
+- lookups: city and station lookups
+- ingest: `Preprocessor.process` (cities per second, peak memory), and the validation of a month
+- serving: `WeatherService.get_weather_data_set` and `/weather` (latency, cold and warm)
+- intents: `/intent`, for each intent (latency, cold and warm)
+- import_time: how long the app and the CLIs take to import
+- concurrency: `/weather` under concurrent requests and slow S3, served by gunicorn's sync or threaded workers
+
+Each suite runs in its own process, so cold latencies and peak memory are not affected by the other suites.
+Run it from the root of the repository, weather data is synthetic and written to a temporary folder.
+"""
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.common import Results, get_metadata
+from benchmarks.compare import compare, format_report, load_results
+
+SUITES = ['lookups', 'ingest', 'serving', 'intents', 'import_time', 'concurrency']
+
+
+def run_suite(suite, options):
+    """
+    This runs a suite in this process
+
+    :param suite: str: one of `SUITES`
+    :param options: arguments of the command line
+    :return: Results
+    """
+    results = Results()
+    importlib.import_module('benchmarks.%s' % suite).run(results, options)
+    return results
+
+
+def run_suite_process(suite, options):
+    """
+    This runs a suite in a new process
+
+    :param suite: str: one of `SUITES`
+    :param options: arguments of the command line
+    :return: dict: results in the JSON format, None if the suite failed
+    """
+    output = os.path.join(options.work_folder, '%s.json' % suite)
+    command = [sys.executable, '-m', 'benchmarks.run', '--suite', suite, '--in-process', '--output', output,
+               '--repeat', str(options.repeat), '--cities', str(options.cities), '--days', str(options.days),
+               '--work-folder', options.work_folder]
+    if subprocess.call(command) != 0:
+        return None
+    return load_results(output)
+
+
+def write_results(output, results):
+    folder = os.path.dirname(output)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder, exist_ok=True)
+    with open(output, 'w') as output_file:
+        json.dump({'metadata': get_metadata(), 'results': results.results}, output_file, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the benchmark suites')
+    parser.add_argument('--suite', action='append', choices=SUITES, help='a suite to run, defaults to all of them')
+    parser.add_argument('--output', default=os.path.join('benchmarks', 'results', 'latest.json'),
+                        help='where results are written')
+    parser.add_argument('--baseline', help='results of a baseline run, to compare with')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative change a metric must worsen by to be a regression, e.g., 0.2 for 20%%')
+    parser.add_argument('--repeat', type=int, default=50, help='number of calls timed per benchmark')
+    parser.add_argument('--cities', type=int, default=20, help='number of cities looked up and ingested')
+    parser.add_argument('--days', type=int, default=1, help='number of days in each synthetic weather file')
+    parser.add_argument('--work-folder', help='where synthetic weather data is written, defaults to a temporary folder')
+    parser.add_argument('--in-process', action='store_true', help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+    suites = args.suite or SUITES
+
+    if args.in_process:
+        write_results(args.output, run_suite(suites[0], args))
+        sys.exit(0)
+
+    temporary_folder = None
+    if args.work_folder is None:
+        temporary_folder = tempfile.TemporaryDirectory(prefix='benchmarks-')
+        args.work_folder = temporary_folder.name
+
+    all_results = Results()
+    failed_suites = []
+    try:
+        for suite in suites:
+            print('Running %s...' % suite)
+            suite_results = run_suite_process(suite, args)
+            if suite_results is None:
+                failed_suites.append(suite)
+            else:
+                all_results.update(suite_results)
+    finally:
+        if temporary_folder is not None:
+            temporary_folder.cleanup()
+
+    write_results(args.output, all_results)
+    print('Results written to %s' % args.output)
+
+    regressed = False
+    if args.baseline:
+        comparisons = compare(load_results(args.baseline), all_results.results, args.threshold)
+        print(format_report(comparisons))
+        regressed = any(comparison.regressed for comparison in comparisons)
+
+    if failed_suites:
+        print('Failed suites: %s' % ', '.join(failed_suites))
+    sys.exit(1 if regressed or failed_suites else 0)
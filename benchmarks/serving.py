@@ -0,0 +1,38 @@
+"""
+Benchmarks of reading processed weather files: `WeatherService.get_weather_data_set`, and the `/weather` endpoint.
+The processed files are synthetic (see `fixture.py`), `/weather` reads them through `WEATHER_DATA_PATH`.
+"""
+import os
+
+from benchmarks import fixture
+from benchmarks.common import time_calls
+
+
+def run(results, options):
+    from api.outgest.weather_service import WeatherService
+
+    data_path = os.path.join(options.work_folder, 'serving') + '/'
+    city_service = fixture.create_processed_files(data_path, year=2017, city_count=3, days=options.days)
+    city_name = city_service.get_city_table().get(0).city
+
+    weather_service = WeatherService(data_path, city_service=city_service)
+    results.record_latencies('weather_service.get_weather_data_set',
+                             time_calls(lambda: weather_service.get_weather_data_set(2017, 1, city_name),
+                                        options.repeat))
+
+    # the app reads its weather data path once, when it's imported
+    os.environ['WEATHER_DATA_PATH'] = data_path
+    import app
+
+    client = app.app.server.test_client()
+
+    def get_weather():
+        response = client.get('/weather', query_string={'y': 2017, 'city': city_name})
+        try:
+            if response.status_code != 200 or response.mimetype == 'text/html':
+                raise Exception('/weather failed: %s' % response.get_data(as_text=True)[:200])
+            response.get_data()
+        finally:
+            response.close()
+
+    results.record_latencies('/weather', time_calls(get_weather, options.repeat))
@@ -16,4 +16,9 @@ touch ~/.cdsapirc
 echo $CDS_API_URL > ~/.cdsapirc
 echo $CDS_API_KEY >> ~/.cdsapirc
 
-gunicorn app:server -b :8000 --chdir /src/
\ No newline at end of file
+# Prometheus metrics of all gunicorn workers are aggregated in this folder, it must be empty on start
+export prometheus_multiproc_dir=/tmp/prometheus-multiproc
+rm -rf $prometheus_multiproc_dir
+mkdir -p $prometheus_multiproc_dir
+
+gunicorn app:server -c /src/gunicorn.conf.py --chdir /src/
\ No newline at end of file
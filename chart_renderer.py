@@ -0,0 +1,150 @@
+"""
+This renders chart images (PNG) for the chat bot, away from the webhook thread.
+
+Images are content-addressed: the file name is a hash of the figure, so the same chart is rendered only once and shared
+by every later request. The folder is bounded, the least recently used images are evicted first.
+"""
+import concurrent.futures
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+from api.core.metrics import STAGE_RENDER, count_cache_lookup, time_stage
+
+
+class ChartRenderer:
+
+    def __init__(self, static_folder='assets', cache_folder='charts', max_files=500, max_bytes=100 * 1024 * 1024,
+                 worker_count=2, render_function=None):
+        """
+        Constructor
+
+        :param static_folder: str: folder served as static files
+        :param cache_folder: str: sub-folder of the static folder, where rendered images are stored
+        :param max_files: int: maximum number of images kept
+        :param max_bytes: int: maximum total size of the images kept
+        :param worker_count: int: number of images that can be rendered at the same time
+        :param render_function: function(figure_dict, file_path), defaults to rendering through plotly orca
+        """
+        self.static_folder = static_folder
+        self.cache_folder = cache_folder
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.worker_count = worker_count
+        self.render_function = render_function if render_function is not None else _write_image
+        self._executor = None
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def get_file_name(self, figure_dict):
+        """
+        This returns the file name (relative to the static folder) of the image of a figure
+
+        :param figure_dict: dict: plotly figure
+        :return: str
+        """
+        content = json.dumps(figure_dict, sort_keys=True, default=to_json)
+        digest = hashlib.sha1(content.encode('utf-8')).hexdigest()
+        return '%s/%s.png' % (self.cache_folder, digest)
+
+    def render(self, figure_dict, timeout=None):
+        """
+        This returns the image of a figure, rendering it if it has not been rendered yet.
+        If rendering takes longer than the timeout, it carries on in the background so later requests can use it.
+
+        :param figure_dict: dict: plotly figure
+        :param timeout: float: maximum number of seconds to wait, None to wait until it's rendered
+        :return: str: file name relative to the static folder, or None if the image is not ready in time
+        """
+        file_name = self.get_file_name(figure_dict)
+        full_path = os.path.join(self.static_folder, file_name)
+        if os.path.isfile(full_path):
+            count_cache_lookup('chart', True)
+            _touch(full_path)
+            return file_name
+
+        count_cache_lookup('chart', False)
+
+        with self._lock:
+            future = self._in_flight.get(file_name)
+            if future is None:
+                future = self._get_executor().submit(self._render, figure_dict, full_path)
+                self._in_flight[file_name] = future
+                future.add_done_callback(lambda done: self._in_flight.pop(file_name, None))
+
+        try:
+            future.result(timeout=timeout)
+        except Exception:  # including timeouts; callers fall back to an answer without the image
+            return None
+        return file_name
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.worker_count)
+        return self._executor
+
+    def _render(self, figure_dict, full_path):
+        folder = os.path.dirname(full_path)
+        if not os.path.exists(folder):
+            os.makedirs(folder, exist_ok=True)
+
+        # render aside, so a partially written image is never served
+        temp_path = '%s.%d.tmp' % (full_path, threading.get_ident())
+        try:
+            with time_stage(STAGE_RENDER):
+                self.render_function(figure_dict, temp_path)
+            os.replace(temp_path, full_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        self._evict(folder)
+
+    def _evict(self, folder):
+        """ Removes the least recently used images, until the folder is within its bounds """
+        entries = []
+        for entry in os.scandir(folder):
+            if entry.is_file() and entry.name.endswith('.png'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        entries.sort()
+        while entries and (len(entries) > self.max_files or total_bytes > self.max_bytes):
+            _, size, path = entries.pop(0)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_bytes = total_bytes - size
+
+
+def _write_image(figure_dict, file_path):
+    import plotly.graph_objs as go
+    import plotly.io as pio
+
+    pio.write_image(go.Figure(figure_dict), file_path, format='png')
+
+
+def _touch(full_path):
+    try:
+        os.utime(full_path)
+    except FileNotFoundError:
+        pass
+
+
+def to_json(value):
+    """
+    This converts the numpy values of a figure, as in `json.dumps(figure, default=to_json)`
+
+    :param value: numpy array or scalar
+    :return: list, or a Python scalar
+    """
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError('%r is not JSON serializable' % value)
@@ -1,8 +1,20 @@
+import collections
+import datetime
+import functools
 import os
+import threading
+import warnings
 
-import pandas as pd
-from geopy.distance import geodesic
-from geopy.geocoders import Nominatim
+import numpy as np
+
+from api.city.city_service import CityService
+from api.core.metrics import STAGE_CITY_LOOKUP, STAGE_STATION_LOOKUP, count_cache_lookup, time_stage
+from api.core.grid import get_nearest_indices
+
+city_service = CityService()
+
+MONTHLY_TEMPERATURE_FILE = os.path.join('data', 'air.mon.mean.nc')
+STATION_FILE = os.path.join('data', 'epwlist.csv')
 
 
 def get_climate(city_name):
@@ -13,20 +25,103 @@ def get_climate(city_name):
     :param city_name:
     :return:
     """
+    with time_stage(STAGE_CITY_LOOKUP):
+        lat, lon, city = fetch_city_by_name(city_name)
+        if lat is None:
+            # Note that this option tends to be quite slow (~1.5s), so reserved for cases when city name can't be found.
+            lat, lon, city = _geocode_city(city_name)
+
+    with time_stage(STAGE_STATION_LOOKUP):
+        station = find_nearest_station(lat, lon)
+    return station, city
+
+
+def geocode_with_nominatim(city_name):
+    """
+    :param city_name: str
+    :return: a triple: latitude, longitude and the name of the city
+    """
+    from geopy.geocoders import Nominatim
+
     geolocator = Nominatim(user_agent="home-energy")
+    location = geolocator.geocode(city_name, addressdetails=True)
+    return location.latitude, location.longitude, location.raw['address']['city']
+
+
+""" Geocodes cities missing from the city table, see `set_geocoder` """
+geocoder = geocode_with_nominatim
+
+
+def set_geocoder(geocode_function):
+    """
+    This replaces the geocoder, e.g., by a local fake so load tests neither depend on nor load Nominatim
+
+    :param geocode_function: function(city_name) returning latitude, longitude and the name of the city
+    :return: None
+    """
+    global geocoder
+    geocoder = geocode_function
+    _geocode_city.cache_clear()
+
+
+@functools.lru_cache(maxsize=1024)
+def _geocode_city(city_name):
+    return geocoder(city_name)
+
+
+@functools.lru_cache(maxsize=1)
+def get_station_table():
+    """
+    This returns the list of EPW weather stations, loaded once per process.
+
+    :return: DataFrame
+    """
+    import pandas as pd
+
+    return pd.read_csv(STATION_FILE)
+
+
+@functools.lru_cache(maxsize=1)
+def get_station_coordinates():
+    """
+    This returns the station coordinates as read-only arrays, so they can be shared by forked workers.
+
+    :return: a pair of numpy arrays: latitudes and longitudes, in degrees
+    """
+    stations = get_station_table()
+    lats = np.array(stations['lat'].values, dtype=np.float64)
+    lons = np.array(stations['lon'].values, dtype=np.float64)
+    for coordinates in (lats, lons):
+        coordinates.flags.writeable = False
+    return lats, lons
+
+
+def find_nearest_station(lat, lon, candidate_count=5):
+    """
+    This returns the closest EPW weather station. Stations are first ranked with a vectorized great-circle distance,
+    then the closest few candidates are compared by their exact geodesic distance.
+
+    :param lat: float
+    :param lon: float
+    :param candidate_count: int: number of candidates compared by their geodesic distance
+    :return: Series: the station row; its name is the station id
+    """
+    from geopy.distance import geodesic
 
-    lat, lon, city = fetch_city_by_name(city_name)
-    if lat is None:
-        # Note that this option tends to be quite slow (~1.5s), so reserved for cases when city name can't be found.
-        location = geolocator.geocode(city_name, addressdetails=True)
-        lat, lon = location.latitude, location.longitude
-        city = location.raw['address']['city']
+    stations = get_station_table()
+    lats, lons = get_station_coordinates()
+    station_lats = np.radians(lats)
+    station_lons = np.radians(lons)
+    lat_radians, lon_radians = np.radians(lat), np.radians(lon)
 
-    df = pd.read_csv('epwlist.csv')
-    df['Distance'] = df.apply(lambda x: geodesic((x['lat'], x['lon']), (lat, lon)).kilometers, axis=1)
-    ID = df['Distance'].idxmin()
+    haversine = np.sin((station_lats - lat_radians) / 2) ** 2 + \
+        np.cos(station_lats) * np.cos(lat_radians) * np.sin((station_lons - lon_radians) / 2) ** 2
+    candidate_count = min(candidate_count, len(stations))
+    candidates = np.argpartition(haversine, candidate_count - 1)[:candidate_count]
 
-    return df.loc[ID], city
+    distances = [geodesic((lats[i], lons[i]), (lat, lon)).kilometers
+                 for i in candidates]
+    return stations.iloc[candidates[int(np.argmin(distances))]]
 
 
 def fetch_city_by_name(city_name):
@@ -36,26 +131,150 @@ def fetch_city_by_name(city_name):
     :param city_name: string:
     :return:
     """
-    cities = pd.read_csv(os.path.join('data', 'simplemaps-worldcities-basic.csv'))
-    cities['loc'] = cities['city'] + ', ' + cities['country']
-    cities = cities.sort_values('pop', ascending=False)
     lat, lon, city = None, None, None
 
-    if city_name in cities['city'].values:
-        city_in_csv = cities[cities['city'] == city_name]
-        if len(city_in_csv['lat'].values) == 1:
-            lat, lon = float(city_in_csv['lat'].values), float(
-                city_in_csv['lng'].values)
-
-        else:  # use the first one, if multiple are found
-            lat, lon = float(city_in_csv['lat'].values[0]), float(
-                city_in_csv['lng'].values[0])
-
+    # use the most populated one, if multiple are found
+    city_in_table = city_service.get_city(city_name)
+    if city_in_table is not None:
+        lat, lon = city_in_table.lat, city_in_table.lon
         city = city_name
 
     return lat, lon, city
 
 
+class MonthlyTemperatureGrid:
+    """
+    In-memory monthly temperature grids (in C) built from a 0.5 x 0.5 reanalysis downloaded from
+    https://www.esrl.noaa.gov/psd/data/gridded/data.ghcncams.html
+
+    For each calendar month it keeps the most recent year available, the climatology (mean of all the earlier years)
+    and the anomaly (most recent minus climatology). All lookups are vectorized over any number of coordinates.
+    """
+
+    def __init__(self, lats, lons, recent, climatology):
+        """
+        Constructor
+
+        :param lats: numpy array, monotonic latitudes of the grid
+        :param lons: numpy array, monotonic longitudes of the grid, within [0, 360)
+        :param recent: numpy array (12, lat, lon), most recent temperature of each calendar month, NaN if missing
+        :param climatology: numpy array (12, lat, lon), average temperature of each calendar month, NaN if missing
+        """
+        self.lats = lats
+        self.lons = lons
+        self.recent = recent
+        self.climatology = climatology
+        self.anomaly = recent - climatology
+
+    @classmethod
+    def from_file(cls, file_path):
+        """
+        This reads the monthly mean temperature file, one calendar month at a time to keep memory bounded.
+
+        :param file_path: str
+        :return: MonthlyTemperatureGrid
+        """
+        import xarray as xr
+
+        with xr.open_dataset(file_path) as monthly:
+            air = monthly.air
+            lats = np.asarray(monthly.lat.values, dtype=np.float64)
+            lons = np.asarray(monthly.lon.values, dtype=np.float64)
+            months = air['time.month'].values
+            years = air['time.year'].values
+
+            shape = (12, len(lats), len(lons))
+            recent = np.full(shape, np.nan, dtype=np.float32)
+            climatology = np.full(shape, np.nan, dtype=np.float32)
+            for month in range(1, 13):
+                time_indices = np.flatnonzero(months == month)
+                if len(time_indices) == 0:
+                    continue
+
+                time_indices = time_indices[np.argsort(years[time_indices], kind='mergesort')]
+                recent[month - 1] = air.isel(time=time_indices[-1]).values - 273.15
+                if len(time_indices) > 1:
+                    with warnings.catch_warnings():
+                        warnings.simplefilter('ignore', category=RuntimeWarning)  # all-NaN cells over the oceans
+                        climatology[month - 1] = np.nanmean(air.isel(time=time_indices[:-1]).values, axis=0) - 273.15
+
+        for grid in (recent, climatology):
+            grid.flags.writeable = False
+        return cls(lats, lons, recent, climatology)
+
+    def get_recent_temperature(self, lats, lons, month):
+        """
+        This returns the most recent average temperature of the given calendar month, at the nearest grid points.
+
+        :param lats: float or array-like of latitudes
+        :param lons: float or array-like of longitudes
+        :param month: int, 1 for January
+        :return: numpy array of float, NaN where no data is available
+        """
+        lat_indices, lon_indices = self._get_grid_indices(lats, lons)
+        return self.recent[month - 1, lat_indices, lon_indices]
+
+    def get_anomaly(self, lats, lons, month):
+        """
+        This returns the most recent temperature anomaly (against the climatology) of the given calendar month,
+        at the nearest grid points.
+
+        :param lats: float or array-like of latitudes
+        :param lons: float or array-like of longitudes
+        :param month: int, 1 for January
+        :return: numpy array of float, NaN where no data is available
+        """
+        lat_indices, lon_indices = self._get_grid_indices(lats, lons)
+        return self.anomaly[month - 1, lat_indices, lon_indices]
+
+    def _get_grid_indices(self, lats, lons):
+        lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+        lons = np.atleast_1d(np.asarray(lons, dtype=np.float64)) % 360
+        return get_nearest_indices(self.lats, lats), get_nearest_indices(self.lons, lons)
+
+
+_monthly_temperature_grid = None
+_monthly_temperature_grid_mtime = None
+_monthly_temperature_grid_lock = threading.Lock()
+
+
+def get_monthly_temperature_grid(file_path=MONTHLY_TEMPERATURE_FILE):
+    """
+    This returns the cached monthly temperature grid, rebuilding it whenever the source file has changed.
+
+    :param file_path: str
+    :return: MonthlyTemperatureGrid
+    """
+    return _get_monthly_temperature_grid_and_version(file_path)[0]
+
+
+def _get_monthly_temperature_grid_and_version(file_path=MONTHLY_TEMPERATURE_FILE):
+    """ The grid, and its version: what answers computed from it depend on, e.g., cached chat replies """
+    global _monthly_temperature_grid, _monthly_temperature_grid_mtime
+
+    mtime = os.path.getmtime(file_path)
+    if _monthly_temperature_grid is None or _monthly_temperature_grid_mtime != (file_path, mtime):
+        with _monthly_temperature_grid_lock:
+            if _monthly_temperature_grid is None or _monthly_temperature_grid_mtime != (file_path, mtime):
+                _monthly_temperature_grid = MonthlyTemperatureGrid.from_file(file_path)
+                _monthly_temperature_grid_mtime = (file_path, mtime)
+
+    with _monthly_temperature_grid_lock:
+        return _monthly_temperature_grid, _monthly_temperature_grid_mtime
+
+
+def get_monthly_anomalies(lats, lons, month):
+    """
+    This returns the previous month's temperature anomalies for many locations at once.
+
+    :param lats: array-like of latitudes
+    :param lons: array-like of longitudes
+    :param month: int, the current month; anomalies are for the month before
+    :return: numpy array of float, NaN where no data is available
+    """
+    return get_monthly_temperature_grid().get_anomaly(lats, lons, _get_previous_month(month))
+
+
 def get_monthly_ave_T(lat, lon, month):
     """
     0.5 x 0.5 reanalysis downloaded from
@@ -64,28 +283,117 @@ def get_monthly_ave_T(lat, lon, month):
     :param lat:
     :param lon:
     :param month:
-    :return:
+    :return: float: the most recent average temperature of the previous month, NaN if it's not available
     """
-    import xarray as xr
+    prev_month = _get_previous_month(month)
+    return float(get_monthly_temperature_grid().get_recent_temperature(lat, lon, prev_month)[0])
+
 
+def _get_previous_month(month):
     # Index of previous month
     months = [12, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11]
-    prev_month = months[month - 1]
+    return months[month - 1]
 
-    monthly = xr.open_dataset('data/air.mon.mean.nc')
-    subset = monthly.sel(lat=lat, lon=lon % 360, method='nearest').air
 
-    subset = subset.sel(time=slice('2018', '2019'))
-    subset = subset.where(subset.time.dt.month == prev_month, drop=True)
+class ChatReplyCache:
+    """
+    Replies of `chat_about_city` only depend on the weather station, the current month, the temperature unit and the
+    monthly temperature grid. This keeps them per (station id, temp unit), and clears itself as soon as the month rolls
+    over, or the grid changes (e.g., `air.mon.mean.nc` is updated with the past month).
+    """
 
-    return float(subset.values - 273.15)
+    def __init__(self, max_size=4096):
+        """
+        Constructor
+
+        :param max_size: int: maximum number of replies kept, the least recently used ones are evicted first
+        """
+        self.max_size = max_size
+        self.version = None
+        self.replies = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, station_id, month, temp_unit, grid_version=None):
+        """
+        :param station_id:
+        :param month: int: the current month
+        :param temp_unit: str
+        :param grid_version: the version of the monthly temperature grid, e.g., its modification time
+        :return: dict, or None if the reply is not cached
+        """
+        with self.lock:
+            self._roll_over((month, grid_version))
+            key = (station_id, temp_unit)
+            reply = self.replies.get(key)
+            if reply is not None:
+                self.replies.move_to_end(key)
+            return reply
+
+    def put(self, station_id, month, temp_unit, reply, grid_version=None):
+        with self.lock:
+            self._roll_over((month, grid_version))
+            self.replies[(station_id, temp_unit)] = reply
+            while len(self.replies) > self.max_size:
+                self.replies.popitem(last=False)
+
+    def _roll_over(self, version):
+        if self.version != version:
+            self.replies.clear()
+            self.version = version
+
+
+chat_reply_cache = ChatReplyCache()
+
+
+def warm_chat_reply_cache(city_count=200, temp_units=('F', 'C')):
+    """
+    This pre-computes the replies for the most populated cities, so the common intents are answered from memory.
 
+    :param city_count: int: number of cities, by descending population
+    :param temp_units: List[str]
+    :return: int: number of cities warmed up
+    """
+    now = datetime.datetime.now()
+    count = 0
+    for city in city_service.get_city_table().by_population():
+        if count >= city_count:
+            break
+        station = find_nearest_station(city.lat, city.lon)
+        for temp_unit in temp_units:
+            chat_about_city(station, city.city, temp_unit, now)
+        count = count + 1
+    return count
+
+
+def chat_about_city(climate, city, temp_unit, now=None):
+    """
+    This describes the climate of the city, and how the past month compares to its average.
 
-def chat_about_city(climate, city, temp_unit):
-    import datetime
-    from dateutil.relativedelta import relativedelta
+    :param climate: Series: the closest weather station, as returned by `get_climate`
+    :param city: str
+    :param temp_unit: str: 'F' or 'C'
+    :param now: datetime: defaults to now
+    :return: dict: with `winter`, `summer` and `general` replies
+    """
+    if now is None:
+        now = datetime.datetime.now()
+
+    grid_version = _get_monthly_temperature_grid_and_version()[1]
+    station_chat = chat_reply_cache.get(climate.name, now.month, temp_unit, grid_version)
+    count_cache_lookup('chat_reply', station_chat is not None)
+    if station_chat is None:
+        station_chat = _chat_about_station(climate, temp_unit, now)
+        chat_reply_cache.put(climate.name, now.month, temp_unit, station_chat, grid_version)
+
+    chat = {'winter': station_chat.get('winter'),
+            'summer': station_chat.get('summer'),
+            'general': 'Ah %s! FYI, the climate zone is %s. %s' % (city, climate['ClimateZone'],
+                                                                   station_chat['comment'])}
+    return chat
 
-    now = datetime.datetime.now()
+
+def _chat_about_station(climate, temp_unit, now):
+    from dateutil.relativedelta import relativedelta
 
     if temp_unit == 'F':
         design_heating_T = int(climate['design_heating_T'] * 1.8 + 32)
@@ -147,11 +455,13 @@ def chat_about_city(climate, city, temp_unit):
 
     recent_average = get_monthly_ave_T(climate['lat'], climate['lon'], now.month)
 
-    ave_diff = recent_average - climate[str(now.month - 1)]
+    ave_diff = recent_average - climate[str(_get_previous_month(now.month))]
     last_month = now - (relativedelta(months=1))
 
     # Generate comparison for the past data
-    if ave_diff > 2:
+    if np.isnan(ave_diff):
+        comment = 'We do not have the records of the past %s yet.' % last_month.strftime("%B")
+    elif ave_diff > 2:
         comment = 'The past month has been unusually warmer than the average %s.' % last_month.strftime("%B")
     elif ave_diff > 1 and ave_diff <= 2:
         comment = 'The past month has been somewhat warmer than the average %s.' % last_month.strftime("%B")
@@ -162,6 +472,6 @@ def chat_about_city(climate, city, temp_unit):
     else:  # ave_diff < -2
         comment = 'The past month has been unusually colder than the average %s.' % last_month.strftime("%B")
 
-    chat['general'] = 'Ah %s! FYI, the climate zone is %s. %s' % (city, climate['ClimateZone'], comment)
+    chat['comment'] = comment
 
     return chat
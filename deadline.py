@@ -0,0 +1,51 @@
+"""
+Time budget of a request. DialogFlow gives up on a webhook after a few seconds, so expensive steps are run under the
+request's deadline, and callers fall back to the best answer they have when it runs out.
+"""
+import concurrent.futures
+import time
+
+from async_io import get_io_executor
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class Deadline:
+
+    def __init__(self, seconds):
+        """
+        Constructor
+
+        :param seconds: float: time budget, starting now
+        """
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        """
+        :return: float: number of seconds left, 0 if the deadline has passed
+        """
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def run(self, function, *args, **kwargs):
+        """
+        This runs a function, waiting no longer than the time left. A step that runs out of time carries on in the
+        background, so whatever it caches benefits the following requests.
+        Steps run on the I/O pool of the process (see `async_io.py`), so the request thread can stop waiting for them.
+
+        :param function: the expensive step
+        :return: what the function returns
+        :raise DeadlineExceeded: if the function does not finish in time
+        """
+        if self.expired():
+            raise DeadlineExceeded()
+
+        future = get_io_executor().submit(function, *args, **kwargs)
+        try:
+            return future.result(timeout=self.remaining())
+        except concurrent.futures.TimeoutError:
+            raise DeadlineExceeded()
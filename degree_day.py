@@ -0,0 +1,102 @@
+"""
+Degree-day engine on top of the ECMWF ERA5 monthly mean 2m temperature grid (`data/T2_monthly_mean_[year].nc`).
+
+The grid is loaded once per process, with its time coordinate decoded, so degree-days for any number of locations are
+computed in a single vectorized call.
+"""
+import os
+import threading
+
+import numpy as np
+
+from api.core.grid import get_nearest_indices
+
+
+class DegreeDayEngine:
+
+    def __init__(self, times, lats, lons, temperature):
+        """
+        Constructor
+
+        :param times: DatetimeIndex, the month of each time step
+        :param lats: numpy array, monotonic latitudes of the grid
+        :param lons: numpy array, monotonic longitudes of the grid, within [0, 360)
+        :param temperature: numpy array (time, lat, lon), monthly mean temperature in C
+        """
+        self.times = times
+        self.lats = lats
+        self.lons = lons
+        self.temperature = temperature
+        self.days_in_month = np.asarray(times.days_in_month, dtype=np.float64)
+
+    @classmethod
+    def from_file(cls, file_path):
+        """
+        :param file_path: str
+        :return: DegreeDayEngine
+        """
+        import pandas as pd
+        import xarray as xr
+
+        with xr.open_dataset(file_path, decode_times=False) as t2:
+            # time is stored as an integer date, e.g., 20170101
+            times = pd.to_datetime(np.array(t2.time).astype(int).astype(str))
+            lats = np.asarray(t2.lat.values, dtype=np.float64)
+            lons = np.asarray(t2.lon.values, dtype=np.float64)
+            temperature = np.asarray(t2.var167.values - 273.15, dtype=np.float32)
+
+        temperature.flags.writeable = False
+        return cls(times, lats, lons, temperature)
+
+    def get_monthly_temperature(self, lats, lons):
+        """
+        This returns the monthly mean temperature at the nearest grid points.
+
+        :param lats: array-like of latitudes
+        :param lons: array-like of longitudes
+        :return: numpy array (location, month) in C
+        """
+        lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+        lons = np.atleast_1d(np.asarray(lons, dtype=np.float64)) % 360
+        lat_indices = get_nearest_indices(self.lats, lats)
+        lon_indices = get_nearest_indices(self.lons, lons)
+        return self.temperature[:, lat_indices, lon_indices].T
+
+    def get_monthly_degree_days(self, lats, lons, heating_base=18.0, cooling_base=18.0):
+        """
+        This returns the monthly heating and cooling degree-days, estimated from the monthly mean temperature.
+
+        :param lats: array-like of latitudes
+        :param lons: array-like of longitudes
+        :param heating_base: float or array-like (one per location), base temperature in C for heating degree-days
+        :param cooling_base: float or array-like (one per location), base temperature in C for cooling degree-days
+        :return: a pair of numpy arrays (location, month): heating degree-days, and cooling degree-days
+        """
+        temperature = self.get_monthly_temperature(lats, lons)
+        heating_base = np.asarray(heating_base, dtype=np.float64).reshape(-1, 1)
+        cooling_base = np.asarray(cooling_base, dtype=np.float64).reshape(-1, 1)
+
+        hdd = np.clip(heating_base - temperature, 0, None) * self.days_in_month
+        cdd = np.clip(temperature - cooling_base, 0, None) * self.days_in_month
+        return hdd, cdd
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_degree_day_engine(year=2017):
+    """
+    This returns the degree-day engine for the given year, loaded once per process.
+
+    :param year: int
+    :return: DegreeDayEngine
+    """
+    engine = _engines.get(year)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(year)
+            if engine is None:
+                engine = DegreeDayEngine.from_file(os.path.join('data', 'T2_monthly_mean_%d.nc' % year))
+                _engines[year] = engine
+    return engine
@@ -0,0 +1,159 @@
+"""
+A server-side cache for dashboard figures.
+
+Figures are kept in a small in-process LRU, in front of a SQLite store on the local disk that is shared by all the
+workers of the host, so a figure computed by one worker is served by every other one. The store is an LRU as well:
+the access time of the figures served is written back in batches, at most every `touch_interval` seconds.
+"""
+import collections
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from api.core.metrics import count_cache_lookup
+from chart_renderer import to_json
+
+
+class FigureCache:
+
+    def __init__(self, store_path, max_size=256, max_stored=20000, touch_interval=60):
+        """
+        Constructor
+
+        :param store_path: str: path to the SQLite file shared by the workers, None to only cache in-process
+        :param max_size: int: maximum number of figures kept in-process
+        :param max_stored: int: maximum number of figures kept in the shared store
+        :param touch_interval: float: seconds between the writes of the access times to the shared store
+        """
+        self.store_path = store_path
+        self.max_size = max_size
+        self.max_stored = max_stored
+        self.figures = collections.OrderedDict()
+        self.touch_interval = touch_interval
+        self.lock = threading.Lock()
+        self._local = threading.local()
+        self._touched = set()
+        self._touched_time = time.time()
+
+    @staticmethod
+    def get_key(*inputs):
+        """
+        :param inputs: JSON-serializable inputs, e.g., location and bill range
+        :return: str
+        """
+        return json.dumps(inputs, sort_keys=True)
+
+    def get(self, key):
+        """
+        :param key: str
+        :return: dict, or None if the figure is not cached
+        """
+        with self.lock:
+            figure = self.figures.get(key)
+            if figure is not None:
+                self.figures.move_to_end(key)
+        if figure is None:
+            figure = self._get_stored(key)
+            if figure is not None:
+                self._put_in_process(key, figure)
+
+        if figure is not None:
+            self._touch(key)
+        return figure
+
+    def put(self, key, figure):
+        """
+        :param key: str
+        :param figure: dict
+        :return: dict: the cached figure, with its arrays converted into lists
+        """
+        content = json.dumps(figure, default=to_json)
+        figure = json.loads(content)
+        self._put_in_process(key, figure)
+        self._put_stored(key, content)
+        return figure
+
+    def get_or_create(self, key, create_figure):
+        """
+        :param key: str
+        :param create_figure: function() returning the figure, called if it's not cached
+        :return: dict
+        """
+        figure = self.get(key)
+        count_cache_lookup('figure', figure is not None)
+        if figure is None:
+            figure = self.put(key, create_figure())
+        return figure
+
+    def contains(self, key):
+        with self.lock:
+            if key in self.figures:
+                return True
+        return self._get_stored(key) is not None
+
+    def _put_in_process(self, key, figure):
+        with self.lock:
+            self.figures[key] = figure
+            self.figures.move_to_end(key)
+            while len(self.figures) > self.max_size:
+                self.figures.popitem(last=False)
+
+    def _touch(self, key):
+        """ Records an access; access times are written to the shared store in one transaction, once in a while """
+        with self.lock:
+            self._touched.add(key)
+            now = time.time()
+            if now - self._touched_time < self.touch_interval:
+                return
+            keys = self._touched
+            self._touched = set()
+            self._touched_time = now
+
+        if self.store_path is None:
+            return
+        try:
+            connection = self._get_connection()
+            with connection:
+                connection.executemany('UPDATE figures SET accessed = ? WHERE key = ?', [(now, key) for key in keys])
+        except sqlite3.Error:
+            pass  # the figures are evicted a little earlier
+
+    def _get_connection(self):
+        """ One connection per thread and process; connections must not be shared across a fork """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.store_path, timeout=5)
+            connection.execute('CREATE TABLE IF NOT EXISTS figures '
+                               '(key TEXT PRIMARY KEY, figure TEXT NOT NULL, accessed REAL NOT NULL)')
+            connection.commit()
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _get_stored(self, key):
+        if self.store_path is None:
+            return None
+        try:
+            row = self._get_connection().execute('SELECT figure FROM figures WHERE key = ?', (key,)).fetchone()
+        except sqlite3.Error:
+            return None
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def _put_stored(self, key, content):
+        if self.store_path is None:
+            return
+        try:
+            connection = self._get_connection()
+            with connection:
+                connection.execute('INSERT OR REPLACE INTO figures (key, figure, accessed) VALUES (?, ?, ?)',
+                                   (key, content, time.time()))
+                connection.execute('DELETE FROM figures WHERE key IN '
+                                   '(SELECT key FROM figures ORDER BY accessed DESC LIMIT -1 OFFSET ?)',
+                                   (self.max_stored,))
+        except sqlite3.Error:
+            pass  # the shared store is an optimisation, the in-process cache still holds the figure
+
@@ -2,26 +2,38 @@
 This class takes any responsibility in creation of a graph.
 """
 import numpy as np
-import pandas as pd
-import xarray as xr
+
 from climate_data import fetch_city_by_name
+from degree_day import get_degree_day_engine
 
 # Constants
 year = 2017  # We are always looking at data from 2017
+cooling_base_temperature = 18  # in C
 
 
 def create_electricity_consumption_graph(city_name, elec_use):
-    lat, lon, city_name = fetch_city_by_name(city_name)
-
-    color_capacity = 0.7
-    color_border_capacity = 1.0
-
-    winter_t, summer_t, ave_t = get_subset(year, lat, lon)
+    lat, lon, _ = fetch_city_by_name(city_name)
+    if lat is None:
+        raise Exception('Cannot find the city: %s' % city_name)
 
     elec_min = elec_use[0]
     elec_max = elec_use[1]
-    elec_base, elec_hvac = calculate_electricity(ave_t, elec_min, elec_max)
+    elec_base, elec_hvac = calculate_electricity_for_locations([lat], [lon], elec_min, elec_max)
+
+    return create_electricity_figure(elec_base[0], elec_hvac[0], elec_max)
+
 
+def create_electricity_figure(elec_base, elec_hvac, elec_max, color_capacity=0.7, color_border_capacity=1.0):
+    """
+    This returns the monthly electricity usage bar chart, as a plotly figure dictionary
+
+    :param elec_base: array: monthly baseline electricity bill
+    :param elec_hvac: array: monthly electricity bill spent on cooling
+    :param elec_max: the maximum bill, used to scale the y axis
+    :param color_capacity: float: opacity of the bars
+    :param color_border_capacity: float: opacity of the bar borders
+    :return: dict
+    """
     return {
         'data': [{'x': ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'],
                   'y': elec_base,
@@ -58,43 +70,45 @@ def create_electricity_consumption_graph(city_name, elec_use):
     }
 
 
-def get_subset(year, lat, lon):
+def calculate_electricity_for_locations(lats, lons, electricity_bill_min, electricity_bill_max,
+                                        cooling_base=cooling_base_temperature):
     """
-    Function to get monthly average temperature with global coverage (0.25 x 0.25)
-    Source: ECMWF ERA5 dataset
-    Input: get_subset(year,lat,lon)
-
-    :param year:
-    :param lat:
-    :param lon:
-    :return:
+    Vectorized version of `calculate_electricity`, for any number of locations (e.g., a whole customer list)
+
+    :param lats: array-like of latitudes
+    :param lons: array-like of longitudes
+    :param electricity_bill_min: float or array-like, one per location
+    :param electricity_bill_max: float or array-like, one per location
+    :param cooling_base: float or array-like, base temperature in C for cooling degree-days
+    :return: a pair of array (location, month): base line electricity, and electricity spent on cooling
     """
+    _, monthly_cdd = get_degree_day_engine(year).get_monthly_degree_days(lats, lons, cooling_base=cooling_base)
+    return calculate_electricity(monthly_cdd, electricity_bill_min, electricity_bill_max)
 
-    # Get daily average temperature
-    t2 = xr.open_dataset('data/T2_monthly_mean_2017.nc')
-    average_temp = t2.sel(lat=lat, lon=lon % 360, method='nearest')
-    average_temp = average_temp.assign_coords(
-        time=(pd.to_datetime(np.array(average_temp.time).astype(int).astype(str))))
-
-    return None, None, average_temp.var167
 
-
-def calculate_electricity(average_temp, electricity_bill_min, electricity_bill_max):
+def calculate_electricity(monthly_cdd, electricity_bill_min, electricity_bill_max):
     """
-    Given the daily average temperature data, minimum and maximum an user pay for her power bill, we can work out
+    Given the monthly cooling degree-days, minimum and maximum an user pay for her power bill, we can work out
     the baseline, and also the amount she is paying for cooling
 
-    :param average_temp:
-    :param electricity_bill_min:
-    :param electricity_bill_max:
+    :param monthly_cdd: array (month,) or (location, month) of cooling degree-days
+    :param electricity_bill_min: float or array-like, one per location
+    :param electricity_bill_max: float or array-like, one per location
     :return: a pair of array: base line electricity that user pays, and electricity user pays for cooling.
         They are grouped at the monthly level
     """
-    average_temp = average_temp - 273.15
-    cooling_degree_day = average_temp.where(average_temp > 18, 18) - 18
-    monthly_cdd = cooling_degree_day
-
-    elec_base = electricity_bill_min * np.ones(12)
-    elec_hvac = np.array(monthly_cdd * (electricity_bill_max - electricity_bill_min) / max(monthly_cdd))
+    monthly_cdd = np.asarray(monthly_cdd, dtype=np.float64)
+    electricity_bill_min = np.asarray(electricity_bill_min, dtype=np.float64)
+    electricity_bill_max = np.asarray(electricity_bill_max, dtype=np.float64)
+    if monthly_cdd.ndim > 1:
+        electricity_bill_min = electricity_bill_min.reshape(-1, 1)
+        electricity_bill_max = electricity_bill_max.reshape(-1, 1)
+
+    # places that never need cooling have no cooling bill
+    max_cdd = monthly_cdd.max(axis=-1, keepdims=True)
+    max_cdd = np.where(max_cdd > 0, max_cdd, 1)
+
+    elec_base = electricity_bill_min * np.ones(monthly_cdd.shape)
+    elec_hvac = monthly_cdd * (electricity_bill_max - electricity_bill_min) / max_cdd
 
     return elec_base, elec_hvac
@@ -0,0 +1,48 @@
+"""
+Gunicorn configuration, e.g., `gunicorn app:server -c gunicorn.conf.py`
+"""
+import os
+
+bind = os.getenv('GUNICORN_BIND', ':%s' % os.getenv('PORT', '8000'))
+
+""" Threaded workers: a worker serves many slow, I/O bound requests at once (see `async_io.py`) """
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.getenv('GUNICORN_WORKERS', '1'))
+threads = int(os.getenv('GUNICORN_THREADS', '32'))
+
+""" Load the application, and warm it up, in the master process so workers share its read-only data """
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+""" Restart workers when the code changes, for development: reloaded workers lose the warmed up state of the master, so
+it's ignored when the app is preloaded """
+reload = not preload_app and os.getenv('GUNICORN_RELOAD', 'false').lower() == 'true'
+
+""" Number of most populated cities whose chat replies are computed during the warm-up """
+chat_cache_warm_cities = int(os.getenv('CHAT_CACHE_WARM_CITIES', '200'))
+
+""" Number of most populated cities whose dashboard figures are computed during the warm-up """
+figure_cache_warm_cities = int(os.getenv('FIGURE_CACHE_WARM_CITIES', '100'))
+
+
+def when_ready(server):
+    if preload_app:
+        _warm_up(server.log)
+
+
+def post_worker_init(worker):
+    # no-op for preloaded workers, which were forked from a warmed up master
+    _warm_up(worker.log)
+
+
+def _warm_up(log):
+    from warmup import is_ready, warm_up
+
+    if not is_ready():
+        warm_up(chat_city_count=chat_cache_warm_cities, figure_city_count=figure_cache_warm_cities)
+        log.info('Warm-up finished in process %d', os.getpid())
+
+
+def child_exit(server, worker):
+    from api.core.metrics import mark_process_dead
+
+    mark_process_dead(worker.pid)
@@ -3,23 +3,38 @@ This module acts as a `service` that analyses requests from chat bot and have th
 appropriate response.
 """
 import os
-import time
 
-import plotly.graph_objs as go
-import plotly.io as pio
-from flask import json, url_for
+from flask import g, json, url_for
 
+from api.core.metrics import DEGRADED_ANSWERS, INTENT_LATENCY, STAGE_CITY_LOOKUP, time_stage
+from chart_renderer import ChartRenderer
 from climate_data import get_climate, chat_about_city, fetch_city_by_name
+from deadline import Deadline, DeadlineExceeded
 from graph import create_electricity_consumption_graph
 
+""" Number of seconds an intent has to be answered in, DialogFlow cancels webhooks after 5 seconds """
+intent_deadline = float(os.getenv('INTENT_DEADLINE_SECONDS', '4.5'))
 
-def handle_intent_request(request):
+""" Maximum number of seconds a webhook waits for a chart to be rendered, before answering without it """
+chart_render_timeout = float(os.getenv('CHART_RENDER_TIMEOUT', '3'))
+
+""" Response header of the answers that fell back to a degraded one, with the reason, e.g., `deadline` """
+DEGRADED_HEADER = 'X-Answer-Degraded'
+
+chart_renderer = ChartRenderer(static_folder='assets')
+
+
+def handle_intent_request(request, deadline=None):
     """
     Generic service method to handle all intent queries (HTTP POST requests) from DialogFlow
 
     :param request:
+    :param deadline: Deadline: time budget of the request, defaults to `INTENT_DEADLINE_SECONDS` from now
     :return: json
     """
+    if deadline is None:
+        deadline = Deadline(intent_deadline)
+
     query_result = request.json["queryResult"]
     if 'intent' not in query_result:
         return __no_answer_response(request)
@@ -27,47 +42,99 @@ def handle_intent_request(request):
     identified_intent = query_result['intent']['displayName']
 
     if 'Bill inquiry - address' == identified_intent:
-        return handle_address_inquiry(request)
+        with INTENT_LATENCY.labels(identified_intent).time():
+            return handle_address_inquiry(request, deadline)
     elif 'Bill inquiry - address - bill' == identified_intent:
-        return handle_address_billing_inquiry(request)
+        with INTENT_LATENCY.labels(identified_intent).time():
+            return handle_address_billing_inquiry(request, deadline)
     elif 'Bill inquiry - address - bill - more' == identified_intent:
-        return handle_address_billing_more_inquiry(request)
+        with INTENT_LATENCY.labels(identified_intent).time():
+            return handle_address_billing_more_inquiry(request)
     elif 'Product inquiry' == identified_intent:
-        return handle_product_inquiry(request)
+        with INTENT_LATENCY.labels(identified_intent).time():
+            return handle_product_inquiry(request)
     return __no_answer_response(request)
 
 
-def handle_address_inquiry(request):
+def handle_intent_failure(request):
+    """
+    This returns the best answer we can give when handling an intent failed, rather than leaving the user without one.
+
+    :param request:
+    :return: json
+    """
+    try:
+        intent_name = request.json['queryResult']['intent']['displayName']
+    except (KeyError, TypeError):
+        intent_name = 'unknown'
+    __mark_degraded(intent_name, 'error')
+
+    try:
+        return __no_answer_response(request)
+    except (KeyError, TypeError):
+        return __construct_rich_text_response(["Sorry, I didn't quite get that. Could you say it again?"])
+
+
+def get_degraded_reason():
+    """
+    :return: str: why the answer of the current request was degraded, e.g., `deadline`, None if it was not
+    """
+    return g.get('answer_degraded')
+
+
+def __mark_degraded(intent_name, reason):
+    """ Degraded answers are still answered with status 200: they are told apart by a header and a metric """
+    g.answer_degraded = reason
+    DEGRADED_ANSWERS.labels(intent_name, reason).inc()
+
+
+def handle_address_inquiry(request, deadline=None):
     """
     This focuses on handling inquiries when we only have address information.
     It returns something informational about the city where user stays
 
     :param request:
+    :param deadline: Deadline: if it runs out, the answer skips the information about the city
     :return: json
     """
+    if deadline is None:
+        deadline = Deadline(intent_deadline)
+
     parameters = request.json["queryResult"]['parameters']
     if 'geo-city' not in parameters:
         return __no_answer_response(request)
 
     city = parameters['geo-city']
 
-    (climate, city) = get_climate(city)
-    chat_response_dict = chat_about_city(climate=climate, city=city, temp_unit='F')
-    desc_on_city = chat_response_dict['general']
+    try:
+        desc_on_city = deadline.run(__describe_city, city)
+    except DeadlineExceeded:
+        desc_on_city = 'Ah %s!' % city
+        __mark_degraded('Bill inquiry - address', 'deadline')
     next_question = 'Can you tell me roughly the minimum amount you paid for your electricity? e.g., \"$160\"'
     text_array = [desc_on_city, next_question]
 
     return __construct_rich_text_response(text_array)
 
 
-def handle_address_billing_inquiry(request):
+def __describe_city(city):
+    (climate, city) = get_climate(city)
+    chat_response_dict = chat_about_city(climate=climate, city=city, temp_unit='F')
+    return chat_response_dict['general']
+
+
+def handle_address_billing_inquiry(request, deadline=None):
     """
     This focuses on handling inquiries when address information and user billing info
     are available, it returns usage analysis of the user in the past month.
 
     :param request:
+    :param deadline: Deadline: if it runs out, the answer comes without the consumption chart
     :return: json
     """
+    if deadline is None:
+        deadline = Deadline(intent_deadline)
+
     context_array = request.json["queryResult"]['outputContexts']
     parameters = dict()
     for context in context_array:
@@ -77,23 +144,28 @@ def handle_address_billing_inquiry(request):
             parameters['bill-low'] = context_parameters['bill-low'][0]
             parameters['city'] = context_parameters['geo-city']
 
-    city_name = parameters['city']
-    lat, lon, city_name = fetch_city_by_name(city_name)
-
-    figure_dict = create_electricity_consumption_graph(city_name, [parameters['bill-low'], parameters['bill-high']])
-    figure = go.Figure(figure_dict)
+    with time_stage(STAGE_CITY_LOOKUP):
+        lat, lon, city_name = fetch_city_by_name(parameters['city'])
+    if lat is None:
+        # the chart would be drawn for the edge of the grid, rather than for the city
+        __mark_degraded('Bill inquiry - address - bill', 'unknown_city')
+        return __construct_rich_text_response(["Sorry, I don't know %s yet. Could you tell me the closest large city?"
+                                               % parameters['city']])
 
-    if not os.path.exists('assets'):
-        os.mkdir('assets')
-    current_time = int(time.time())
-    file_name = '%s-%s.png' % (city_name, current_time)
-    pio.write_image(figure, 'assets/%s' % file_name)
-
-    image_uri = url_for('static', filename=file_name, _external=True)
+    try:
+        figure_dict = deadline.run(create_electricity_consumption_graph, city_name,
+                                   [parameters['bill-low'], parameters['bill-high']])
+        file_name = chart_renderer.render(figure_dict, timeout=min(chart_render_timeout, deadline.remaining()))
+    except DeadlineExceeded:
+        file_name = None
+    if file_name is None:
+        __mark_degraded('Bill inquiry - address - bill', 'no_chart')
 
     source = __detect_source(request)
     response = __create_empty_rich_response()
-    __add_image_to_response(response, image_uri, source)
+    if file_name is not None:
+        image_uri = url_for('static', filename=file_name, _external=True)
+        __add_image_to_response(response, image_uri, source)
     __add_text_to_response(response, "Got it! This is what we know about your consumption!", source)
     __add_text_to_response(response,
                            "Based on our analysis of weather data and your property data, your bill is still looking ok! The amount you are paying is still reasonable in comparison to others living at similar sized houses.",
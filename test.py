@@ -2,16 +2,17 @@
 A command prompt CLI to help ingest new data
 """
 import argparse
+import logging
 import os
 
-import boto3
-import botocore
-from boto3.s3.transfer import TransferConfig
-
+from api.core.logging_config import configure_logging
+from api.core.storage import get_s3_client
 from api.core.weather_file import WeatherFile
 from api.core.weather_parameter import WeatherParameter
 from api.ingest.preprocessor import Preprocessor
 
+logger = logging.getLogger(__name__)
+
 
 def _copy_file_from_s3(s3_client, year, month):
     parameters = WeatherParameter.get_all_parameters()
@@ -24,10 +25,10 @@ def _copy_file_from_s3(s3_client, year, month):
         weather_file_full_path = "%s/%s" % (year, weather_file_path)
         destination_file = destination_folder + weather_file_path
         if os.path.exists(destination_file):
-            print("File already exists: %s" % destination_file)
+            logger.info("File already exists: %s", destination_file)
             continue
 
-        print('Downloading %s to %s' % (weather_file_full_path, destination_file))
+        logger.info('Downloading %s to %s', weather_file_full_path, destination_file)
         _download_file(s3_client, weather_file_full_path, destination_file)
 
 
@@ -45,28 +46,26 @@ def _remove_files(year, month):
         weather_file_path = weather_file.get_original_file_name(year, month, parameter)
 
         destination_file = destination_folder + weather_file_path
-        print('removing files: ' + destination_file)
+        logger.info('removing files: %s', destination_file)
 
 
 def main_procedure(min_month, max_month, year):
     bucket = 'ec2-us-east-1-oikolab'
-    TransferConfig(max_concurrency=5)
-    client = boto3.client('s3', aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-                          aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-                          config=botocore.client.Config(signature_version=botocore.UNSIGNED))
+    client = get_s3_client()
 
     for current_month in range(min_month, max_month + 1):
         _copy_file_from_s3(client, year, current_month)
 
         preprocessor = Preprocessor('/nvm/')
         for month in range(min_month, max_month + current_month):
-            print('processing for %s/%s' % (year, month))
+            logger.info('processing for %s/%s', year, month)
             preprocessor.process(year=year, month=current_month)
 
         _remove_files(year, current_month)
 
 
 if __name__ == '__main__':
+    configure_logging()
     parser = argparse.ArgumentParser(description='Pre-process files for year-month combination')
     parser.add_argument('year', type=int, help='an integer representing the year, e.g., 2017')
     parser.add_argument('min_month', type=int,
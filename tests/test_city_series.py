@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import xarray as xr
+
+from api.core.storage import LocalStorage, MemoryStorage
+from api.ingest.city_series import append_to_series
+
+
+class _CountingStorage(MemoryStorage):
+    """ Counts the objects read """
+
+    def __init__(self):
+        super().__init__()
+        self.reads = 0
+
+    def read(self, path):
+        self.reads = self.reads + 1
+        return super().read(path)
+
+
+def _create_month(year, month):
+    first = np.datetime64('%d-%02d' % (year, month), 'M')
+    times = np.arange(first, first + np.timedelta64(1, 'M'), dtype='datetime64[h]').astype('datetime64[ns]')
+    temperatures = 280.0 + 10.0 * np.sin(np.arange(len(times)) / 24.0)
+    return xr.Dataset({'t2m': (('time',), temperatures)}, coords={'time': times})
+
+
+class CitySeriesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix='city-series-test-')
+        self.storage = LocalStorage()
+        self.path = os.path.join(self.folder, 'series', 'HKG', 'hong_kong.nc')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def _read(self):
+        with xr.open_dataset(self.storage.get_local_path(self.path)) as series:
+            return series.load()
+
+    def test_create_and_append(self):
+        january = _create_month(2017, 1)
+        february = _create_month(2017, 2)
+
+        self.assertTrue(append_to_series(self.storage, self.path, january))
+        self.assertTrue(append_to_series(self.storage, self.path, february))
+
+        series = self._read()
+        expected = xr.concat([january, february], dim='time')
+        np.testing.assert_array_equal(series['time'].values, expected['time'].values)
+        np.testing.assert_allclose(series['t2m'].values, expected['t2m'].values, atol=0.005)
+
+    def test_append_month_again(self):
+        january = _create_month(2017, 1)
+        append_to_series(self.storage, self.path, january)
+
+        self.assertFalse(append_to_series(self.storage, self.path, january))
+        self.assertEqual(self._read().sizes['time'], january.sizes['time'])
+
+    def test_append_out_of_order(self):
+        append_to_series(self.storage, self.path, _create_month(2017, 2))
+
+        with self.assertRaises(Exception):
+            append_to_series(self.storage, self.path, _create_month(2017, 1))
+
+    def test_missing_values(self):
+        january = _create_month(2017, 1)
+        february = _create_month(2017, 2)
+        february['t2m'][:5] = np.nan
+        append_to_series(self.storage, self.path, january)
+        append_to_series(self.storage, self.path, february)
+
+        values = self._read()['t2m'].values
+        self.assertEqual(int(np.isnan(values).sum()), 5)
+        self.assertTrue(np.isnan(values[january.sizes['time']:][:5]).all())
+
+    def test_memory_storage(self):
+        storage = MemoryStorage()
+        append_to_series(storage, 'HKG/hong_kong.nc', _create_month(2017, 1))
+        append_to_series(storage, 'HKG/hong_kong.nc', _create_month(2017, 2))
+
+        local_path = storage.get_local_path('HKG/hong_kong.nc')
+        try:
+            with xr.open_dataset(local_path) as series:
+                self.assertEqual(series.sizes['time'], (31 + 28) * 24)
+        finally:
+            storage.release_local_path(local_path)
+
+    def test_series_read_once(self):
+        storage = _CountingStorage()
+        append_to_series(storage, 'HKG/hong_kong.nc', _create_month(2017, 1))
+
+        append_to_series(storage, 'HKG/hong_kong.nc', _create_month(2017, 2))
+        self.assertEqual(storage.reads, 1)
+        append_to_series(storage, 'HKG/hong_kong.nc', _create_month(2017, 2))
+        self.assertEqual(storage.reads, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
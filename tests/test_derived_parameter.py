@@ -0,0 +1,73 @@
+import unittest
+
+import numpy as np
+import xarray as xr
+
+from api.core.derived_parameter import DerivedParameter
+
+
+class DerivedParameterTest(unittest.TestCase):
+
+    def test_relative_humidity(self):
+        humidity = DerivedParameter.compute('2m_relative_humidity', {
+            '2m_temperature': np.array([293.15, 293.15, 253.15, 293.15]),
+            '2m_dewpoint_temperature': np.array([293.15, 283.15, 253.15, 294.15])})
+
+        # saturated when the dewpoint is the temperature, and never above
+        np.testing.assert_allclose(humidity, [100.0, 52.54, 100.0, 100.0], atol=0.01)
+
+    def test_wind_speed(self):
+        speed = DerivedParameter.compute('10m_wind_speed', {'10m_u_component_of_wind': np.array([3.0, 0.0]),
+                                                            '10m_v_component_of_wind': np.array([-4.0, 0.0])})
+
+        np.testing.assert_allclose(speed, [5.0, 0.0])
+
+    def test_wind_direction(self):
+        # where the wind blows from: southward from the north, westward from the east, and so on
+        direction = DerivedParameter.compute('10m_wind_direction', {
+            '10m_u_component_of_wind': np.array([0.0, -5.0, 0.0, 5.0, 1.0]),
+            '10m_v_component_of_wind': np.array([-5.0, 0.0, 5.0, 0.0, 1.0])})
+
+        np.testing.assert_allclose(direction, [0.0, 90.0, 180.0, 270.0, 225.0])
+
+    def test_accumulation_rates(self):
+        precipitation = DerivedParameter.compute('total_precipitation_rate',
+                                                 {'total_precipitation': np.array([0.002, -1e-7])})
+        radiation = DerivedParameter.compute('surface_solar_radiation_downwards_flux',
+                                             {'surface_solar_radiation_downwards': np.array([3600000.0, -10.0])})
+
+        # m over an hour in mm per hour, J m**-2 over an hour in W m**-2, without negative amounts
+        np.testing.assert_allclose(precipitation, [2.0, 0.0])
+        np.testing.assert_allclose(radiation, [1000.0, 0.0])
+
+    def test_names(self):
+        self.assertEqual(DerivedParameter.get_short_name('10m_wind_speed'), 'ws10')
+        self.assertEqual(DerivedParameter.get_variable_name('2m_temperature'), 't2m')
+        self.assertEqual(DerivedParameter.get_variable_name('2m_relative_humidity'), 'rh2m')
+        self.assertEqual(DerivedParameter.get_inputs('10m_wind_speed'),
+                         ['10m_u_component_of_wind', '10m_v_component_of_wind'])
+        with self.assertRaises(Exception):
+            DerivedParameter.get_metadata('2m_temperature')
+
+    def test_add_to(self):
+        data_set = xr.Dataset({'u10': (('time',), [3.0]), 'v10': (('time',), [-4.0])})
+        data_set = DerivedParameter.add_to(data_set, ['10m_wind_speed'])
+
+        self.assertEqual(float(data_set['ws10'][0]), 5.0)
+        self.assertEqual(data_set['ws10'].attrs['units'], 'm s**-1')
+        self.assertEqual(data_set['ws10'].attrs['derived_from'], '10m_u_component_of_wind 10m_v_component_of_wind')
+
+    def test_select(self):
+        # a file processed before wind speed was derived
+        data_set = xr.Dataset({'t2m': (('time',), [280.0]), 'u10': (('time',), [3.0]), 'v10': (('time',), [-4.0]),
+                               'wd10': (('time',), [10.0])})
+        selected = DerivedParameter.select(data_set, ['2m_temperature', '10m_wind_speed', '10m_wind_direction'])
+
+        self.assertEqual(list(selected.data_vars), ['t2m', 'ws10', 'wd10'])
+        self.assertEqual(float(selected['ws10'][0]), 5.0)
+        # derived parameters in the file are not computed again
+        self.assertEqual(float(selected['wd10'][0]), 10.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
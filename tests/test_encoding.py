@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import xarray as xr
+
+from api.ingest.encoding import CHUNK_HOURS, FILL_VALUE, PROCESSED_FORMAT, encode, get_metadata_by_variable, \
+    get_packed_encoding, to_masked_array
+
+
+def _create_data_set(values):
+    times = np.arange(np.datetime64('2017-01-01T00'), np.datetime64('2017-01-01T00') + len(values),
+                      dtype='datetime64[h]').astype('datetime64[ns]')
+    return xr.Dataset({'t2m': (('time',), np.asarray(values, dtype=np.float64)),
+                       'tp': (('time',), np.zeros(len(values)))}, coords={'time': times})
+
+
+class EncodingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix='encoding-test-')
+        self.path = os.path.join(self.folder, 'month.nc')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def _round_trip(self, data_set, unlimited_time=False):
+        data_set, encoding = encode(data_set, unlimited_time=unlimited_time)
+        data_set.to_netcdf(self.path, format=PROCESSED_FORMAT, encoding=encoding,
+                           unlimited_dims=['time'] if unlimited_time else None)
+        with xr.open_dataset(self.path) as written:
+            return written.load()
+
+    def test_packed_encoding(self):
+        metadata = get_metadata_by_variable()['t2m']
+        encoding = get_packed_encoding(metadata)
+
+        self.assertEqual(encoding['dtype'], 'int16')
+        self.assertEqual(encoding['scale_factor'], metadata.precision)
+        self.assertEqual(encoding['add_offset'], (metadata.minimum + metadata.maximum) / 2)
+        self.assertEqual(encoding['_FillValue'], FILL_VALUE)
+
+    def test_range_too_wide(self):
+        metadata = get_metadata_by_variable()['t2m']._replace(precision=0.0001)
+        with self.assertRaises(Exception):
+            get_packed_encoding(metadata)
+
+    def test_round_trip(self):
+        values = 180.0 + 160.0 * np.random.RandomState(0).random_sample(48)
+        written = self._round_trip(_create_data_set(values))
+
+        precision = get_metadata_by_variable()['t2m'].precision
+        np.testing.assert_allclose(written['t2m'].values, values, atol=precision / 2 + 1e-9)
+        np.testing.assert_array_equal(written['time'].values, _create_data_set(values)['time'].values)
+
+    def test_missing_values(self):
+        values = [280.0, np.nan, 290.0]
+        written = self._round_trip(_create_data_set(values), unlimited_time=True)
+
+        self.assertTrue(np.isnan(written['t2m'].values[1]))
+        np.testing.assert_allclose(written['t2m'].values[[0, 2]], [280.0, 290.0], atol=0.005)
+
+    def test_clipping(self):
+        metadata = get_metadata_by_variable()['t2m']
+        data_set, _ = encode(_create_data_set([metadata.minimum - 10, 280.0, metadata.maximum + 10]))
+
+        np.testing.assert_array_equal(data_set['t2m'].values, [metadata.minimum, 280.0, metadata.maximum])
+
+    def test_chunks(self):
+        _, encoding = encode(_create_data_set(np.full(48, 280.0)))
+        self.assertEqual(encoding['t2m']['chunksizes'], (48,))
+
+        _, encoding = encode(_create_data_set(np.full(48, 280.0)), unlimited_time=True)
+        self.assertEqual(encoding['t2m']['chunksizes'], (CHUNK_HOURS,))
+
+    def test_to_masked_array(self):
+        values = to_masked_array([1.0, np.nan])
+
+        self.assertEqual(list(values.mask), [False, True])
+        self.assertEqual(values[0], 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
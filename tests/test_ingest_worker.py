@@ -0,0 +1,59 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from api.ingest.ingest_worker import IngestWorker, enqueue_months
+from api.ingest.work_queue import WorkQueue
+
+
+class _Preprocessor:
+    """ Records the tasks run, in order """
+
+    def __init__(self):
+        self.runs = []
+
+    def process(self, year, month, shard_index, shard_count):
+        self.runs.append((year, [month], shard_index))
+        return ['%d-%02d/%d' % (year, month, shard_index)]
+
+    def append(self, year, months, shard_index, shard_count):
+        self.runs.append((year, months, shard_index))
+        return ['%d/%d' % (year, shard_index)]
+
+
+class IngestWorkerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix='ingest-worker-test-')
+        self.queue = WorkQueue(os.path.join(self.folder, 'queue.sqlite'))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_enqueue_months(self):
+        self.assertEqual(enqueue_months(self.queue, 2017, [2, 1], 3), 6)
+        self.assertEqual(enqueue_months(self.queue, 2017, [1], 3), 0)
+
+        preprocessor = _Preprocessor()
+        self.assertEqual(IngestWorker(self.queue, preprocessor, 'worker-1').run(), 6)
+        self.assertEqual(preprocessor.runs[:2], [(2017, [1], 0), (2017, [1], 1)])
+        self.assertTrue(self.queue.is_finished())
+
+    def test_append_in_order(self):
+        enqueue_months(self.queue, 2018, [3], 2, append=True)
+        enqueue_months(self.queue, 2018, [4], 2, append=True)
+
+        # march of both shards can run at once, april waits for march of its shard
+        march = [self.queue.claim('worker-1'), self.queue.claim('worker-2')]
+        self.assertEqual([task.payload['months'] for task in march], [[3], [3]])
+        self.assertIsNone(self.queue.claim('worker-3'))
+
+        self.queue.complete(march[1], [], 1.0)
+        april = self.queue.claim('worker-3')
+        self.assertEqual((april.payload['months'], april.payload['shard_index']), ([4], 1))
+        self.assertIsNone(self.queue.claim('worker-4'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from api.core.inventory import IndexedStorage, Inventory
+from api.core.storage import LocalStorage, MemoryStorage
+from api.core.weather_file import WeatherFile
+
+
+class InventoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix='inventory-test-')
+        self.inventory = Inventory(os.path.join(self.folder, 'inventory.sqlite'))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_build(self):
+        storage = MemoryStorage()
+        storage.write('2017/a.grb', b'a')
+        storage.write('2017/b/c.nc', b'bc')
+        storage.write('2018/d.grb', b'd')
+
+        self.assertEqual(self.inventory.build(storage, '2017/'), 2)
+
+        self.assertTrue(self.inventory.is_built('2017/a.grb'))
+        self.assertFalse(self.inventory.is_built('2018/d.grb'))
+        self.assertTrue(self.inventory.exists('2017/b/c.nc'))
+        self.assertFalse(self.inventory.exists('2018/d.grb'))
+        self.assertTrue(self.inventory.is_folder('2017/b/'))
+        self.assertEqual(self.inventory.list('2017/'), ['a.grb', 'b'])
+        self.assertEqual(self.inventory.get('2017/b/c.nc').checksum, hashlib.md5(b'bc').hexdigest())
+
+    def test_build_again(self):
+        storage = MemoryStorage()
+        storage.write('2017/a.grb', b'a')
+        self.inventory.build(storage, '2017/')
+        del storage.objects['2017/a.grb']
+        storage.write('2017/b.grb', b'b')
+
+        self.assertEqual(self.inventory.build(storage, '2017/'), 1)
+        self.assertEqual(self.inventory.list('2017/'), ['b.grb'])
+
+    def test_build_skips_lock_files(self):
+        storage = LocalStorage()
+        path = os.path.join(self.folder, 'data', '2017', 'a.grb')
+        storage.write(path, b'a')
+        with storage.lock(path):
+            self.inventory.build(storage, os.path.join(self.folder, 'data') + '/')
+
+        self.assertEqual(self.inventory.list(os.path.join(self.folder, 'data', '2017') + '/'), ['a.grb'])
+
+    def test_record_and_remove(self):
+        self.inventory.record('2017/a.grb', 10, modified=1.0)
+        self.assertEqual(tuple(self.inventory.get('2017/a.grb')), ('2017/a.grb', 10, None, 1.0))
+
+        self.inventory.remove('2017/a.grb')
+        self.assertIsNone(self.inventory.get('2017/a.grb'))
+
+
+class IndexedStorageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix='inventory-test-')
+        self.inventory = Inventory(os.path.join(self.folder, 'inventory.sqlite'))
+        self.memory_storage = MemoryStorage()
+        self.storage = IndexedStorage(self.memory_storage, self.inventory)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_not_built(self):
+        self.memory_storage.write('2017/a.grb', b'a')
+
+        self.assertTrue(self.storage.exists('2017/a.grb'))
+        self.assertEqual(self.storage.list('2017/'), ['a.grb'])
+        self.assertEqual(self.storage.size('2017/a.grb'), 1)
+
+    def test_built(self):
+        self.inventory.build(self.memory_storage, '2017/')
+        # written by other means, not seen until refreshed
+        self.memory_storage.write('2017/a.grb', b'a')
+
+        self.assertFalse(self.storage.exists('2017/a.grb'))
+        self.assertFalse(self.storage.is_folder('2017/'))
+        with self.assertRaises(Exception):
+            self.storage.size('2017/a.grb')
+
+        self.assertTrue(self.storage.refresh('2017/a.grb'))
+        self.assertTrue(self.storage.exists('2017/a.grb'))
+        self.assertEqual(self.storage.size('2017/a.grb'), 1)
+
+        del self.memory_storage.objects['2017/a.grb']
+        self.assertFalse(self.storage.refresh('2017/a.grb'))
+        self.assertFalse(self.storage.exists('2017/a.grb'))
+
+    def test_writes_are_recorded(self):
+        self.inventory.build(self.memory_storage, '2017/')
+        self.storage.write('2017/a.grb', b'a')
+        with self.storage.open_local_path('2017/b.nc') as local_path:
+            with open(local_path, 'wb') as local_file:
+                local_file.write(b'bc')
+
+        self.assertEqual(self.storage.list('2017/'), ['a.grb', 'b.nc'])
+        self.assertEqual(self.inventory.get('2017/b.nc').size, 2)
+        self.assertEqual(self.inventory.get('2017/b.nc').checksum, hashlib.md5(b'bc').hexdigest())
+        self.assertEqual(self.storage.read('2017/b.nc'), b'bc')
+
+    def test_failed_write_is_not_recorded(self):
+        self.inventory.build(self.memory_storage, '2017/')
+        with self.assertRaises(ValueError):
+            with self.storage.open_local_path('2017/b.nc'):
+                raise ValueError()
+
+        self.assertFalse(self.storage.exists('2017/b.nc'))
+
+    def test_weather_file(self):
+        self.memory_storage.write('2017/2m_temperature_2017_01_era5.grb', b'a')
+        weather_file = WeatherFile('/', storage=self.memory_storage, inventory=self.inventory)
+
+        self.assertEqual(weather_file.build_inventory(weather_file.get_original_folder(2017)), 1)
+        self.assertEqual(weather_file.get_original_data_set_path(2017, 1, '2m_temperature'),
+                         '2017/2m_temperature_2017_01_era5.grb')
+        with self.assertRaises(Exception):
+            weather_file.get_original_data_set_path(2017, 2, '2m_temperature')
+
+
+if __name__ == '__main__':
+    unittest.main()
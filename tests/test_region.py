@@ -0,0 +1,116 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import xarray as xr
+
+from api.core.storage import MemoryStorage
+from api.core.weather_file import WeatherFile
+from api.outgest.region import BoundingBox, RegionError, RegionExtractor, _get_months, _Grid, check_request
+
+
+def _create_data_set(hours=48):
+    """ A grid of 10 degrees, from 20N to 20S and from 0 to 350 east, with the longitude as values """
+    latitudes = np.arange(20.0, -30.0, -10.0)
+    longitudes = np.arange(0.0, 360.0, 10.0)
+    times = np.arange(np.datetime64('2017-01-01T00'), np.datetime64('2017-01-01T00') + hours,
+                      dtype='datetime64[h]').astype('datetime64[ns]')
+    values = np.broadcast_to(200.0 + longitudes / 10.0, (hours, len(latitudes), len(longitudes)))
+    values = values + np.arange(hours).reshape(-1, 1, 1)
+    return xr.Dataset({'t2m': (('time', 'latitude', 'longitude'), values)},
+                      coords={'time': times, 'latitude': latitudes, 'longitude': longitudes})
+
+
+class GridTest(unittest.TestCase):
+
+    def test_box(self):
+        grid = _Grid(_create_data_set(), BoundingBox(-5, 15, 15, 45))
+
+        np.testing.assert_array_equal(grid.latitudes, [10.0, 0.0])
+        np.testing.assert_array_equal(grid.longitudes, [20.0, 30.0, 40.0])
+        self.assertEqual(grid.column_runs, [slice(2, 5)])
+
+    def test_across_grid_edge(self):
+        data_set = _create_data_set()
+        grid = _Grid(data_set, BoundingBox(-20, 20, -20, 20))
+
+        np.testing.assert_array_equal(grid.longitudes, [-20.0, -10.0, 0.0, 10.0, 20.0])
+        self.assertEqual(grid.column_runs, [slice(34, 36), slice(0, 3)])
+        values = grid.read(data_set, 't2m', slice(0, 2), slice(1, 3))
+        self.assertEqual(values.shape, (2, 2, 5))
+        np.testing.assert_array_equal(values[0, 0], [234.0, 235.0, 200.0, 201.0, 202.0])
+        np.testing.assert_array_equal(values[1, 1], [235.0, 236.0, 201.0, 202.0, 203.0])
+
+    def test_across_antimeridian(self):
+        grid = _Grid(_create_data_set(), BoundingBox(0, 0, 170, -170))
+
+        np.testing.assert_array_equal(grid.longitudes, [170.0, 180.0, 190.0])
+        self.assertEqual(grid.column_runs, [slice(17, 20)])
+
+    def test_no_grid_point(self):
+        with self.assertRaises(RegionError):
+            _Grid(_create_data_set(), BoundingBox(1, 9, 0, 10))
+
+
+class CheckRequestTest(unittest.TestCase):
+
+    def test_valid(self):
+        start, end = check_request(BoundingBox(-10, 10, -10, 10), ['2m_temperature', '10m_wind_speed'], '2017-01-30',
+                                   '2017-02-01')
+
+        self.assertEqual(start, np.datetime64('2017-01-30T00'))
+        self.assertEqual(end, np.datetime64('2017-02-02T00'))
+        self.assertEqual(_get_months(start, end), [(2017, 1), (2017, 2)])
+
+    def test_invalid(self):
+        box = BoundingBox(-10, 10, -10, 10)
+        requests = [
+            (BoundingBox(10, -10, -10, 10), ['2m_temperature'], '2017-01-01', '2017-01-31'),
+            (BoundingBox(-10, 10, -190, 10), ['2m_temperature'], '2017-01-01', '2017-01-31'),
+            (box, [], '2017-01-01', '2017-01-31'),
+            (box, ['temperature'], '2017-01-01', '2017-01-31'),
+            (box, ['2m_temperature'], '2017-01', '2017-31-01'),
+            (box, ['2m_temperature'], '2017-01-31', '2017-01-01'),
+        ]
+        for request in requests:
+            with self.assertRaises(RegionError):
+                check_request(*request)
+
+
+class RegionExtractorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix='region-test-')
+        self.weather_file = WeatherFile('/', storage=MemoryStorage())
+        folder = self.weather_file.get_or_create_original_folder(2017)
+        path = folder + self.weather_file.get_original_file_name(2017, 1, '2m_temperature')
+        with self.weather_file.storage.open_local_path(path) as local_path:
+            _create_data_set().to_netcdf(local_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_write(self):
+        path = os.path.join(self.folder, 'region.nc')
+        # a few values at a time, so blocks split the rows and hours
+        extractor = RegionExtractor(self.weather_file, block_values=8)
+        extractor.write(path, BoundingBox(-20, 20, -20, 20), ['2m_temperature'], '2017-01-02', '2017-01-02')
+
+        with xr.open_dataset(path) as region:
+            self.assertEqual(region['t2m'].shape, (24, 5, 5))
+            np.testing.assert_array_equal(region['longitude'].values, [-20.0, -10.0, 0.0, 10.0, 20.0])
+            self.assertEqual(region['time'].values[0], np.datetime64('2017-01-02T00', 'ns'))
+            np.testing.assert_allclose(region['t2m'].values[0, 0], [258.0, 259.0, 224.0, 225.0, 226.0], atol=0.005)
+            np.testing.assert_allclose(region['t2m'].values[23, 4], [281.0, 282.0, 247.0, 248.0, 249.0], atol=0.005)
+
+    def test_too_large(self):
+        extractor = RegionExtractor(self.weather_file, max_values=100)
+        with self.assertRaises(RegionError):
+            extractor.write(os.path.join(self.folder, 'region.nc'), BoundingBox(-20, 20, -20, 20), ['2m_temperature'],
+                            '2017-01-01', '2017-01-02')
+
+
+if __name__ == '__main__':
+    unittest.main()
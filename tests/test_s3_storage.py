@@ -0,0 +1,114 @@
+import datetime
+import hashlib
+import io
+import os
+import unittest
+
+import boto3.session
+import botocore.exceptions
+from botocore.response import StreamingBody
+from botocore.stub import Stubber
+
+from api.core.storage import S3Storage
+
+BUCKET = 'weather'
+
+
+def _create_body(data):
+    return StreamingBody(io.BytesIO(data), len(data))
+
+
+def _create_item(key, data):
+    return {'Key': key, 'Size': len(data), 'ETag': '"%s"' % hashlib.md5(data).hexdigest(),
+            'LastModified': datetime.datetime(2018, 1, 1, tzinfo=datetime.timezone.utc)}
+
+
+class S3StorageTest(unittest.TestCase):
+
+    def setUp(self):
+        # a boto3 client, which has the managed transfers, e.g., upload_file
+        client = boto3.session.Session().client(
+            's3', region_name='us-east-1', aws_access_key_id='key', aws_secret_access_key='secret')
+        self.stubber = Stubber(client)
+        self.stubber.activate()
+        self.storage = S3Storage(BUCKET, client=client)
+
+    def tearDown(self):
+        self.stubber.deactivate()
+
+    def test_exists(self):
+        self.stubber.add_response('head_object', {'ContentLength': 1}, {'Bucket': BUCKET, 'Key': '2017/a.grb'})
+        self.stubber.add_client_error('head_object', '404', http_status_code=404,
+                                      expected_params={'Bucket': BUCKET, 'Key': '2017/b.grb'})
+        self.stubber.add_client_error('head_object', '403', http_status_code=403)
+
+        self.assertTrue(self.storage.exists('2017/a.grb'))
+        self.assertFalse(self.storage.exists('2017/b.grb'))
+        # other errors, e.g., a denied access, are not taken for a missing object
+        with self.assertRaises(botocore.exceptions.ClientError):
+            self.storage.exists('2017/c.grb')
+        self.stubber.assert_no_pending_responses()
+
+    def test_walk(self):
+        # one listing request per page, following the continuation token
+        self.stubber.add_response('list_objects_v2', {
+            'Contents': [_create_item('2017/a.grb', b'a'), _create_item('2017/b/c.nc', b'bc')],
+            'IsTruncated': True, 'NextContinuationToken': 'next'}, {'Bucket': BUCKET, 'Prefix': '2017/'})
+        self.stubber.add_response('list_objects_v2', {
+            'Contents': [_create_item('2017/d.grb', b'd')], 'IsTruncated': False},
+            {'Bucket': BUCKET, 'Prefix': '2017/', 'ContinuationToken': 'next'})
+
+        objects = list(self.storage.walk('2017/'))
+
+        modified = datetime.datetime(2018, 1, 1, tzinfo=datetime.timezone.utc).timestamp()
+        self.assertEqual(objects, [('2017/a.grb', 1, modified, hashlib.md5(b'a').hexdigest()),
+                                   ('2017/b/c.nc', 2, modified, hashlib.md5(b'bc').hexdigest()),
+                                   ('2017/d.grb', 1, modified, hashlib.md5(b'd').hexdigest())])
+        self.stubber.assert_no_pending_responses()
+
+    def test_list(self):
+        self.stubber.add_response('list_objects_v2', {'Contents': [_create_item('2017/a.grb', b'a')],
+                                                      'CommonPrefixes': [{'Prefix': '2017/b/'}], 'IsTruncated': False},
+                                  {'Bucket': BUCKET, 'Prefix': '2017/', 'Delimiter': '/'})
+
+        self.assertEqual(self.storage.list('2017/'), ['a.grb'])
+
+    def test_read_range(self):
+        # the end is exclusive, whereas the end of an HTTP range is inclusive
+        self.stubber.add_response('get_object', {'Body': _create_body(b'cde')},
+                                  {'Bucket': BUCKET, 'Key': '2017/a.grb', 'Range': 'bytes=2-4'})
+
+        self.assertEqual(self.storage.read_range('2017/a.grb', 2, 5), b'cde')
+        self.stubber.assert_no_pending_responses()
+
+    def test_open_local_path(self):
+        uploads = []
+
+        def record_upload(params, **kwargs):
+            uploads.append((params['Bucket'], params['Key'], params['Body'].read()))
+            params['Body'].seek(0)
+
+        # small files are uploaded in one request, whose parameters depend on the boto3 version
+        self.storage.client.meta.events.register('before-parameter-build.s3.PutObject', record_upload)
+        self.stubber.add_response('put_object', {})
+
+        with self.storage.open_local_path('2017/a.nc') as local_path:
+            with open(local_path, 'wb') as local_file:
+                local_file.write(b'abc')
+
+        self.stubber.assert_no_pending_responses()
+        self.assertEqual(uploads, [(BUCKET, '2017/a.nc', b'abc')])
+        self.assertFalse(os.path.exists(local_path))
+
+    def test_open_local_path_failed(self):
+        with self.assertRaises(ValueError):
+            with self.storage.open_local_path('2017/a.nc') as local_path:
+                raise ValueError()
+
+        # nothing is uploaded, as no response is expected
+        self.stubber.assert_no_pending_responses()
+        self.assertFalse(os.path.exists(local_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from api.core.storage import LOCK_SUFFIX, LocalStorage, MemoryStorage, get_memory_storage, get_storage
+
+
+class LocalStorageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix='storage-test-')
+        self.storage = LocalStorage()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_write_and_read(self):
+        path = os.path.join(self.folder, '2017', 'file.nc')
+        self.storage.write(path, b'0123456789')
+
+        self.assertTrue(self.storage.exists(path))
+        self.assertTrue(self.storage.is_folder(os.path.join(self.folder, '2017')))
+        self.assertEqual(self.storage.read(path), b'0123456789')
+        self.assertEqual(self.storage.read_range(path, 2, 5), b'234')
+        self.assertEqual(self.storage.read_ranges(path, [(0, 1), (8, 10)]), [b'0', b'89'])
+        self.assertEqual(self.storage.size(path), 10)
+        self.assertEqual(self.storage.list(os.path.join(self.folder, '2017')), ['file.nc'])
+
+    def test_list_missing_folder(self):
+        self.assertEqual(self.storage.list(os.path.join(self.folder, 'missing')), [])
+
+    def test_walk_skips_lock_and_temporary_files(self):
+        path = os.path.join(self.folder, 'file.nc')
+        self.storage.write(path, b'data')
+        with self.storage.lock(path):
+            with self.storage.open_local_path(os.path.join(self.folder, 'other.nc')) as local_path:
+                with open(local_path, 'wb') as local_file:
+                    local_file.write(b'partial')
+                paths = [walked_path for walked_path, _, _, _ in self.storage.walk(self.folder)]
+
+        self.assertEqual(paths, [path])
+        self.assertTrue(os.path.exists(path + LOCK_SUFFIX))
+
+    def test_open_local_path_removes_file_on_error(self):
+        path = os.path.join(self.folder, 'file.nc')
+        with self.assertRaises(ValueError):
+            with self.storage.open_local_path(path) as local_path:
+                with open(local_path, 'wb') as local_file:
+                    local_file.write(b'partial')
+                raise ValueError()
+
+        self.assertFalse(self.storage.exists(path))
+        self.assertEqual(os.listdir(self.folder), [])
+
+    def test_concurrent_writes(self):
+        path = os.path.join(self.folder, 'file.nc')
+        errors = []
+
+        def write(data):
+            try:
+                for _ in range(20):
+                    self.storage.write(path, data)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=write, args=(bytes([i]) * 1000,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        data = self.storage.read(path)
+        self.assertEqual(len(data), 1000)
+        self.assertEqual(len(set(data)), 1)
+        self.assertEqual(os.listdir(self.folder), ['file.nc'])
+
+
+class MemoryStorageTest(unittest.TestCase):
+
+    def test_write_and_read(self):
+        storage = MemoryStorage()
+        storage.write('2017/a.nc', b'0123')
+        storage.write('2017/b/c.nc', b'45')
+
+        self.assertTrue(storage.exists('2017/a.nc'))
+        self.assertFalse(storage.exists('2017/b.nc'))
+        self.assertTrue(storage.is_folder('2017/'))
+        self.assertEqual(storage.list('2017/'), ['a.nc'])
+        self.assertEqual(storage.read_range('2017/a.nc', 1, 3), b'12')
+        self.assertEqual(sorted(path for path, _, _, _ in storage.walk('2017/')), ['2017/a.nc', '2017/b/c.nc'])
+
+    def test_read_missing(self):
+        with self.assertRaises(Exception):
+            MemoryStorage().read('missing.nc')
+
+    def test_local_path(self):
+        storage = MemoryStorage()
+        with storage.open_local_path('a.nc') as local_path:
+            with open(local_path, 'wb') as local_file:
+                local_file.write(b'data')
+        self.assertEqual(storage.read('a.nc'), b'data')
+
+        local_path = storage.get_local_path('a.nc')
+        with open(local_path, 'rb') as local_file:
+            self.assertEqual(local_file.read(), b'data')
+        storage.release_local_path(local_path)
+        self.assertFalse(os.path.exists(local_path))
+
+    def test_shared_by_name(self):
+        storage, prefix = get_storage('memory://storage-test/data/')
+        self.assertEqual(prefix, 'storage-test/data/')
+        self.assertIs(storage, get_memory_storage('storage-test'))
+        self.assertIs(get_storage('memory://storage-test/other/')[0], storage)
+        self.assertIsNot(get_storage('memory://storage-test-2/')[0], storage)
+
+
+if __name__ == '__main__':
+    unittest.main()
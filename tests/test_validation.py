@@ -0,0 +1,105 @@
+import unittest
+
+import numpy as np
+import xarray as xr
+
+from api.ingest.validation import MonthValidator, ValidationError, check
+
+
+def _create_data_set(short_name='t2m', value=280.0, hours=31 * 24, latitudes=(1.0, 0.75, 0.5),
+                     longitudes=(0.0, 0.25)):
+    times = np.arange(np.datetime64('2017-01-01T00'), np.datetime64('2017-01-01T00') + hours,
+                      dtype='datetime64[h]').astype('datetime64[ns]')
+    values = np.full((hours, len(latitudes), len(longitudes)), value, dtype=np.float32)
+    return xr.Dataset({short_name: (('time', 'latitude', 'longitude'), values)},
+                      coords={'time': times, 'latitude': list(latitudes), 'longitude': list(longitudes)})
+
+
+class MonthValidatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.validator = MonthValidator(grid_shape=None, block_hours=100)
+
+    def _validate(self, data_sets):
+        return self.validator.validate(2017, 1, data_sets)
+
+    def test_valid(self):
+        report = self._validate({'2m_temperature': _create_data_set(),
+                                 '2m_dewpoint_temperature': _create_data_set('d2m', 270.0)})
+
+        self.assertTrue(report['valid'])
+        self.assertEqual(report['parameters']['2m_temperature']['time_steps'], 31 * 24)
+        self.assertEqual(report['parameters']['2m_temperature']['minimum'], 280.0)
+        check(report)
+
+    def test_missing_variable(self):
+        report = self._validate({'2m_temperature': _create_data_set('d2m')})
+
+        self.assertFalse(report['valid'])
+        self.assertEqual(report['parameters']['2m_temperature']['errors'], ['variable t2m is missing'])
+
+    def test_grid_shape(self):
+        validator = MonthValidator(grid_shape=(721, 1440))
+        report = validator.validate(2017, 1, {'2m_temperature': _create_data_set()})
+
+        self.assertEqual(report['parameters']['2m_temperature']['errors'],
+                         ['the grid is 3 x 2, rather than 721 x 1440'])
+
+    def test_ascending_latitudes(self):
+        report = self._validate({'2m_temperature': _create_data_set(latitudes=(0.5, 0.75, 1.0))})
+
+        self.assertEqual(report['parameters']['2m_temperature']['errors'], ['latitudes are not descending'])
+
+    def test_different_grids(self):
+        report = self._validate({'2m_temperature': _create_data_set(),
+                                 '2m_dewpoint_temperature': _create_data_set('d2m', longitudes=(0.0, 0.5))})
+
+        self.assertTrue(report['parameters']['2m_temperature']['valid'])
+        self.assertEqual(report['parameters']['2m_dewpoint_temperature']['errors'],
+                         ['the grid differs from the grid of 2m_temperature'])
+
+    def test_missing_hours(self):
+        report = self._validate({'2m_temperature': _create_data_set(hours=48)})
+        self.assertEqual(report['parameters']['2m_temperature']['errors'], ['there are 48 time steps, rather than 744'])
+
+        validator = MonthValidator(grid_shape=None, complete_month=False)
+        self.assertTrue(validator.validate(2017, 1, {'2m_temperature': _create_data_set(hours=48)})['valid'])
+
+    def test_gap(self):
+        data_set = _create_data_set()
+        data_set = data_set.isel(time=np.r_[0:10, 11:31 * 24])
+        report = self._validate({'2m_temperature': data_set})
+
+        self.assertFalse(report['valid'])
+        self.assertIn('time steps are not hourly from 2017-01-01T00', report['parameters']['2m_temperature']['errors'])
+
+    def test_missing_values(self):
+        data_set = _create_data_set()
+        data_set['t2m'][:5] = np.nan
+        report = self._validate({'2m_temperature': data_set, 'cloud_base_height': _create_data_set('cbh', np.nan)})
+
+        self.assertFalse(report['parameters']['2m_temperature']['valid'])
+        self.assertEqual(report['parameters']['2m_temperature']['nan_fraction'], round(30 / data_set['t2m'].size, 6))
+        # cloud base height may be missing everywhere
+        self.assertTrue(report['parameters']['cloud_base_height']['valid'])
+        self.assertIsNone(report['parameters']['cloud_base_height']['minimum'])
+
+    def test_out_of_range(self):
+        data_set = _create_data_set()
+        data_set['t2m'][0, 0, 0] = 400.0
+        report = self._validate({'2m_temperature': data_set})
+
+        self.assertEqual(report['parameters']['2m_temperature']['out_of_range'], 1)
+        self.assertEqual(report['parameters']['2m_temperature']['maximum'], 400.0)
+
+    def test_check(self):
+        report = self._validate({'2m_temperature': _create_data_set(hours=48)})
+
+        with self.assertRaises(ValidationError) as context:
+            check(report)
+        self.assertIs(context.exception.report, report)
+        self.assertIn('2017-01 is invalid: 2m_temperature: there are 48 time steps', str(context.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from api.ingest.work_queue import DONE, FAILED, LEASED, PENDING, WorkQueue
+
+
+class WorkQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix='work-queue-test-')
+        self.queue = WorkQueue(os.path.join(self.folder, 'queue.sqlite'), lease_seconds=600, max_attempts=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_add_once(self):
+        self.assertTrue(self.queue.add('2017-01', {'year': 2017, 'month': 1}))
+        self.assertFalse(self.queue.add('2017-01', {'year': 2017, 'month': 1}))
+        self.assertEqual(self.queue.get_counts()[PENDING], 1)
+
+    def test_claim_in_order(self):
+        self.queue.add('2017-01', {'month': 1})
+        self.queue.add('2017-02', {'month': 2})
+
+        first = self.queue.claim('worker-1')
+        second = self.queue.claim('worker-2')
+
+        self.assertEqual((first.key, first.payload, first.attempts), ('2017-01', {'month': 1}, 1))
+        self.assertEqual(second.key, '2017-02')
+        self.assertIsNone(self.queue.claim('worker-3'))
+        self.assertEqual(self.queue.get_counts()[LEASED], 2)
+
+    def test_complete(self):
+        self.queue.add('2017-01', {})
+        task = self.queue.claim('worker-1')
+
+        self.assertTrue(self.queue.renew(task))
+        self.assertTrue(self.queue.complete(task, ['2017/a.nc'], 1.5))
+        self.assertFalse(self.queue.complete(task, ['2017/a.nc'], 1.5))
+        self.assertFalse(self.queue.renew(task))
+        self.assertTrue(self.queue.is_finished())
+
+        manifest = self.queue.get_manifest()
+        self.assertEqual(len(manifest), 1)
+        self.assertEqual((manifest[0]['key'], manifest[0]['worker_id'], manifest[0]['outputs']),
+                         ('2017-01', 'worker-1', ['2017/a.nc']))
+
+    def test_fail_then_retry(self):
+        self.queue.add('2017-01', {})
+
+        self.queue.fail(self.queue.claim('worker-1'), 'first error')
+        self.assertEqual(self.queue.get_counts()[PENDING], 1)
+
+        task = self.queue.claim('worker-1')
+        self.assertEqual(task.attempts, 2)
+        self.queue.fail(task, 'second error')
+        self.assertEqual(self.queue.get_counts()[FAILED], 1)
+        self.assertEqual(self.queue.get_failures(), [('2017-01', 'second error')])
+        self.assertIsNone(self.queue.claim('worker-1'))
+        self.assertTrue(self.queue.is_finished())
+
+        self.assertEqual(self.queue.retry_failed(), 1)
+        self.assertEqual(self.queue.claim('worker-1').attempts, 1)
+
+    def test_group_order(self):
+        self.queue.add('2018-03/1-of-2/append', {}, group='2018/1-of-2/append')
+        self.queue.add('2018-03/2-of-2/append', {}, group='2018/2-of-2/append')
+        self.queue.add('2018-04/1-of-2/append', {}, group='2018/1-of-2/append')
+
+        first = self.queue.claim('worker-1')
+        second = self.queue.claim('worker-2')
+        self.assertEqual((first.key, second.key), ('2018-03/1-of-2/append', '2018-03/2-of-2/append'))
+        # april waits for march, of the same group
+        self.assertIsNone(self.queue.claim('worker-3'))
+
+        self.queue.fail(first, 'error')
+        self.assertEqual(self.queue.claim('worker-3').key, '2018-03/1-of-2/append')
+
+    def test_group_after_completion(self):
+        self.queue.add('2018-03/1-of-1/append', {}, group='2018/1-of-1/append')
+        self.queue.add('2018-04/1-of-1/append', {}, group='2018/1-of-1/append')
+        self.queue.complete(self.queue.claim('worker-1'), [], 1.0)
+
+        self.assertEqual(self.queue.claim('worker-2').key, '2018-04/1-of-1/append')
+
+    def test_expired_lease(self):
+        self.queue.lease_seconds = -1
+        self.queue.add('2017-01', {})
+        lost = self.queue.claim('worker-1')
+
+        task = self.queue.claim('worker-2')
+        self.assertEqual((task.key, task.attempts), ('2017-01', 2))
+        # the first worker can no longer report the task
+        self.assertFalse(self.queue.complete(lost, [], 1.0))
+
+        # its last attempt expired too
+        self.assertIsNone(self.queue.claim('worker-3'))
+        self.assertEqual(self.queue.get_failures(), [('2017-01', 'lease expired on the last attempt')])
+        self.assertEqual(self.queue.get_counts()[DONE], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
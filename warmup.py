@@ -0,0 +1,71 @@
+"""
+Warm-up of the static reference data used to answer requests: the city table, the weather stations, the monthly
+temperature grid and the degree-day grid, followed by the chat reply and dashboard figure caches.
+
+When gunicorn preloads the application, this runs once in the master process before workers are forked, so every
+worker shares the same read-only arrays (copy-on-write) instead of loading its own copy on its first requests.
+"""
+import gc
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_ready = threading.Event()
+_lock = threading.Lock()
+
+
+def is_ready():
+    """
+    :return: bool: whether the warm-up has finished
+    """
+    return _ready.is_set()
+
+
+def warm_up(chat_city_count=200, figure_city_count=100):
+    """
+    This loads all the static reference data, and pre-computes the most common answers. It only runs once.
+
+    :param chat_city_count: int: number of most populated cities whose chat replies are pre-computed
+    :param figure_city_count: int: number of most populated cities whose dashboard figures are pre-computed
+    :return: None
+    """
+    with _lock:
+        if _ready.is_set():
+            return
+
+        from climate_data import city_service, get_station_coordinates, get_monthly_temperature_grid, \
+            warm_chat_reply_cache
+        from degree_day import get_degree_day_engine
+        from graph import year
+
+        # Reference data: loaded once, kept read-only
+        for name, load in [('city table', city_service.get_city_table),
+                           ('weather stations', get_station_coordinates),
+                           ('monthly temperature grid', get_monthly_temperature_grid),
+                           ('degree-day grid', lambda: get_degree_day_engine(year))]:
+            try:
+                load()
+            except Exception:
+                logger.exception('Failed to load the %s', name)
+
+        # Most common answers
+        try:
+            warm_chat_reply_cache(city_count=chat_city_count)
+        except Exception:
+            logger.exception('Failed to warm up chat replies')
+
+        from app import warm_figure_cache
+
+        try:
+            warm_figure_cache(city_count=figure_city_count)
+        except Exception:
+            logger.exception('Failed to warm up dashboard figures')
+
+        # Objects loaded so far live as long as the process: keep the garbage collector from touching (and so
+        # copying) their pages in forked workers
+        if hasattr(gc, 'freeze'):
+            gc.collect()
+            gc.freeze()
+
+        _ready.set()